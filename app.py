@@ -1,159 +1,255 @@
 from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, Response
 from database.setup import init_db, DB_PATH
-import sqlite3
+from database.connection import pool, request_conn, release_request_conn
+from database import instrument
+from database.writer import writer
+from database.backup import BackupError, create_snapshot, list_snapshots, restore_snapshot, verify_snapshot
+from database.sweeper import sweep, maybe_sweep_in_background, recent_sweeps, start_scheduler
 import csv
+import hmac
 import io
-from datetime import datetime, timedelta
-from models.logs import get_logs
-
-# --------------------------------------------------------
-# Initialize DB on app start
-# --------------------------------------------------------
-init_db()
+import json
+import math
+import os
+import threading
+import zlib
+from datetime import datetime
+from models.logs import get_logs_page, get_log_facets, iter_logs, LOG_COLUMNS, LOG_PAGE_SIZE
+from models.search import search_medicines
+from models.bulk_import import import_stream
+from models.dispensing import dispense_order, InsufficientStock
+from models.expiry_index import expiry_index
+from models.unit_of_work import unit_of_work
+from models.views import medicine_cards
+from models.federation import federation
+from models.expiry_windows import get_window_page, parse_windows, stream_windows
+from models.change_feed import change_feed, watermark as feed_watermark
+from models.cache import cached, analytics_cache, request_generation
+from http_cache import conditional, response_cache
+from models.categories import get_category_distribution
+from models.batches import (
+    get_expiry_timeline,
+    today_day,
+    normalize_expiry,
+    COUNT_EXPIRING_SQL,
+    COUNT_EXPIRED_SQL,
+    UPCOMING_SQL,
+)
+from models.medicines import (
+    get_medicine_page,
+    get_medicine_summaries,
+    get_batches_for_medicines,
+    HEADLINE_STATS_SQL,
+    PAGE_SIZE,
+)
+
+SEARCH_LIMIT = 100
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
 
+# --------------------------------------------------------
+# Startup: runs once per process, not at import
+# --------------------------------------------------------
+_started = False
+_startup_lock = threading.Lock()
+
+def start_app():
+    """Migrate the database, start background workers and return `app`.
+
+    This is not a factory: there is one module-level app, and the pool,
+    write queue and expiry index it uses are per-process singletons.
+    WSGI servers should load "app:start_app()". Importing the module has
+    no side effects; a plain "app" import is started on its first request.
+    """
+    global _started
+    with _startup_lock:
+        if not _started:
+            init_db()
+            instrument.install(pool)
+            if writer.enabled:
+                writer.start()
+            start_scheduler()
+            expiry_index.rebuild_in_background()
+            _started = True
+    return app
+
+@app.before_request
+def ensure_started():
+    if not _started:
+        start_app()
+
 # --------------------------------------------------------
 # DB Connection Helper
 # --------------------------------------------------------
+def get_conn():
+    # one pooled connection per request, shared with the models and handed back on teardown
+    return request_conn()
+
+@app.teardown_appcontext
+def release_conn(exc):
+    release_request_conn()
 
+# --------------------------------------------------------
+# Request hooks: query timing + daily expiry sweep
+# --------------------------------------------------------
+@app.before_request
+def start_query_timing():
+    instrument.begin_request()
+
+@app.after_request
+def add_server_timing(response):
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    queries = instrument.end_request(route, request.method)
+    if queries is not None:
+        response.headers["Server-Timing"] = instrument.server_timing(queries)
+    return response
+
+@app.before_request
+def sweep_expired():
+    # the day's first request starts the sweep on a background thread and does not wait for it
+    maybe_sweep_in_background()
+
+# --------------------------------------------------------
+# Query-string arguments
+# --------------------------------------------------------
+class BadArgument(ValueError):
+    pass
+
+@app.errorhandler(BadArgument)
+def bad_argument(exc):
+    return jsonify({"error": str(exc)}), 400
+
+def int_arg(name, default, low, high):
+    """Integer query argument clamped to [low, high]; 400 if it is not an integer."""
+    raw = request.args.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise BadArgument(f"{name} must be an integer, got {raw!r}") from None
+    return min(max(value, low), high)
+
+def float_arg(name, default, low, high):
+    """Like int_arg() for a number."""
+    raw = request.args.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        raise BadArgument(f"{name} must be a number, got {raw!r}") from None
+    if math.isnan(value):
+        raise BadArgument(f"{name} must be a number, got {raw!r}")
+    return min(max(value, low), high)
+
+# --------------------------------------------------------
+# Template globals + headline stats
+# --------------------------------------------------------
 @app.context_processor
 def inject_now():
     return {"now": datetime.utcnow}
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+def fetch_headline_stats(cur):
+    cur.execute(HEADLINE_STATS_SQL)
+    row = cur.fetchone()
+    if row is None:
+        return {"medicines": 0, "batches": 0, "quantity": 0, "expired_items": 0}
+    return dict(row)
+
+@cached()
+def home_stats():
+    conn = get_conn()
+    cur = conn.cursor()
+    totals = fetch_headline_stats(cur)
+    today = today_day()
+    cur.execute(COUNT_EXPIRING_SQL, (today, today + 30))
+    upcoming_expiries = cur.fetchone()[0]
+    cur.execute(COUNT_EXPIRED_SQL, (today,))
+    expired_batches = cur.fetchone()[0]
+    return {
+        "total_medicines": totals["medicines"],
+        "total_batches": totals["batches"],
+        "upcoming_expiries": upcoming_expiries,
+        "expired_batches": expired_batches,
+    }
+
+# --------------------------------------------------------
+# PROMETHEUS METRICS
+# --------------------------------------------------------
+@app.route("/metrics")
+def metrics():
+    gauges = [
+        (f"medivault_pool_{key}", f"Connection pool {key.replace('_', ' ')}.", value)
+        for key, value in pool.stats().items()
+    ]
+    gauges += [
+        (f"medivault_writer_{key}", f"Write queue {key.replace('_', ' ')}.", value)
+        for key, value in writer.stats().items() if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+    gauges.append(("medivault_change_feed_subscribers", "Open live change feed streams.",
+                   change_feed.stats()["subscribers"]))
+    index = expiry_index.stats()
+    gauges += [
+        ("medivault_expiry_index_entries", "Batches held in the in-memory expiry index.", index["entries"]),
+        ("medivault_expiry_index_bytes", "Approximate memory used by the expiry index.", index["memory_bytes"]["total"]),
+        ("medivault_expiry_index_fallbacks", "Expiry index reads that fell back to SQLite.", index["fallbacks"]),
+    ]
+    for prefix, stats in (("analytics_cache", analytics_cache.stats()), ("response_cache", response_cache.stats())):
+        gauges += [
+            (f"medivault_{prefix}_{key}", f"{prefix.replace('_', ' ').capitalize()} {key.replace('_', ' ')}.", value)
+            for key, value in stats.items() if isinstance(value, (int, float)) and not isinstance(value, bool)
+        ]
+    return Response(instrument.render_metrics(gauges), mimetype="text/plain; version=0.0.4")
+
+# --------------------------------------------------------
+# JSON API - CONNECTION POOL STATS
+# --------------------------------------------------------
+@app.route("/api/pool")
+def api_pool():
+    return jsonify(pool.stats())
+
+@app.route("/api/writer")
+def api_writer():
+    return jsonify(writer.stats())
 
 # --------------------------------------------------------
 # HOME PAGE – LIST MEDICINES + BATCHES
 # --------------------------------------------------------
 @app.route("/")
+@conditional()
 def home():
     search_query = request.args.get("q", "").strip()
+    # the live feed replays anything logged after this, so read it before the page data
+    feed_after = feed_watermark()
 
-    conn = get_conn()
-    cur = conn.cursor()
-
-    # headline stats
-    cur.execute("SELECT COUNT(*) FROM medicines")
-    total_medicines = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM batches")
-    total_batches = cur.fetchone()[0]
-    cur.execute(
-        """
-        SELECT COUNT(*) FROM batches
-        WHERE expiry_date IS NOT NULL
-          AND DATE(expiry_date) BETWEEN DATE('now') AND DATE('now', '+30 day')
-        """
-    )
-    upcoming_expiries = cur.fetchone()[0]
-    cur.execute(
-        """
-        SELECT COUNT(*) FROM batches
-        WHERE expiry_date IS NOT NULL AND DATE(expiry_date) < DATE('now')
-        """
-    )
-    expired_batches = cur.fetchone()[0]
+    # headline stats (cached until the next write)
+    stats = home_stats()
 
-    # overview query with optional search
-    base_query = "SELECT * FROM medicine_overview"
-    params = []
+    # one page of medicine summaries (aggregated in SQL) + their batches
+    cursor = request.args.get("after") or None
+    next_cursor = None
     if search_query:
-        base_query += " WHERE medicine_name LIKE ? OR IFNULL(batch_no, '') LIKE ?"
-        like = f"%{search_query}%"
-        params = [like, like]
-    base_query += " ORDER BY medicine_name COLLATE NOCASE"
-    cur.execute(base_query, params)
-    rows = cur.fetchall()
-
-    today = datetime.utcnow().date()
-    soon_threshold = today + timedelta(days=30)
-
-    medicines = {}
-    for r in rows:
-        mid = r["medicine_id"]
-
-        if mid not in medicines:
-            medicines[mid] = {
-                "id": mid,
-                "name": r["medicine_name"],
-                "category": r["category"],
-                "batches": [],
-                "total_qty": 0,
-                "next_expiry": None,
-            }
-
-        if r["batch_id"]:
-            qty = int(r["quantity"] or 0)
-            expiry_text = r["expiry_date"]
-            expiry_obj = None
-            expiry_display = expiry_text or "No expiry"
-            status = "no-date"
-            status_label = "No expiry"
-
-            if expiry_text:
-                try:
-                    expiry_obj = datetime.strptime(expiry_text, "%Y-%m-%d").date()
-                    expiry_display = expiry_obj.strftime("%d %b %Y")
-                except ValueError:
-                    expiry_obj = None
-                    expiry_display = expiry_text
-
-            if expiry_obj:
-                if expiry_obj < today:
-                    status = "expired"
-                    status_label = "Expired"
-                elif expiry_obj <= soon_threshold:
-                    status = "soon"
-                    status_label = "Expiring soon"
-                else:
-                    status = "healthy"
-                    status_label = "Fresh"
-
-                current_next = medicines[mid]["next_expiry"]
-                if not current_next or expiry_obj < current_next:
-                    medicines[mid]["next_expiry"] = expiry_obj
-
-            medicines[mid]["batches"].append(
-                {
-                    "batch_id": r["batch_id"],
-                    "batch_no": r["batch_no"],
-                    "qty": qty,
-                    "expiry": expiry_text,
-                    "expiry_display": expiry_display,
-                    "status": status,
-                    "status_label": status_label,
-                }
-            )
-            medicines[mid]["total_qty"] += qty
-
-    # format next expiry for template consumption
-    med_cards = []
-    for med in medicines.values():
-        next_expiry = med["next_expiry"]
-        med["next_expiry_display"] = (
-            next_expiry.strftime("%d %b %Y") if next_expiry else "—"
-        )
-        med_cards.append(med)
-
-    conn.close()
-
-    stats = {
-        "total_medicines": total_medicines,
-        "total_batches": total_batches,
-        "upcoming_expiries": upcoming_expiries,
-        "expired_batches": expired_batches,
-    }
+        ranked_ids = [r["id"] for r in search_medicines(search_query, limit=SEARCH_LIMIT)]
+        by_id = get_medicine_summaries(ranked_ids)
+        summaries = [by_id[mid] for mid in ranked_ids if mid in by_id]
+    else:
+        try:
+            summaries, next_cursor = get_medicine_page(cursor)
+        except ValueError:
+            summaries, next_cursor = get_medicine_page()
+    batches = get_batches_for_medicines([m["id"] for m in summaries])
+
+    med_cards = medicine_cards(summaries, batches, datetime.utcnow().date())
 
     return render_template(
         "index.html",
         medicines=med_cards,
         stats=stats,
         search_query=search_query,
+        next_cursor=next_cursor,
+        feed_after=feed_after,
     )
 
 # --------------------------------------------------------
@@ -161,42 +257,38 @@ def home():
 # --------------------------------------------------------
 @app.route("/add", methods=["GET", "POST"])
 def add_medicine():
-    conn = get_conn()
-    cur = conn.cursor()
-
     if request.method == "POST":
         name = request.form["name"].strip()
         category = request.form.get("category") or None
         description = request.form.get("description") or ""
 
-        # Insert medicine
-        cur.execute(
-            "INSERT INTO medicines (name, category_id, description) VALUES (?, ?, ?)",
-            (name, category, description)
-        )
-        mid = cur.lastrowid
+        try:
+            expiry = normalize_expiry(request.form.get("expiry"))
+        except ValueError as exc:
+            flash(str(exc), "danger")
+            return redirect(url_for("add_medicine"))
 
         # Optional initial batch
         batch_no = request.form.get("batch_no")
         qty = request.form.get("quantity") or 0
-        expiry = request.form.get("expiry") or None
 
+        batches = []
         if batch_no or qty or expiry:
-            cur.execute("""
-                INSERT INTO batches (medicine_id, batch_no, quantity, expiry_date)
-                VALUES (?, ?, ?, ?)
-            """, (mid, batch_no, qty, expiry))
+            batches.append({"batch_no": batch_no, "quantity": qty, "expiry_date": expiry})
+
+        def write(conn):
+            with unit_of_work(conn) as uow:
+                return uow.create_medicine(name, category, description, batches)
 
-        conn.commit()
-        conn.close()
+        writer.run(write)
 
         flash("Medicine added successfully!", "success")
         return redirect(url_for("home"))
 
     # GET request → load categories
+    cur = get_conn().cursor()
     cur.execute("SELECT id, name FROM categories ORDER BY name")
     categories = cur.fetchall()
-    conn.close()
 
     return render_template("add_medicine.html", categories=categories)
 
@@ -207,18 +299,16 @@ def add_medicine():
 def add_batch(medicine_id):
     batch_no = request.form.get("batch_no")
     quantity = request.form.get("quantity") or 0
-    expiry = request.form.get("expiry") or None
-
-    conn = get_conn()
-    cur = conn.cursor()
+    try:
+        expiry = normalize_expiry(request.form.get("expiry"))
+    except ValueError as exc:
+        flash(str(exc), "danger")
+        return redirect(url_for("home"))
 
-    cur.execute("""
+    writer.run(lambda conn: conn.execute("""
         INSERT INTO batches (medicine_id, batch_no, quantity, expiry_date)
         VALUES (?, ?, ?, ?)
-    """, (medicine_id, batch_no, quantity, expiry))
-
-    conn.commit()
-    conn.close()
+    """, (medicine_id, batch_no, quantity, expiry)).lastrowid)
 
     flash("Batch added.", "success")
     return redirect(url_for("home"))
@@ -228,12 +318,7 @@ def add_batch(medicine_id):
 # --------------------------------------------------------
 @app.route("/delete_batch/<int:batch_id>")
 def delete_batch(batch_id):
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("DELETE FROM batches WHERE id=?", (batch_id,))
-    conn.commit()
-    conn.close()
+    writer.run(lambda conn: conn.execute("DELETE FROM batches WHERE id=?", (batch_id,)).rowcount)
 
     flash("Batch deleted.", "warning")
     return redirect(url_for("home"))
@@ -243,23 +328,23 @@ def delete_batch(batch_id):
 # --------------------------------------------------------
 @app.route("/edit_batch/<int:batch_id>", methods=["GET", "POST"])
 def edit_batch(batch_id):
-    conn = get_conn()
-    cur = conn.cursor()
-
     if request.method == "POST":
         batch_no = request.form.get("batch_no") or None
         quantity = int(request.form.get("quantity") or 0)
-        expiry = request.form.get("expiry") or None
+        try:
+            expiry = normalize_expiry(request.form.get("expiry"))
+        except ValueError as exc:
+            flash(str(exc), "danger")
+            return redirect(url_for("edit_batch", batch_id=batch_id))
 
-        cur.execute(
+        writer.run(lambda conn: conn.execute(
             "UPDATE batches SET batch_no=?, quantity=?, expiry_date=? WHERE id=?",
             (batch_no, quantity, expiry, batch_id),
-        )
-        conn.commit()
-        conn.close()
+        ).rowcount)
         flash("Batch updated", "success")
         return redirect(url_for("home"))
 
+    cur = get_conn().cursor()
     cur.execute(
         """
         SELECT b.id, b.batch_no, b.quantity, b.expiry_date, m.name AS medicine_name
@@ -269,7 +354,6 @@ def edit_batch(batch_id):
         (batch_id,),
     )
     batch = cur.fetchone()
-    conn.close()
 
     if not batch:
         flash("Batch not found", "danger")
@@ -277,64 +361,85 @@ def edit_batch(batch_id):
 
     return render_template("edit_batch.html", batch=batch)
 
+# --------------------------------------------------------
+# BULK IMPORT (CSV / JSONL)
+# --------------------------------------------------------
+@app.route("/import", methods=["POST"])
+def bulk_import():
+    upload = request.files.get("file")
+    filename = upload.filename if upload else ""
+    fmt = request.args.get("format") or (
+        "jsonl" if filename.endswith((".jsonl", ".ndjson")) or request.mimetype == "application/x-ndjson" else "csv"
+    )
+    if fmt not in ("csv", "jsonl"):
+        return jsonify({"error": "format must be csv or jsonl"}), 400
+
+    raw = upload.stream if upload else request.stream
+    stream = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    report = import_stream(stream, fmt)
+    return jsonify(report), 200 if not report["error_count"] else 207
+
+# --------------------------------------------------------
+# DISPENSING (FEFO)
+# --------------------------------------------------------
+@app.route("/api/dispense", methods=["POST"])
+def api_dispense():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "body must be a JSON object"}), 400
+    lines = payload["lines"] if "lines" in payload else [payload]
+    if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+        return jsonify({"error": "lines must be a list of {medicine_id, quantity} objects"}), 400
+    try:
+        allocations = dispense_order(lines)
+    except InsufficientStock as exc:
+        return jsonify({
+            "error": str(exc),
+            "medicine_id": exc.medicine_id,
+            "requested": exc.requested,
+            "available": exc.available,
+        }), 409
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"allocations": allocations})
+
 # --------------------------------------------------------
 # DASHBOARD ANALYTICS
 # --------------------------------------------------------
 @app.route("/dashboard")
+@conditional()
 def dashboard():
+    feed_after = feed_watermark()
+    return render_template("dashboard.html", feed_after=feed_after, **dashboard_analytics())
+
+@cached()
+def dashboard_analytics():
     conn = get_conn()
     cur = conn.cursor()
 
     # Totals
-    cur.execute("SELECT COUNT(*) FROM medicines")
-    total_medicines = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM batches")
-    total_batches = cur.fetchone()[0]
+    totals = fetch_headline_stats(cur)
 
     # Expiring soon (30 days)
-    cur.execute("""
-        SELECT COUNT(*) FROM batches
-        WHERE DATE(expiry_date) BETWEEN DATE('now') AND DATE('now', '+30 day')
-    """)
+    today = today_day()
+    cur.execute(COUNT_EXPIRING_SQL, (today, today + 30))
     soon_expire = cur.fetchone()[0]
 
-    # Expired count
-    cur.execute("SELECT COUNT(*) FROM expired_items")
-    expired_count = cur.fetchone()[0]
-
     # Category distribution
-    cur.execute("""
-        SELECT c.name AS label, COUNT(b.id) AS count
-        FROM categories c
-        LEFT JOIN medicines m ON m.category_id = c.id
-        LEFT JOIN batches b ON b.medicine_id = m.id
-        GROUP BY label
-    """)
-    category_rows = cur.fetchall()
+    category_rows = get_category_distribution()
     category_labels = [row["label"] or "Uncategorized" for row in category_rows]
     category_counts = [row["count"] for row in category_rows]
 
     # Expiry timeline (per month)
-    cur.execute("""
-        SELECT STRFTIME('%Y-%m', expiry_date) AS month, COALESCE(SUM(quantity), 0) AS total
-        FROM batches
-        WHERE expiry_date IS NOT NULL
-        GROUP BY month
-        ORDER BY month
-    """)
-    timeline_rows = cur.fetchall()
+    timeline_rows = get_expiry_timeline()
     time_labels = [row["month"] for row in timeline_rows]
     time_totals = [row["total"] for row in timeline_rows]
 
-    conn.close()
-
-    return render_template(
-        "dashboard.html",
-        total_medicines=total_medicines,
-        total_batches=total_batches,
+    return dict(
+        total_medicines=totals["medicines"],
+        total_batches=totals["batches"],
         soon_expire=soon_expire,
-        expired_count=expired_count,
+        expired_count=totals["expired_items"],
         category_labels=category_labels,
         category_counts=category_counts,
         time_labels=time_labels,
@@ -345,68 +450,317 @@ def dashboard():
 # ACTIVITY LOGS PAGE
 # --------------------------------------------------------
 @app.route("/logs")
+@conditional()
 def logs():
-    log_rows = get_logs(limit=200)
-    return render_template("logs.html", logs=log_rows)
+    filters = {
+        "table": request.args.get("table") or None,
+        "action": request.args.get("action") or None,
+    }
+    log_rows, next_cursor = get_logs_page(**filters)
+    tables, actions = get_log_facets()
+    return render_template(
+        "logs.html",
+        logs=log_rows,
+        next_cursor=next_cursor,
+        filters=filters,
+        tables=tables,
+        actions=actions,
+    )
+
+@app.route("/api/logs")
+def api_logs():
+    limit = int_arg("limit", LOG_PAGE_SIZE, 1, 500)
+    try:
+        rows, next_cursor = get_logs_page(
+            cursor=request.args.get("after") or None,
+            limit=limit,
+            table=request.args.get("table") or None,
+            action=request.args.get("action") or None,
+            since=request.args.get("since") or None,
+            until=request.args.get("until") or None,
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"items": [dict(r) for r in rows], "next_cursor": next_cursor})
 
 @app.route("/logs/download")
 def download_logs():
-    # Fetch all logs for download
-    rows = get_logs(limit=None)
+    # Stream the (optionally filtered) log as CSV or NDJSON, gzip on request
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+
+    try:
+        rows = iter_logs(
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            table=request.args.get("table"),
+            action=request.args.get("action"),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    if fmt == "csv":
+        chunks, mimetype = csv_chunks(rows), "text/csv"
+    else:
+        chunks, mimetype = ndjson_chunks(rows), "application/x-ndjson"
+    filename = f"activity_logs.{fmt}"
+    if compress:
+        chunks, mimetype = gzip_chunks(chunks), "application/gzip"
+        filename += ".gz"
 
-    # Generate CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(["ID", "Timestamp", "Action", "Table Name", "Record ID", "Details"])
-    
-    # Write data
-    for row in rows:
-        writer.writerow([
-            row["id"], 
-            row["timestamp"], 
-            row["action"], 
-            row["table_name"], 
-            row["record_id"], 
-            row["details"]
-        ])
-    
-    output.seek(0)
-    
     return Response(
-        output,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment;filename=activity_logs.csv"}
+        chunks,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
     )
 
+def csv_chunks(rows, rows_per_chunk=1000):
+    output = io.StringIO()
+    csv_out = csv.writer(output)  # not `writer`: that name is the WriteQueue
+    csv_out.writerow(["ID", "Timestamp", "Action", "Table Name", "Record ID", "Details"])
+    for n, row in enumerate(rows, 1):
+        csv_out.writerow([row[col] for col in LOG_COLUMNS])
+        if n % rows_per_chunk == 0:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+
+def ndjson_chunks(rows, rows_per_chunk=1000):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(LOG_COLUMNS, row)), separators=(",", ":")))
+        if len(lines) == rows_per_chunk:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
 # --------------------------------------------------------
 # JSON API - UPCOMING EXPIRY
 # --------------------------------------------------------
 @app.route("/api/upcoming")
+@conditional("public, max-age=30")
 def api_upcoming():
-    days = int(request.args.get("days", 30))
+    days = int_arg("days", 30, 0, 3650)
+    today = today_day()
+
+    # ?limit= / ?after= switch to keyset pages: {"items": [...], "next_cursor": ...}
+    if "limit" in request.args or "after" in request.args:
+        limit = int_arg("limit", 100, 1, 1000)
+        try:
+            items, next_cursor = get_window_page(days, limit, request.args.get("after") or None)
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        return jsonify({"items": items, "next_cursor": next_cursor})
+
+    # served from the in-memory expiry index unless it is stale or still building
+    data = expiry_index.upcoming(today, today + days, request_generation())
+    if data is None:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute(UPCOMING_SQL, (today, today + days))
+        data = [dict(r) for r in cur.fetchall()]
 
-    conn = get_conn()
-    cur = conn.cursor()
+    return jsonify(data)
 
-    cur.execute("""
-        SELECT b.id, m.name AS medicine_name, b.batch_no, b.quantity, b.expiry_date
-        FROM batches b
-        JOIN medicines m ON m.id = b.medicine_id
-        WHERE DATE(b.expiry_date) BETWEEN DATE('now')
-        AND DATE('now', ?)
-    """, (f"+{days} day",))
+@app.route("/api/expiry/windows", methods=["POST"])
+def api_expiry_windows():
+    # several filtered windows in one request, streamed as NDJSON from one connection
+    try:
+        windows = parse_windows(request.get_json(silent=True))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    chunks, mimetype = stream_windows(windows), "application/x-ndjson"
+    if request.args.get("gzip", "").lower() in ("1", "true", "yes"):
+        chunks, mimetype = gzip_chunks(chunks), "application/gzip"
+    return Response(chunks, mimetype=mimetype)
+
+@app.route("/api/expiry/index")
+def api_expiry_index():
+    return jsonify(expiry_index.stats())
+
+# --------------------------------------------------------
+# JSON API - PAGINATED INVENTORY
+# --------------------------------------------------------
+@app.route("/api/medicines")
+def api_medicines():
+    limit = int_arg("limit", PAGE_SIZE, 1, 200)
+    try:
+        summaries, next_cursor = get_medicine_page(request.args.get("after") or None, limit=limit)
+    except ValueError:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    batches = get_batches_for_medicines([m["id"] for m in summaries])
+    items = []
+    for m in summaries:
+        item = dict(m)
+        item["batches"] = [dict(b) for b in batches[m["id"]]]
+        items.append(item)
+
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+# --------------------------------------------------------
+# JSON API - ANALYTICS + RESPONSE CACHE STATS
+# --------------------------------------------------------
+@app.route("/api/cache")
+def api_cache():
+    stats = analytics_cache.stats()
+    stats["responses"] = response_cache.stats()
+    return jsonify(stats)
+
+# --------------------------------------------------------
+# JSON API - EXPIRY SWEEPER
+# --------------------------------------------------------
+@app.route("/api/expiry/sweep", methods=["POST"])
+def api_expiry_sweep():
+    return jsonify(sweep())
 
-    data = [dict(r) for r in cur.fetchall()]
-    conn.close()
+@app.route("/api/expiry/sweeps")
+def api_expiry_sweeps():
+    return jsonify(recent_sweeps(int_arg("limit", 20, 1, 200)))
 
+# --------------------------------------------------------
+# ADMIN API - ONLINE BACKUPS
+# --------------------------------------------------------
+ADMIN_TOKEN = os.environ.get("MEDIVAULT_ADMIN_TOKEN")
+
+def admin_denied():
+    # fails closed: without MEDIVAULT_ADMIN_TOKEN the backup routes are disabled
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "backup API disabled; set MEDIVAULT_ADMIN_TOKEN to enable it"}), 403
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"error": "admin token required"}), 403
+    return None
+
+@app.route("/api/backups")
+def api_backups():
+    denied = admin_denied()
+    if denied:
+        return denied
+    return jsonify(list_snapshots())
+
+@app.route("/api/backups", methods=["POST"])
+def api_backup_create():
+    denied = admin_denied()
+    if denied:
+        return denied
+    return jsonify(create_snapshot()), 201
+
+@app.route("/api/backups/<name>/verify", methods=["POST"])
+def api_backup_verify(name):
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        return jsonify(verify_snapshot(name))
+    except BackupError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+@app.route("/api/backups/<name>/restore", methods=["POST"])
+def api_backup_restore(name):
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        report = restore_snapshot(name)
+    except BackupError as exc:
+        return jsonify({"error": str(exc)}), 400
+    # everything derived from the old contents is now wrong
+    analytics_cache.clear()
+    response_cache.clear()
+    expiry_index.rebuild_in_background()
+    change_feed.reset()
+    return jsonify(report)
+
+# --------------------------------------------------------
+# JSON API - MEDICINE / BATCH SEARCH
+# --------------------------------------------------------
+@app.route("/api/search")
+def api_search():
+    query = request.args.get("q", "").strip()
+    limit = int_arg("limit", 20, 1, 100)
+    if not query:
+        return jsonify([])
+
+    data = [dict(r) for r in search_medicines(query, limit=limit)]
     return jsonify(data)
 
+# --------------------------------------------------------
+# LIVE CHANGE FEED (SERVER-SENT EVENTS)
+# --------------------------------------------------------
+@app.route("/api/changes")
+def api_changes():
+    after = request.headers.get("Last-Event-ID") or request.args.get("after")
+    try:
+        after = int(after) if after else None
+    except ValueError:
+        after = None
+    return Response(
+        change_feed.stream(after),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/api/changes/stats")
+def api_changes_stats():
+    return jsonify(change_feed.stats())
+
+# --------------------------------------------------------
+# JSON API - FEDERATED QUERIES ACROSS SITE DATABASES
+# --------------------------------------------------------
+def federation_options():
+    options = {}
+    if request.args.get("sites"):
+        options["sites"] = {s.strip() for s in request.args["sites"].split(",") if s.strip()}
+    if request.args.get("timeout"):
+        # a client may shorten the deadline, never extend it past the server's
+        options["timeout"] = float_arg("timeout", federation.timeout, 0.1, federation.timeout)
+    return options
+
+@app.route("/api/federation/sites")
+def api_federation_sites():
+    return jsonify(federation.stats())
+
+@app.route("/api/federation/upcoming")
+def api_federation_upcoming():
+    days = int_arg("days", 30, 0, 3650)
+    return jsonify(federation.soon_to_expire(days, **federation_options()))
+
+@app.route("/api/federation/expired")
+def api_federation_expired():
+    return jsonify(federation.get_expired(**federation_options()))
+
+@app.route("/api/federation/timeline")
+def api_federation_timeline():
+    return jsonify(federation.get_expiry_timeline(**federation_options()))
+
+@app.route("/api/federation/dashboard")
+def api_federation_dashboard():
+    return jsonify(federation.dashboard(**federation_options()))
+
+@app.route("/api/federation/search")
+def api_federation_search():
+    query = request.args.get("q", "").strip()
+    limit = int_arg("limit", 20, 1, 100)
+    if not query:
+        return jsonify({"partial": False, "sites": [], "results": []})
+    return jsonify(federation.search(query, limit=limit, **federation_options()))
+
 # --------------------------------------------------------
 # START FLASK SERVER
 # --------------------------------------------------------
 if __name__ == "__main__":
     print("🔥 Medi-Vault Pro is starting...")
     print(f"📁 Using Database: {DB_PATH}")
-    app.run(debug=True)
+    start_app().run(debug=True)
@@ -0,0 +1,165 @@
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from database.setup import init_db
+
+# Deterministic synthetic inventory: the same (seed, scale, today) always
+# produces the same rows, so benchmark runs on different commits compare
+# like with like.
+CATEGORIES = [
+    "Tablet", "Syrup", "Injection", "Ointment", "Capsule", "Drops", "Inhaler",
+    "Cream", "Gel", "Powder", "Suspension", "Lozenge", "Patch", "Spray",
+    "Suppository", "Solution", "Vaccine", "Emulsion", "Granules", "Lotion",
+]
+STEMS = [
+    "Para", "Amoxi", "Ibu", "Cetiri", "Metfor", "Atorva", "Omepra", "Azithro",
+    "Losar", "Amlodi", "Simva", "Cipro", "Doxy", "Predni", "Salbu", "Levo",
+    "Gaba", "Sertra", "Clopi", "Panto", "Ranit", "Furo", "Hydro", "Keto",
+]
+SUFFIXES = ["cetamol", "cillin", "profen", "zine", "min", "statin", "zole", "mycin",
+            "tan", "pine", "floxacin", "cycline", "lone", "mol", "thyroxine", "pentin"]
+STRENGTHS = ["50mg", "100mg", "250mg", "500mg", "5ml", "10ml", "1g", "2%"]
+
+# share of batches per expiry bucket: (weight, min days from today, max days)
+EXPIRY_MIX = [
+    (0.06, -365, -1),    # already expired
+    (0.09, 0, 30),       # expiring soon
+    (0.60, 31, 730),     # normal shelf life
+    (0.23, 731, 1825),   # long-dated stock
+    (0.02, None, None),  # undated
+]
+LOG_ACTIONS = [("UPDATE", 0.7), ("INSERT", 0.2), ("DELETE", 0.1)]
+LOG_TABLES = [("batches", 0.75), ("medicines", 0.2), ("categories", 0.05)]
+
+def _pick(rng, weighted):
+    x, total = rng.random(), 0.0
+    for value, weight in weighted:
+        total += weight
+        if x < total:
+            return value
+    return weighted[-1][0]
+
+def _expiry(rng, today):
+    bucket = _pick(rng, [((lo, hi), w) for w, lo, hi in EXPIRY_MIX])
+    if bucket[0] is None:
+        return None
+    return (today + timedelta(days=rng.randint(*bucket))).isoformat()
+
+def generate(path, batches=10_000, medicines=None, categories=len(CATEGORIES),
+             log_events=None, log_days=365, seed=42, today=None, chunk=20_000):
+    """Create a fresh database at `path` filled with synthetic inventory.
+
+    Rows go in through the normal triggers, so search, summary and rollup
+    tables are maintained exactly as in production. Returns row counts.
+    """
+    path = Path(path)
+    for suffix in ("", "-wal", "-shm"):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+    rng = random.Random(seed)
+    today = today or date.today()
+    medicines = medicines or max(1, batches // 8)
+    log_events = batches // 2 if log_events is None else log_events
+    started = time.perf_counter()
+    start_ts = datetime.combine(today, datetime.min.time())
+    span = log_days * 86400
+
+    def created(i):
+        return (start_ts - timedelta(seconds=(i * 2654435761) % span)).strftime("%Y-%m-%d %H:%M:%S")
+
+    init_db(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA foreign_keys = ON")
+
+    names = CATEGORIES[:categories] + [f"Category {i}" for i in range(len(CATEGORIES), categories)]
+    conn.executemany("INSERT OR IGNORE INTO categories(name) VALUES (?)", [(n,) for n in names])
+    category_ids = [r[0] for r in conn.execute("SELECT id FROM categories ORDER BY id")]
+
+    conn.executemany(
+        "INSERT INTO medicines(name, category_id, description, created_at) VALUES (?, ?, ?, ?)",
+        (
+            (
+                f"{rng.choice(STEMS)}{rng.choice(SUFFIXES)} {rng.choice(STRENGTHS)} #{i}",
+                rng.choice(category_ids) if rng.random() > 0.03 else None,
+                f"Synthetic medicine {i}",
+                created(i),
+            )
+            for i in range(medicines)
+        ),
+    )
+    medicine_ids = [r[0] for r in conn.execute("SELECT id FROM medicines ORDER BY id")]
+    conn.commit()
+
+    def batch_rows(start, stop):
+        for i in range(start, stop):
+            yield (
+                rng.choice(medicine_ids),
+                f"B{i:07d}",
+                int(rng.lognormvariate(4, 1)),
+                _expiry(rng, today),
+                created(i),
+            )
+
+    for start in range(0, batches, chunk):
+        conn.executemany(
+            "INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date, created_at) VALUES (?, ?, ?, ?, ?)",
+            batch_rows(start, min(start + chunk, batches)),
+        )
+        conn.commit()
+
+    # Spread the trigger-written log rows over the history window, then add
+    # older edit history so the log is much longer than the inventory.
+    now = start_ts.strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute(
+        "UPDATE activity_log SET timestamp = datetime(?, '-' || ((id * 2654435761) % ?) || ' seconds')",
+        (now, span),
+    )
+    (max_batch,) = conn.execute("SELECT MAX(id) FROM batches").fetchone()
+    for start in range(0, log_events, chunk):
+        rows = []
+        for _ in range(start, min(start + chunk, log_events)):
+            table = _pick(rng, LOG_TABLES)
+            record = rng.randint(1, {"batches": max_batch or 1, "medicines": medicine_ids[-1],
+                                     "categories": category_ids[-1]}[table])
+            ts = start_ts - timedelta(seconds=rng.randrange(span))
+            rows.append((_pick(rng, LOG_ACTIONS), table, record,
+                         f"qty:{rng.randint(0, 500)}", ts.strftime("%Y-%m-%d %H:%M:%S")))
+        conn.executemany(
+            "INSERT INTO activity_log(action, table_name, record_id, details, timestamp) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+
+    conn.execute("ANALYZE")
+    conn.commit()
+    counts = {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ("categories", "medicines", "batches", "expired_items", "activity_log")
+    }
+    conn.close()
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Fill a database with synthetic inventory")
+    parser.add_argument("path", help="database file to (re)create")
+    parser.add_argument("--batches", type=int, default=10_000)
+    parser.add_argument("--medicines", type=int, default=None, help="default: batches / 8")
+    parser.add_argument("--categories", type=int, default=len(CATEGORIES))
+    parser.add_argument("--log-events", type=int, default=None,
+                        help="extra historical activity_log rows (default: batches / 2)")
+    parser.add_argument("--log-days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", type=date.fromisoformat, default=None,
+                        help="reference date for expiry spread (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    print(json.dumps(generate(args.path, args.batches, args.medicines, args.categories,
+                              args.log_events, args.log_days, args.seed, args.today), indent=2))
@@ -0,0 +1,297 @@
+import gc
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+# Runs every route (through Flask's test client) and every models/*
+# function against a copy of a generated database and records latency
+# percentiles, SQL statements per call and peak Python memory as JSON.
+# The app is imported only after MEDIVAULT_DB points at the copy.
+ROOT = Path(__file__).resolve().parent.parent
+
+# Statements are counted per connection, for the measuring thread and
+# for the db-writer thread that runs its writes (the caller waits for
+# the commit, so they are all in when the call returns). Other
+# background threads (sweeper, expiry index, change feed) are ignored.
+_counter = {"thread": None, "queries": 0, "call": 0}
+_counter_lock = threading.Lock()
+
+def _count_queries(conn):
+    last = None
+
+    def trace(statement):
+        # the trace callback repeats a statement's (expanded) SQL once per
+        # trigger program it fires, so only count changes of statement text;
+        # FTS5's internal shadow-table statements arrive as "-- ..." comments
+        nonlocal last
+        if statement.startswith("--"):
+            return
+        thread = threading.current_thread()
+        key = (_counter["call"], statement)  # a new call never continues the previous statement
+        if key != last and (thread is _counter["thread"] or thread.name == "db-writer"):
+            with _counter_lock:
+                _counter["queries"] += 1
+        last = key
+
+    conn.set_trace_callback(trace)
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def measure(fn, iterations, clear_caches):
+    """Time fn() `iterations` times; one extra traced call for peak memory."""
+    timings, queries, result = [], [], None
+    for _ in range(iterations):
+        clear_caches()
+        with _counter_lock:
+            _counter["thread"], _counter["queries"] = threading.current_thread(), 0
+            _counter["call"] += 1
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(_counter["queries"])
+
+    clear_caches()
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries": round(statistics.fmean(queries), 2),
+        "peak_kb": round(peak / 1024, 1),
+        "status": result,
+    }
+
+def route_cases(sample):
+    """(name, method, url, kwargs) for every route; writes go last."""
+    mid, bid, cursor, log_cursor = sample["medicine_id"], sample["batch_id"], sample["cursor"], sample["log_cursor"]
+    return [
+        ("GET /", "get", "/", {}),
+        ("GET /?after", "get", f"/?after={cursor}", {}),
+        ("GET /?q", "get", "/?q=cillin", {}),
+        ("GET /?q short", "get", "/?q=pa", {}),
+        ("GET /dashboard", "get", "/dashboard", {}),
+        ("GET /logs", "get", "/logs", {}),
+        ("GET /logs?table", "get", "/logs?table=batches&action=UPDATE", {}),
+        ("GET /api/logs", "get", f"/api/logs?after={log_cursor}", {}),
+        ("GET /logs/download csv", "get", "/logs/download", {}),
+        ("GET /logs/download ndjson.gz", "get", "/logs/download?format=ndjson&gzip=1", {}),
+        ("GET /api/upcoming", "get", "/api/upcoming?days=30", {}),
+        ("GET /api/upcoming 365", "get", "/api/upcoming?days=365", {}),
+        ("GET /api/medicines", "get", "/api/medicines?limit=100", {}),
+        ("GET /api/search", "get", "/api/search?q=statin", {}),
+        ("GET /api/cache", "get", "/api/cache", {}),
+        ("GET /api/pool", "get", "/api/pool", {}),
+        ("GET /api/expiry/sweeps", "get", "/api/expiry/sweeps", {}),
+        ("GET /add", "get", "/add", {}),
+        ("GET /edit_batch", "get", f"/edit_batch/{bid}", {}),
+        ("POST /api/expiry/sweep", "post", "/api/expiry/sweep", {}),
+        ("POST /api/dispense", "post", "/api/dispense", {"json": {"medicine_id": mid, "quantity": 1}}),
+        ("POST /add", "post", "/add", {"data": {"name": "Bench medicine", "category": "1",
+                                               "description": "bench", "batch_no": "BENCH",
+                                               "quantity": "10", "expiry": "2031-01-01"}}),
+        ("POST /add_batch", "post", f"/add_batch/{mid}", {"data": {"batch_no": "BENCH", "quantity": "5",
+                                                                  "expiry": "2031-06-01"}}),
+        ("POST /edit_batch", "post", f"/edit_batch/{bid}", {"data": {"batch_no": "BENCH", "quantity": "7",
+                                                                    "expiry": "2032-01-01"}}),
+        ("POST /import", "post", "/import?format=csv", {
+            "data": "medicine,category,batch_no,quantity,expiry\n"
+                    + "".join(f"Bench import {i},Tablet,BI{i},{i},2030-01-01\n" for i in range(100)),
+            "content_type": "text/csv",
+        }),
+    ]
+
+def model_cases(sample):
+    from models import batches, categories, dispensing, logs, medicines, search
+    from models.cache import current_generation
+
+    mid, ids = sample["medicine_id"], sample["medicine_ids"]
+
+    def drain(it):
+        return sum(1 for _ in it)
+
+    return [
+        ("categories.get_all_categories", categories.get_all_categories),
+        ("categories.get_category_distribution", categories.get_category_distribution.uncached),
+        ("medicines.get_all_medicines", medicines.get_all_medicines),
+        ("medicines.get_medicine", lambda: medicines.get_medicine(mid)),
+        ("medicines.get_medicine_page", medicines.get_medicine_page),
+        ("medicines.get_medicine_summaries", lambda: medicines.get_medicine_summaries(ids)),
+        ("medicines.get_batches_for_medicines", lambda: medicines.get_batches_for_medicines(ids)),
+        ("batches.get_batches_for_medicine", lambda: batches.get_batches_for_medicine(mid)),
+        ("batches.soon_to_expire", batches.soon_to_expire),
+        ("batches.get_expired", batches.get_expired),
+        ("batches.get_expiry_timeline", batches.get_expiry_timeline.uncached),
+        ("search.search_medicines", lambda: search.search_medicines("cillin")),
+        ("logs.get_logs", logs.get_logs),
+        ("logs.get_logs_by_table", lambda: logs.get_logs_by_table("medicines")),
+        ("logs.get_logs_by_action", lambda: logs.get_logs_by_action("DELETE")),
+        ("logs.get_logs_page", logs.get_logs_page),
+        ("logs.get_log_facets", logs.get_log_facets),
+        ("logs.iter_logs", lambda: drain(logs.iter_logs())),
+        ("cache.current_generation", current_generation),
+        ("dispensing.dispense", lambda: dispensing.dispense(mid, 1)),
+        ("medicines.create_medicine", lambda: medicines.create_medicine("Bench model medicine")),
+        ("batches.add_batch", lambda: batches.add_batch(mid, "BENCHM", 3, "2030-05-05")),
+        ("medicines.create_medicines_many", lambda: medicines.create_medicines_many([{
+            "name": "Bench model medicine",
+            "batches": [{"batch_no": f"BENCH{i}", "quantity": 1, "expiry_date": "2030-05-05"} for i in range(10)],
+        }])),
+        ("batches.add_batches_many", lambda: batches.add_batches_many(
+            [{"medicine_id": mid, "batch_no": "BENCHM", "quantity": 1, "expiry_date": "2030-05-05"}] * 10
+        )),
+        ("categories.create_category", lambda: categories.create_category(f"Bench {time.perf_counter_ns()}")),
+    ]
+
+def _sample(db_path):
+    from models import encode_cursor
+
+    conn = sqlite3.connect(db_path)
+    # a medicine with plenty of unexpired stock so dispensing never runs dry
+    (mid,) = conn.execute("""
+        SELECT medicine_id FROM batches WHERE expiry_date >= date('now')
+        GROUP BY medicine_id ORDER BY SUM(quantity) DESC LIMIT 1
+    """).fetchone()
+    (bid,) = conn.execute("SELECT MIN(id) FROM batches").fetchone()
+    ids = [r[0] for r in conn.execute("SELECT id FROM medicines ORDER BY name COLLATE NOCASE, id LIMIT 24")]
+    name, last_id = conn.execute(
+        "SELECT name, id FROM medicines ORDER BY name COLLATE NOCASE, id LIMIT 1 OFFSET 23"
+    ).fetchone()
+    ts, log_id = conn.execute(
+        "SELECT timestamp, id FROM activity_log ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET 99"
+    ).fetchone()
+    counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+              for t in ("categories", "medicines", "batches", "expired_items", "activity_log")}
+    conn.close()
+    return {"medicine_id": mid, "batch_id": bid, "medicine_ids": ids,
+            "cursor": encode_cursor(name, last_id), "log_cursor": encode_cursor(ts, log_id),
+            "counts": counts}
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(source_db, iterations=30, warm=False, only=None):
+    workdir = Path(tempfile.mkdtemp(prefix="medivault-bench-"))
+    db_path = workdir / "bench.db"
+    src = sqlite3.connect(source_db)
+    dst = sqlite3.connect(db_path)
+    src.backup(dst)
+    src.close()
+    dst.close()
+    os.environ["MEDIVAULT_DB"] = str(db_path)
+    os.environ.setdefault("MEDIVAULT_SWEEP_INTERVAL", "0")
+
+    try:
+        from app import start_app
+        from database.connection import pool
+        from database.sweeper import maybe_sweep
+        from http_cache import response_cache
+        from models.cache import analytics_cache
+
+        app = start_app()
+        pool.add_connect_hook(_count_queries)
+
+        def clear_caches():
+            if not warm:
+                analytics_cache.clear()
+                response_cache.clear()
+
+        sample = _sample(db_path)
+        client = app.test_client()
+        maybe_sweep()  # the day's expiry sweep, outside the measurements
+
+        results = {}
+        for name, method, url, kwargs in route_cases(sample):
+            if only and only not in name:
+                continue
+
+            def call(method=method, url=url, kwargs=kwargs):
+                return getattr(client, method)(url, **kwargs).status_code
+
+            results[name] = measure(call, iterations, clear_caches)
+
+        for name, fn in model_cases(sample):
+            if only and only not in name:
+                continue
+            results[name] = measure(lambda fn=fn: type(fn()).__name__, iterations, clear_caches)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "source_db": str(source_db),
+            "rows": sample["counts"],
+            "iterations": iterations,
+            "caches": "warm" if warm else "cold",
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+        },
+        "results": results,
+    }
+
+def compare(baseline, current, threshold=1.2):
+    """Rows whose p95 grew past `threshold` x the baseline (plus query deltas)."""
+    lines = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        ratio = now["p95_ms"] / before["p95_ms"] if before["p95_ms"] else float("inf")
+        flag = "REGRESSION" if ratio > threshold else "ok"
+        lines.append(f"{flag:10} {name:42} p95 {before['p95_ms']:>9.2f} -> {now['p95_ms']:>9.2f} ms "
+                     f"({ratio:.2f}x)  queries {before['queries']} -> {now['queries']}")
+    return lines
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark every route and model function")
+    parser.add_argument("db", help="database produced by bench.generate (it is copied, not modified)")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warm", action="store_true", help="keep analytics/response caches between calls")
+    parser.add_argument("--only", default=None, help="substring filter on case names")
+    parser.add_argument("--out", default=None, help="write results JSON here")
+    parser.add_argument("--compare", default=None, help="baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    report = run(args.db, args.iterations, args.warm, args.only)
+    for name, r in report["results"].items():
+        print(f"{name:42} p50 {r['p50_ms']:>9.2f}  p95 {r['p95_ms']:>9.2f}  p99 {r['p99_ms']:>9.2f} ms"
+              f"  q {r['queries']:>6}  peak {r['peak_kb']:>9.1f} KiB  -> {r['status']}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"results written to {args.out}")
+    if args.compare:
+        regressions = 0
+        for line in compare(json.loads(Path(args.compare).read_text()), report):
+            print(line)
+            regressions += line.startswith("REGRESSION")
+        raise SystemExit(1 if regressions else 0)
@@ -0,0 +1,125 @@
+import sqlite3
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from bench.run import percentile
+from models.views import medicine_cards, parse_expiry
+
+# Microbenchmark for the home page's per-row work: turning summary and
+# batch rows into what index.html renders. "dicts" is the previous
+# implementation (a dict per row, strptime/strftime per row), "views" is
+# models.views (namedtuples, memoized parsing, per-request buckets).
+# Rows come from a real database so the expiry mix is realistic.
+SUMMARY_SQL = """
+    SELECT m.id, m.name, c.name AS category,
+           COALESCE(SUM(b.quantity), 0) AS total_qty, MIN(b.expiry_date) AS next_expiry
+    FROM medicines m
+    LEFT JOIN categories c ON c.id = m.category_id
+    LEFT JOIN batches b ON b.medicine_id = m.id
+    GROUP BY m.id
+"""
+BATCHES_SQL = "SELECT id, medicine_id, batch_no, quantity, expiry_date FROM batches ORDER BY medicine_id, id"
+
+def _legacy_format(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").strftime("%d %b %Y")
+    except (TypeError, ValueError):
+        return text
+
+def dict_cards(summaries, batches, today):
+    soon_threshold = today + timedelta(days=30)
+    med_cards = []
+    for m in summaries:
+        med = {
+            "id": m["id"],
+            "name": m["name"],
+            "category": m["category"],
+            "batches": [],
+            "total_qty": m["total_qty"],
+            "next_expiry_display": _legacy_format(m["next_expiry"]) if m["next_expiry"] else "—",
+        }
+        for r in batches[m["id"]]:
+            expiry_text = r["expiry_date"]
+            expiry_obj = None
+            expiry_display = expiry_text or "No expiry"
+            status = "no-date"
+            status_label = "No expiry"
+            if expiry_text:
+                try:
+                    expiry_obj = datetime.strptime(expiry_text, "%Y-%m-%d").date()
+                    expiry_display = expiry_obj.strftime("%d %b %Y")
+                except ValueError:
+                    expiry_obj = None
+                    expiry_display = expiry_text
+            if expiry_obj:
+                if expiry_obj < today:
+                    status, status_label = "expired", "Expired"
+                elif expiry_obj <= soon_threshold:
+                    status, status_label = "soon", "Expiring soon"
+                else:
+                    status, status_label = "healthy", "Fresh"
+            med["batches"].append({
+                "batch_id": r["id"],
+                "batch_no": r["batch_no"],
+                "qty": int(r["quantity"] or 0),
+                "expiry": expiry_text,
+                "expiry_display": expiry_display,
+                "status": status,
+                "status_label": status_label,
+            })
+        med_cards.append(med)
+    return med_cards
+
+def load(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    summaries = conn.execute(SUMMARY_SQL).fetchall()
+    batches = {m["id"]: [] for m in summaries}
+    for r in conn.execute(BATCHES_SQL):
+        batches[r["medicine_id"]].append(r)
+    conn.close()
+    return summaries, batches
+
+def measure(build, summaries, batches, rows, iterations):
+    today = datetime.utcnow().date()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        build(summaries, batches, today)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    tracemalloc.start()
+    cards = build(summaries, batches, today)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cards
+    return {
+        "us_per_row_p50": round(percentile(timings, 50) / rows * 1e6, 3),
+        "us_per_row_p95": round(percentile(timings, 95) / rows * 1e6, 3),
+        "bytes_per_row": round(retained / rows, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+def run(db_path, limit=None, iterations=20):
+    summaries, batches = load(db_path)
+    if limit:
+        summaries = summaries[:limit]
+    rows = len(summaries) + sum(len(batches[m["id"]]) for m in summaries)
+    results = {"rows": rows}
+    for name, build in (("dicts", dict_cards), ("views", medicine_cards)):
+        parse_expiry.cache_clear()  # each run pays its own first parse
+        results[name] = measure(build, summaries, batches, rows, iterations)
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Per-row cost of building home() view rows")
+    parser.add_argument("db", help="database to read rows from (e.g. from bench.generate)")
+    parser.add_argument("--limit", type=int, default=None, help="only the first N medicines")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.db, args.limit, args.iterations), indent=2))
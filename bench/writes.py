@@ -0,0 +1,113 @@
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Write throughput: one commit per request (MEDIVAULT_WRITE_QUEUE=0
+# behaviour) against the group-committing writer queue, with concurrent
+# clients spread over several processes like gunicorn workers.
+INSERT_SQL = "INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, ?, ?, ?)"
+
+def _worker(db_path, queued, threads, writes, synchronous, start_at):
+    os.environ["MEDIVAULT_DB"] = db_path
+    from database.connection import pool
+    from database.writer import WriteQueue
+
+    pool.configure(synchronous=synchronous, pool_size=threads + 2)
+    queue = WriteQueue(pool, enabled=queued)
+    (medicine_id,) = sqlite3.connect(db_path).execute("SELECT MIN(id) FROM medicines").fetchone()
+    errors = []
+
+    def job(conn, i):
+        return conn.execute(INSERT_SQL, (medicine_id, f"W{os.getpid()}-{i}", 1, "2030-01-01")).lastrowid
+
+    def client(offset):
+        for i in range(writes):
+            try:
+                queue.run(job, offset + i)
+            except sqlite3.Error as exc:
+                errors.append(str(exc))
+
+    workers = [threading.Thread(target=client, args=(t * writes,)) for t in range(threads)]
+    time.sleep(max(0.0, start_at - time.time()))
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.time(), queue.stats(), errors
+
+def measure(db_path, queued, processes, threads, writes, synchronous):
+    start_at = time.time() + 2.0  # lets every process finish importing first
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes) as procs:
+        results = procs.starmap(
+            _worker, [(db_path, queued, threads, writes, synchronous, start_at)] * processes
+        )
+    finished = max(r[0] for r in results)
+    errors = [e for r in results for e in r[2]]
+    jobs = sum(r[1]["jobs"] for r in results)
+    commits = sum(r[1]["commits"] for r in results)
+    seconds = finished - start_at
+    committed = processes * threads * writes - len(errors)
+    return {
+        "mode": "write-queue" if queued else "commit-per-request",
+        "processes": processes,
+        "threads_per_process": threads,
+        "synchronous": synchronous,
+        "writes": processes * threads * writes,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": round(seconds, 3),
+        "writes_per_second": round(committed / seconds, 1) if seconds > 0 else None,
+        "jobs_per_commit": round(jobs / commits, 2) if commits else None,
+    }
+
+def run(source_db=None, processes=4, threads=8, writes=200, synchronous_modes=("NORMAL", "FULL")):
+    from database.setup import init_db
+
+    workdir = Path(tempfile.mkdtemp(prefix="medivault-writes-"))
+    try:
+        results = []
+        for synchronous in synchronous_modes:
+            for queued in (False, True):
+                db_path = workdir / f"writes-{synchronous}-{int(queued)}.db"
+                if source_db:
+                    src, dst = sqlite3.connect(source_db), sqlite3.connect(db_path)
+                    src.backup(dst)
+                    src.close()
+                    dst.close()
+                init_db(db_path)
+                conn = sqlite3.connect(db_path)
+                conn.execute("PRAGMA journal_mode = WAL")
+                if conn.execute("SELECT COUNT(*) FROM medicines").fetchone()[0] == 0:
+                    conn.execute("INSERT INTO medicines(name) VALUES ('Write benchmark')")
+                    conn.commit()
+                conn.close()
+                results.append(measure(str(db_path), queued, processes, threads, writes, synchronous))
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare per-request commits with the group-commit write queue")
+    parser.add_argument("--db", default=None, help="database to copy (default: an empty migrated one)")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="concurrent clients per process")
+    parser.add_argument("--writes", type=int, default=200, help="writes per client")
+    parser.add_argument("--synchronous", default="NORMAL,FULL")
+    parser.add_argument("--out", default=None, help="write results JSON here")
+    args = parser.parse_args()
+
+    results = run(args.db, args.processes, args.threads, args.writes, tuple(args.synchronous.split(",")))
+    for r in results:
+        print(f"{r['mode']:20} sync={r['synchronous']:6} {r['writes_per_second']:>9} writes/s  "
+              f"{r['jobs_per_commit']} jobs/commit  errors={r['errors']}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
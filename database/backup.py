@@ -0,0 +1,250 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from database.setup import DB_PATH
+
+# --------------------------------------------------------
+# Online backups (sqlite3 backup API)
+# --------------------------------------------------------
+# A snapshot copies the live database PAGES_PER_STEP pages at a time,
+# sleeping between steps, so a writer waits at most one step. SQLite
+# restarts a step-wise copy when another connection writes to the
+# source; after MAX_RESTARTS the copy is finished in one pass instead
+# (in WAL mode that read does not block writers). Each snapshot is
+# quick_check'ed, gzipped and stored beside a JSON sidecar with its
+# SHA-256, size and timing. The newest KEEP snapshots are kept.
+#
+# Restore checks the checksum and unpacks to a temporary file. There it
+# brings the copy up to the current migration and compares its schema
+# with a freshly migrated database. Only then is it copied over the
+# live database, again through the backup API.
+BACKUP_DIR = Path(os.environ.get("MEDIVAULT_BACKUP_DIR") or DB_PATH.with_name("backups"))
+KEEP = int(os.environ.get("MEDIVAULT_BACKUP_KEEP", 7))
+PAGES_PER_STEP = int(os.environ.get("MEDIVAULT_BACKUP_PAGES", 1024))
+STEP_SLEEP = float(os.environ.get("MEDIVAULT_BACKUP_SLEEP_MS", 5)) / 1000
+MAX_RESTARTS = 3
+SNAPSHOT_RE = re.compile(r"^medivault-\d{8}T\d{6}\d*Z$")
+
+class BackupError(RuntimeError):
+    pass
+
+class _Restarted(Exception):
+    pass
+
+def _copy(source, target, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """Backup API copy; returns (steps, restarts)."""
+    progress = {"steps": 0, "restarts": 0, "remaining": None}
+
+    def on_step(status, remaining, total):
+        progress["steps"] += 1
+        if progress["remaining"] is not None and remaining > progress["remaining"]:
+            progress["restarts"] += 1  # the source changed under us and SQLite began again
+            if progress["restarts"] > MAX_RESTARTS:
+                raise _Restarted
+        progress["remaining"] = remaining
+
+    try:
+        source.backup(target, pages=pages, progress=on_step, sleep=sleep)
+    except _Restarted:
+        source.backup(target)
+        progress["steps"] += 1
+    return progress["steps"], progress["restarts"]
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _paths(name, backup_dir):
+    if not SNAPSHOT_RE.match(name):
+        raise BackupError(f"Invalid snapshot name: {name!r}")
+    return backup_dir / f"{name}.db.gz", backup_dir / f"{name}.json"
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Snapshot metadata, newest first."""
+    backup_dir = Path(backup_dir)
+    if not backup_dir.is_dir():
+        return []
+    snapshots = []
+    for meta in sorted(backup_dir.glob("medivault-*.json"), reverse=True):
+        try:
+            snapshots.append(json.loads(meta.read_text()))
+        except ValueError:
+            continue
+    return snapshots
+
+def rotate(keep=KEEP, backup_dir=BACKUP_DIR):
+    """Delete all but the newest `keep` snapshots; returns removed names."""
+    removed = []
+    for meta in list_snapshots(backup_dir)[keep:]:
+        for path in _paths(meta["name"], Path(backup_dir)):
+            path.unlink(missing_ok=True)
+        removed.append(meta["name"])
+    return removed
+
+def create_snapshot(db_path=DB_PATH, backup_dir=BACKUP_DIR, keep=KEEP,
+                    pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """Take a compressed, checksummed online snapshot; returns its metadata."""
+    backup_dir = Path(backup_dir)
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    created = datetime.utcnow()
+    name = "medivault-" + created.strftime("%Y%m%dT%H%M%S%fZ")
+    archive, meta_path = _paths(name, backup_dir)
+    started = time.perf_counter()
+
+    fd, raw = tempfile.mkstemp(prefix=f".{name}.", suffix=".db", dir=backup_dir)
+    os.close(fd)
+    try:
+        source = sqlite3.connect(str(db_path))
+        target = sqlite3.connect(raw)
+        try:
+            steps, restarts = _copy(source, target, pages, sleep)
+            copied = time.perf_counter()
+            # a self-contained file: no WAL needed to open it
+            target.execute("PRAGMA journal_mode = DELETE")
+            (check,) = target.execute("PRAGMA quick_check").fetchone()
+            (page_size,) = target.execute("PRAGMA page_size").fetchone()
+            (page_count,) = target.execute("PRAGMA page_count").fetchone()
+            (user_version,) = target.execute("PRAGMA user_version").fetchone()
+        finally:
+            target.close()
+            source.close()
+        if check != "ok":
+            raise BackupError(f"Snapshot failed quick_check: {check}")
+
+        partial = archive.with_suffix(".gz.partial")
+        with open(raw, "rb") as src, gzip.open(partial, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(partial, archive)
+        meta = {
+            "name": name,
+            "created_at": created.strftime("%Y-%m-%d %H:%M:%S"),
+            "source": str(db_path),
+            "user_version": user_version,
+            "page_size": page_size,
+            "pages": page_count,
+            "steps": steps,
+            "restarts": restarts,
+            "raw_bytes": os.path.getsize(raw),
+            "compressed_bytes": os.path.getsize(archive),
+            "sha256": _sha256(archive),
+            "copy_seconds": round(copied - started, 3),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        meta_path.write_text(json.dumps(meta, indent=2))
+    finally:
+        Path(raw).unlink(missing_ok=True)
+    meta["rotated"] = rotate(keep, backup_dir)
+    return meta
+
+def _unpack(name, backup_dir, dest_dir):
+    """Checksum, decompress, migrate and schema-check a snapshot; returns (path, report)."""
+    from database.migrations import apply_pending, verify
+
+    archive, meta_path = _paths(name, Path(backup_dir))
+    if not archive.exists() or not meta_path.exists():
+        raise BackupError(f"No such snapshot: {name}")
+    meta = json.loads(meta_path.read_text())
+    if _sha256(archive) != meta["sha256"]:
+        raise BackupError(f"Checksum mismatch for {name}: the snapshot is corrupt")
+
+    fd, raw = tempfile.mkstemp(prefix=f".restore-{name}.", suffix=".db", dir=dest_dir)
+    os.close(fd)
+    try:
+        with gzip.open(archive, "rb") as src, open(raw, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        conn = sqlite3.connect(raw)
+        try:
+            (check,) = conn.execute("PRAGMA quick_check").fetchone()
+            migrated = apply_pending(conn)
+        finally:
+            conn.close()
+        schema = verify(raw)
+    except Exception:
+        Path(raw).unlink(missing_ok=True)
+        raise
+    drift = schema["pending"] or schema["missing"] or schema["unexpected"] or schema["changed"]
+    report = {
+        "name": name,
+        "sha256": "ok",
+        "quick_check": check,
+        "migrated": migrated,
+        "schema": schema,
+        "ok": check == "ok" and not drift,
+    }
+    return raw, report
+
+def verify_snapshot(name, backup_dir=BACKUP_DIR):
+    """Check a snapshot end to end without touching the live database."""
+    raw, report = _unpack(name, backup_dir, Path(backup_dir))
+    Path(raw).unlink(missing_ok=True)
+    return report
+
+def restore_snapshot(name, db_path=DB_PATH, backup_dir=BACKUP_DIR):
+    """Verify a snapshot, then copy it over the live database.
+
+    The copy goes through the backup API into the live file, so open
+    connections see the restored data on their next transaction.
+    """
+    started = time.perf_counter()
+    raw, report = _unpack(name, backup_dir, Path(db_path).resolve().parent)
+    try:
+        if not report["ok"]:
+            raise BackupError(f"Snapshot {name} failed verification: {json.dumps(report)}")
+        source = sqlite3.connect(raw)
+        target = sqlite3.connect(str(db_path), timeout=30)
+        try:
+            (generation,) = target.execute("SELECT generation FROM data_generation WHERE id = 1").fetchone()
+            source.backup(target)
+            # never reuse a generation number: caches keyed on it would serve pre-restore data
+            target.execute("UPDATE data_generation SET generation = MAX(generation, ?) + 1 WHERE id = 1",
+                           (generation,))
+            target.commit()
+        finally:
+            target.close()
+            source.close()
+    finally:
+        Path(raw).unlink(missing_ok=True)
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Online snapshots of the Medi-Vault database")
+    sub = parser.add_subparsers(dest="command", required=True)
+    create_cmd = sub.add_parser("create", help="take a snapshot now")
+    create_cmd.add_argument("--keep", type=int, default=KEEP, help="snapshots to keep (default: %(default)s)")
+    create_cmd.add_argument("--pages", type=int, default=PAGES_PER_STEP, help="pages copied per step")
+    sub.add_parser("list", help="list snapshots, newest first")
+    verify_cmd = sub.add_parser("verify", help="checksum, quick_check and schema-check a snapshot")
+    verify_cmd.add_argument("name")
+    restore_cmd = sub.add_parser("restore", help="verify a snapshot and copy it over the database")
+    restore_cmd.add_argument("name")
+    parser.add_argument("--db", default=str(DB_PATH), help="database file (default: %(default)s)")
+    parser.add_argument("--dir", default=str(BACKUP_DIR), help="snapshot directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        print(json.dumps(create_snapshot(args.db, args.dir, args.keep, args.pages), indent=2))
+    elif args.command == "list":
+        for meta in list_snapshots(args.dir):
+            print(f"{meta['name']}  {meta['created_at']}  v{meta['user_version']}  "
+                  f"{meta['raw_bytes']:>12,} B -> {meta['compressed_bytes']:>12,} B  {meta['seconds']:.2f}s")
+    elif args.command == "verify":
+        report = verify_snapshot(args.name, args.dir)
+        print(json.dumps(report, indent=2))
+        raise SystemExit(0 if report["ok"] else 1)
+    else:
+        print(json.dumps(restore_snapshot(args.name, args.db, args.dir), indent=2))
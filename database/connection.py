@@ -0,0 +1,253 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from flask import g, has_app_context
+
+from database.setup import DB_PATH
+
+# --------------------------------------------------------
+# Connection tuning (override with MEDIVAULT_SQLITE_* env vars)
+# --------------------------------------------------------
+DEFAULT_SETTINGS = {
+    "pool_size": int(os.environ.get("MEDIVAULT_SQLITE_POOL_SIZE", 8)),
+    "pool_timeout": float(os.environ.get("MEDIVAULT_SQLITE_POOL_TIMEOUT", 10)),
+    "synchronous": os.environ.get("MEDIVAULT_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": int(os.environ.get("MEDIVAULT_SQLITE_CACHE_SIZE", -16000)),
+    "mmap_size": int(os.environ.get("MEDIVAULT_SQLITE_MMAP_SIZE", 128 * 1024 * 1024)),
+    "busy_timeout": int(os.environ.get("MEDIVAULT_SQLITE_BUSY_TIMEOUT", 5000)),
+}
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+class PoolTimeout(RuntimeError):
+    pass
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool."""
+
+    _pool = None
+    _generation = 0
+    _leased = False
+    _loans = 0
+    _pid = None
+    attached = frozenset()
+    cursor_factory = sqlite3.Cursor
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_factory)
+
+    # route the shortcuts through cursor() so a cursor_factory sees every statement
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def close(self):
+        if self._loans:
+            self._loans -= 1  # a model function is done with the request's connection
+            return
+        if self._pool is None:
+            super().close()
+        else:
+            self._pool.release(self)
+
+    def discard(self):
+        super().close()
+
+class ConnectionPool:
+    """Bounded LIFO pool of tuned SQLite connections shared by app + models.
+
+    read_only=True opens the file with mode=ro and sets no journal mode,
+    so reading someone else's database never converts it to WAL or
+    leaves -wal/-shm files behind.
+    """
+
+    def __init__(self, path, read_only=False, **settings):
+        self.path = str(path)
+        self.read_only = read_only
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings)
+        self.attachments = {}
+        self.connect_hooks = []
+        self._idle = []
+        self._size = 0
+        self._generation = 0
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _check_fork(self):
+        # a forked child (e.g. gunicorn --preload) inherits the parent's idle
+        # sqlite3 handles; it must neither use nor close them, so start empty
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._generation += 1
+
+    def configure(self, **settings):
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown pool settings: {', '.join(sorted(unknown))}")
+        if str(settings.get("synchronous", "NORMAL")).upper() not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {SYNCHRONOUS_MODES}")
+        self.settings.update(settings)
+        # idle connections were opened with the old pragmas
+        self.clear()
+
+    def attach(self, alias, path):
+        """ATTACH another database file on every pooled connection."""
+        if self.attachments.get(alias) == str(path):
+            return
+        self.attachments[alias] = str(path)
+        # existing connections don't have it attached yet
+        self.clear()
+
+    def add_connect_hook(self, hook):
+        """Call hook(conn) on every newly opened connection (e.g. tracing)."""
+        if hook in self.connect_hooks:
+            return
+        self.connect_hooks.append(hook)
+        self.clear()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            Path(self.path).resolve().as_uri() + "?mode=ro" if self.read_only else self.path,
+            factory=PooledConnection,
+            check_same_thread=False,
+            timeout=self.settings["busy_timeout"] / 1000,
+            uri=self.read_only,
+        )
+        conn.row_factory = sqlite3.Row
+        if not self.read_only:
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute(f"PRAGMA synchronous = {str(self.settings['synchronous']).upper()};")
+        conn.execute(f"PRAGMA cache_size = {int(self.settings['cache_size'])};")
+        conn.execute(f"PRAGMA mmap_size = {int(self.settings['mmap_size'])};")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.settings['busy_timeout'])};")
+        conn.execute("PRAGMA foreign_keys = ON;")
+        for alias, path in self.attachments.items():
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        conn.attached = set(self.attachments)
+        for hook in self.connect_hooks:
+            hook(conn)
+        conn._pool = self
+        conn._generation = self._generation
+        conn._pid = os.getpid()
+        return conn
+
+    def acquire(self):
+        self._check_fork()
+        with self._cond:
+            waited_since = None
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    if waited_since is None:
+                        self.hits += 1
+                    break
+                if self._size < self.settings["pool_size"]:
+                    self.misses += 1
+                    self._size += 1
+                    conn = None
+                    break
+                if waited_since is None:
+                    self.waits += 1
+                    waited_since = time.perf_counter()
+                remaining = waited_since + self.settings["pool_timeout"] - time.perf_counter()
+                if remaining <= 0:
+                    self.wait_time += time.perf_counter() - waited_since
+                    raise PoolTimeout("Timed out waiting for a database connection")
+                self._cond.wait(remaining)
+            if waited_since is not None:
+                self.wait_time += time.perf_counter() - waited_since
+        if conn is not None:
+            conn._leased = True
+            return conn
+        try:
+            conn = self._connect()
+            conn._leased = True
+            return conn
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        if not conn._leased:
+            return
+        conn._loans = 0
+        self._check_fork()
+        if conn._pid != self._pid:
+            conn._leased = False  # leased before the fork: the parent owns it
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            conn._leased = False
+            stale = conn._generation != self._generation
+            if stale or len(self._idle) + 1 > self.settings["pool_size"]:
+                self._size -= 1
+                conn.discard()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def clear(self):
+        self._check_fork()
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._generation += 1
+            self._size -= len(idle)
+        for conn in idle:
+            conn.discard()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "max_size": self.settings["pool_size"],
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "wait_time": round(self.wait_time, 6),
+            }
+
+pool = ConnectionPool(DB_PATH)
+
+def request_conn():
+    """The current request's connection (g.db), taken from the pool on first use."""
+    if "db" not in g:
+        g.db = pool.acquire()
+    return g.db
+
+def release_request_conn():
+    conn = g.pop("db", None)
+    if conn is not None:
+        pool.release(conn)
+
+def get_conn():
+    """Connection for model code, which close()s it when done.
+
+    Inside a Flask app context this lends out the request's own
+    connection, so a request never holds more than one pool slot however
+    many model functions it calls; close() then just ends the loan.
+    Elsewhere (background threads, CLIs, write-queue jobs) it comes
+    straight from the pool.
+    """
+    if not has_app_context():
+        return pool.acquire()
+    conn = request_conn()
+    conn._loans += 1
+    return conn
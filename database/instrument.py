@@ -0,0 +1,290 @@
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# --------------------------------------------------------
+# Statement instrumentation for pooled connections
+# --------------------------------------------------------
+# install(pool) gives every pooled connection an InstrumentedCursor that
+# times each statement (execute + fetches) and counts its rows. Finished
+# statements feed per-query histograms, the active request's totals and,
+# above MEDIVAULT_SLOW_QUERY_MS, the slow-query log with their plan.
+ENABLED = os.environ.get("MEDIVAULT_INSTRUMENT", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("MEDIVAULT_SLOW_QUERY_MS", 100))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+log = logging.getLogger("medivault.queries")
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            for labels, (counts, total, count) in items:
+                base = _labels(self.label_names, labels)
+                for bound, n in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {n}')
+                lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{base}}} {total}")
+                lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+class Counter:
+    def __init__(self, name, help, label_names):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+request_duration = Histogram(
+    "medivault_request_duration_seconds", "Request latency by route.", ("route", "method"))
+request_queries = Histogram(
+    "medivault_request_queries", "SQL statements per request by route.", ("route", "method"), COUNT_BUCKETS)
+query_duration = Histogram(
+    "medivault_query_duration_seconds", "Statement latency (execute + fetch) by query.", ("query",))
+query_rows = Counter("medivault_query_rows_total", "Rows returned or changed by query.", ("query",))
+slow_queries = Counter("medivault_slow_queries_total", "Statements over the slow-query threshold.", ("query",))
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Whitespace-collapsed statement text used as the metrics label."""
+    text = " ".join(sql.split())
+    return text if len(text) <= 200 else text[:197] + "..."
+
+# --------------------------------------------------------
+# Per-request collection
+# --------------------------------------------------------
+_local = threading.local()
+
+class RequestQueries:
+    __slots__ = ("started", "count", "seconds", "rows", "slow")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.slow = 0
+
+def begin_request():
+    _local.collector = RequestQueries()
+    return _local.collector
+
+def end_request(route, method):
+    """Stop collecting for this thread; record route metrics; return the totals."""
+    collector = getattr(_local, "collector", None)
+    _local.collector = None
+    if collector is None:
+        return None
+    elapsed = time.perf_counter() - collector.started
+    request_duration.observe((route, method), elapsed)
+    request_queries.observe((route, method), collector.count)
+    return collector
+
+def server_timing(collector):
+    total = (time.perf_counter() - collector.started) * 1000
+    return (f'db;dur={collector.seconds * 1000:.2f};desc="{collector.count} queries, {collector.rows} rows", '
+            f"total;dur={total:.2f}")
+
+# --------------------------------------------------------
+# Cursor
+# --------------------------------------------------------
+class _Statement:
+    __slots__ = ("sql", "params", "seconds", "rows", "conn")
+
+    def __init__(self, sql, params, conn):
+        self.sql = sql
+        self.params = params
+        self.seconds = 0.0
+        self.rows = 0
+        self.conn = conn
+
+def _explain(stmt):
+    if stmt.params is None or not stmt.sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    # a throwaway connection: the statement's own one may already be back in the pool
+    pool = stmt.conn._pool
+    conn = sqlite3.connect(pool.path if pool else ":memory:")
+    try:
+        for alias, path in (pool.attachments.items() if pool else ()):
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + stmt.sql, stmt.params)]
+    except sqlite3.Error as exc:
+        return [f"(plan unavailable: {exc})"]
+    finally:
+        conn.close()
+
+def _finished(stmt):
+    key = (fingerprint(stmt.sql),)
+    query_duration.observe(key, stmt.seconds)
+    query_rows.inc(key, stmt.rows)
+    collector = getattr(_local, "collector", None)
+    if collector is not None:
+        collector.count += 1
+        collector.seconds += stmt.seconds
+        collector.rows += stmt.rows
+    if stmt.seconds * 1000 >= SLOW_QUERY_MS:
+        slow_queries.inc(key)
+        if collector is not None:
+            collector.slow += 1
+        log.warning("slow query (%.1f ms, %d rows): %s params=%r plan=%s",
+                    stmt.seconds * 1000, stmt.rows, key[0], stmt.params, " | ".join(_explain(stmt)))
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement until its rows are consumed."""
+
+    _stmt = None
+
+    def _finish(self):
+        stmt, self._stmt = self._stmt, None
+        if stmt is not None:
+            _finished(stmt)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        stmt = _Statement(sql, parameters, self.connection)
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            stmt.seconds += time.perf_counter() - started
+            self._stmt = stmt
+        if self.description is None:
+            stmt.rows = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        stmt = _Statement(sql, None, self.connection)
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            stmt.seconds += time.perf_counter() - started
+            stmt.rows = max(self.rowcount, 0)
+            self._stmt = stmt
+            self._finish()
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        stmt = self._stmt
+        if stmt is not None:
+            stmt.seconds += time.perf_counter() - started
+            if row is None:
+                self._finish()
+            else:
+                stmt.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        stmt = self._stmt
+        if stmt is not None:
+            stmt.seconds += time.perf_counter() - started
+            stmt.rows += len(rows)
+            if len(rows) < size:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        stmt = self._stmt
+        if stmt is not None:
+            stmt.seconds += time.perf_counter() - started
+            stmt.rows += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            if self._stmt is not None:
+                self._stmt.seconds += time.perf_counter() - started
+                self._finish()
+            raise
+        stmt = self._stmt
+        if stmt is not None:
+            stmt.seconds += time.perf_counter() - started
+            stmt.rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # statements read with a single fetchone() finish when the cursor goes away
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+def _instrument(conn):
+    conn.cursor_factory = InstrumentedCursor
+
+def install(pool):
+    if ENABLED:
+        pool.add_connect_hook(_instrument)
+
+def render_metrics(gauges=()):
+    """Prometheus text exposition of every metric plus (name, help, value) gauges."""
+    lines = []
+    for metric in (request_duration, request_queries, query_duration, query_rows, slow_queries):
+        lines += metric.render()
+    for name, help, value in gauges:
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,152 @@
+import sqlite3
+from collections import namedtuple
+
+from database.setup import (
+    DB_PATH,
+    SCHEMA,
+    migrate_expiry_day,
+    migrate_expiry_sweeper,
+    migrate_fefo_index,
+    migrate_log_archive_mark,
+    rebuild_expiry_rollup,
+    rebuild_inventory_summary,
+    rebuild_search_index,
+)
+
+# --------------------------------------------------------
+# Versioned migrations (PRAGMA user_version)
+# --------------------------------------------------------
+# Each step runs once, in order, and user_version is bumped after it
+# commits. Steps are idempotent (IF NOT EXISTS / guarded), so a step that
+# was interrupted, or raced by a second process starting at the same
+# time, is safe to run again. Append new steps; never edit applied ones.
+Migration = namedtuple("Migration", "version name apply")
+
+def _base_schema(conn):
+    conn.executescript(SCHEMA)
+
+def _backfill_derived_tables(conn):
+    # search index, summary counters and expiry rollup for databases
+    # whose rows predate the triggers that maintain them
+    if conn.execute(
+        "SELECT (SELECT COUNT(*) FROM medicines) != (SELECT COUNT(*) FROM medicine_search)"
+    ).fetchone()[0]:
+        rebuild_search_index(conn)
+    if conn.execute(
+        "SELECT 1 FROM inventory_summary WHERE scope = 'total' AND scope_id = 0"
+    ).fetchone() is None:
+        rebuild_inventory_summary(conn)
+    if conn.execute(
+        "SELECT NOT EXISTS (SELECT 1 FROM expiry_month_rollup)"
+        " AND EXISTS (SELECT 1 FROM batches WHERE expiry_day IS NOT NULL)"
+    ).fetchone()[0]:
+        rebuild_expiry_rollup(conn)
+
+def _seed_categories(conn):
+    if conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0] == 0:
+        conn.executemany(
+            "INSERT OR IGNORE INTO categories(name) VALUES (?)",
+            [("Tablet",), ("Syrup",), ("Injection",), ("Ointment",)],
+        )
+
+MIGRATIONS = [
+    Migration(1, "base schema: tables, views, indexes, triggers, FTS and summary tables", _base_schema),
+    Migration(2, "batches.expiry_day generated column + idx_batch_expiry_day", migrate_expiry_day),
+    Migration(3, "expiry sweeper: unique expired_items, expiry_sweeps, sweep-aware triggers",
+              migrate_expiry_sweeper),
+    Migration(4, "backfill search index, inventory_summary and expiry_month_rollup", _backfill_derived_tables),
+    Migration(5, "seed default categories", _seed_categories),
+    Migration(6, "idx_batch_medicine_expiry_day for FEFO dispensing", migrate_fefo_index),
+    Migration(7, "log_archive_mark: highest activity_log id moved to the archive", migrate_log_archive_mark),
+]
+LATEST = MIGRATIONS[-1].version
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def apply_pending(conn, target=LATEST):
+    """Run every step above the current version up to `target`; returns applied versions."""
+    version = current_version(conn)
+    if version >= target:
+        return []
+    if version == 0:
+        # only takes effect on a brand-new file; lets log retention free pages incrementally
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    applied = []
+    for migration in MIGRATIONS:
+        if version < migration.version <= target:
+            migration.apply(conn)
+            conn.commit()
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+            conn.commit()
+            applied.append(migration.version)
+    return applied
+
+def migrate(path=DB_PATH, target=LATEST):
+    conn = sqlite3.connect(path)
+    try:
+        return apply_pending(conn, target)
+    finally:
+        conn.close()
+
+def _objects(conn):
+    return {
+        (kind, name): " ".join((sql or "").split())
+        for kind, name, sql in conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"
+        )
+    }
+
+def verify(path=DB_PATH):
+    """Compare a database against a fresh in-memory one migrated to LATEST."""
+    reference = sqlite3.connect(":memory:")
+    apply_pending(reference)
+    expected = _objects(reference)
+    reference.close()
+
+    conn = sqlite3.connect(path)
+    try:
+        version = current_version(conn)
+        actual = _objects(conn)
+    finally:
+        conn.close()
+    return {
+        "version": version,
+        "latest": LATEST,
+        "pending": [m.version for m in MIGRATIONS if m.version > version],
+        "missing": sorted(f"{kind} {name}" for kind, name in expected.keys() - actual.keys()),
+        "unexpected": sorted(f"{kind} {name}" for kind, name in actual.keys() - expected.keys()),
+        "changed": sorted(
+            f"{kind} {name}" for (kind, name), sql in expected.items()
+            if (kind, name) in actual and actual[(kind, name)] != sql
+        ),
+    }
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Manage Medi-Vault schema migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="show every migration and whether it is applied")
+    apply_cmd = sub.add_parser("apply", help="apply pending migrations")
+    apply_cmd.add_argument("--to", type=int, default=LATEST, help="target version (default: latest)")
+    sub.add_parser("verify", help="diff the schema against a freshly migrated database; exit 1 on drift")
+    parser.add_argument("--db", default=str(DB_PATH), help="database file (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        conn = sqlite3.connect(args.db)
+        version = current_version(conn)
+        conn.close()
+        for m in MIGRATIONS:
+            print(f"{'applied' if m.version <= version else 'pending'}  {m.version:>3}  {m.name}")
+        print(f"database at version {version}, latest {LATEST}")
+    elif args.command == "apply":
+        applied = migrate(args.db, args.to)
+        print(f"applied: {applied or 'nothing, already up to date'}")
+    else:
+        report = verify(args.db)
+        print(json.dumps(report, indent=2))
+        drift = report["pending"] or report["missing"] or report["unexpected"] or report["changed"]
+        raise SystemExit(1 if drift else 0)
@@ -0,0 +1,211 @@
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from database.setup import DB_PATH
+from database.connection import pool
+
+# Rows older than the hot window move from activity_log into an attached
+# archive database; models.logs reads both transparently.
+ARCHIVE_PATH = DB_PATH.with_name("activity_archive.db")
+ARCHIVE_ALIAS = "archive"
+
+DEFAULT_HOT_DAYS = int(os.environ.get("MEDIVAULT_LOG_HOT_DAYS", 90))
+MOVE_CHUNK = 5000
+
+# highest activity_log id moved so far (see database/setup.py)
+ARCHIVED_THROUGH_SQL = "SELECT IFNULL(MAX(archived_through), 0) FROM log_archive_mark"
+
+ARCHIVE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {ARCHIVE_ALIAS}.activity_log(
+    id INTEGER PRIMARY KEY,
+    action TEXT,
+    table_name TEXT,
+    record_id INTEGER,
+    details TEXT,
+    timestamp TEXT,
+    archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS {ARCHIVE_ALIAS}.idx_log_timestamp ON activity_log(timestamp);
+CREATE INDEX IF NOT EXISTS {ARCHIVE_ALIAS}.idx_log_table_timestamp ON activity_log(table_name, timestamp);
+CREATE INDEX IF NOT EXISTS {ARCHIVE_ALIAS}.idx_log_action_timestamp ON activity_log(action, timestamp);
+"""
+
+def parse_policy(spec):
+    """Parse "90,batches=30,medicines=365" into {"*": 90, "batches": 30, ...}.
+
+    A bare number sets the default hot window (days) for every table.
+    """
+    policy = {"*": DEFAULT_HOT_DAYS}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        table, _, days = part.rpartition("=")
+        try:
+            days = int(days)
+        except ValueError:
+            raise ValueError(f"Invalid retention rule: {part!r}")
+        if days < 0:
+            raise ValueError(f"Retention days must be >= 0: {part!r}")
+        policy[table.strip() or "*"] = days
+    return policy
+
+DEFAULT_POLICY = parse_policy(os.environ.get("MEDIVAULT_LOG_RETENTION"))
+
+def archive_sources(conn=None):
+    """Schemas holding activity_log rows, hot first.
+
+    Attaches the archive to the pool the first time its file shows up (it
+    may have been created by another process running the CLI), and to
+    `conn` too if that connection was handed out before then.
+    """
+    if ARCHIVE_ALIAS not in pool.attachments:
+        if not ARCHIVE_PATH.exists():
+            return ("main",)
+        pool.attach(ARCHIVE_ALIAS, ARCHIVE_PATH)
+    if conn is not None and ARCHIVE_ALIAS not in conn.attached:
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (str(ARCHIVE_PATH),))
+        conn.attached = set(conn.attached) | {ARCHIVE_ALIAS}
+    return ("main", ARCHIVE_ALIAS)
+
+def _cutoff_condition(policy, now):
+    """SQL matching rows outside their table's hot window."""
+    clauses, params = [], []
+    overrides = [t for t in policy if t != "*"]
+    for table in overrides:
+        clauses.append("(table_name = ? AND timestamp < ?)")
+        params += [table, (now - timedelta(days=policy[table])).strftime("%Y-%m-%d %H:%M:%S")]
+    default_cutoff = (now - timedelta(days=policy["*"])).strftime("%Y-%m-%d %H:%M:%S")
+    if overrides:
+        placeholders = ", ".join("?" for _ in overrides)
+        clauses.append(f"(IFNULL(table_name, '') NOT IN ({placeholders}) AND timestamp < ?)")
+        params += overrides + [default_cutoff]
+    else:
+        clauses.append("timestamp < ?")
+        params.append(default_cutoff)
+    return " OR ".join(clauses), params
+
+def _open(path=DB_PATH, archive_path=ARCHIVE_PATH):
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 5000;")
+    new_archive = not archive_path.exists()
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (str(archive_path),))
+    if new_archive:
+        conn.execute(f"PRAGMA {ARCHIVE_ALIAS}.auto_vacuum = INCREMENTAL;")
+    conn.execute(f"PRAGMA {ARCHIVE_ALIAS}.journal_mode = WAL;")
+    conn.executescript(ARCHIVE_SCHEMA)
+    return conn
+
+def archive_logs(policy=None, now=None, chunk=MOVE_CHUNK, dry_run=False,
+                 path=DB_PATH, archive_path=ARCHIVE_PATH):
+    """Move activity_log rows older than their hot window into the archive.
+
+    Rows move in chunks, each in its own short BEGIN IMMEDIATE transaction
+    so writers are only blocked briefly; INSERT OR IGNORE keeps a re-run
+    after an interrupted chunk idempotent. Returns a stats dict.
+    """
+    policy = policy or DEFAULT_POLICY
+    now = now or datetime.utcnow()
+    condition, params = _cutoff_condition(policy, now)
+    started = time.perf_counter()
+
+    conn = _open(path, archive_path)
+    try:
+        (eligible,) = conn.execute(
+            f"SELECT COUNT(*) FROM main.activity_log WHERE {condition}", params
+        ).fetchone()
+        moved = 0
+        if not dry_run:
+            batch = f"SELECT id FROM main.activity_log WHERE {condition} ORDER BY id LIMIT ?"
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    cur = conn.execute(f"""
+                        INSERT OR IGNORE INTO {ARCHIVE_ALIAS}.activity_log
+                            (id, action, table_name, record_id, details, timestamp)
+                        SELECT id, action, table_name, record_id, details, timestamp
+                        FROM main.activity_log WHERE id IN ({batch})
+                    """, params + [chunk])
+                    # readers tailing the log by id (models.expiry_index,
+                    # models.change_feed) rebuild once this passes their position
+                    conn.execute(f"""
+                        UPDATE main.log_archive_mark
+                        SET archived_through = MAX(archived_through, IFNULL((
+                            SELECT MAX(id) FROM main.activity_log WHERE id IN ({batch})
+                        ), 0))
+                        WHERE id = 1
+                    """, params + [chunk])
+                    cur = conn.execute(
+                        f"DELETE FROM main.activity_log WHERE id IN ({batch})", params + [chunk]
+                    )
+                    deleted = cur.rowcount
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                moved += deleted
+                if deleted < chunk:
+                    break
+    finally:
+        conn.close()
+
+    if not dry_run:
+        archive_sources()
+    return {
+        "policy": policy,
+        "eligible": eligible,
+        "moved": moved,
+        "dry_run": dry_run,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def compact(pages=None, full=False, path=DB_PATH, archive_path=ARCHIVE_PATH):
+    """Reclaim pages freed by archival.
+
+    With auto_vacuum=INCREMENTAL this releases up to `pages` free pages
+    (all if None) without rewriting the file. Databases created before
+    incremental mode need a one-off full=True VACUUM to switch modes.
+    """
+    conn = _open(path, archive_path)
+    try:
+        report = {}
+        for schema in ("main", ARCHIVE_ALIAS):
+            (mode,) = conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()
+            (before,) = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()
+            if mode == 2:
+                n = "" if pages is None else f"({int(pages)})"
+                conn.execute(f"PRAGMA {schema}.incremental_vacuum{n}").fetchall()
+            elif full:
+                conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+                conn.execute(f"VACUUM {schema}")
+            (after,) = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()
+            (mode,) = conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()
+            report[schema] = {"auto_vacuum": mode, "free_pages_before": before, "free_pages_after": after}
+        return report
+    finally:
+        conn.close()
+
+def run_retention(policy=None, vacuum_pages=None, dry_run=False):
+    """Archive past the hot window, then incrementally vacuum."""
+    stats = archive_logs(policy, dry_run=dry_run)
+    if not dry_run and stats["moved"]:
+        stats["compaction"] = compact(vacuum_pages)
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Archive and compact the activity log")
+    parser.add_argument("--policy", default=os.environ.get("MEDIVAULT_LOG_RETENTION", ""),
+                        help='hot-window days, e.g. "90,batches=30" (default %(default)r)')
+    parser.add_argument("--dry-run", action="store_true", help="only count eligible rows")
+    parser.add_argument("--vacuum-pages", type=int, default=None,
+                        help="max free pages to release per run (default: all)")
+    parser.add_argument("--full-vacuum", action="store_true",
+                        help="one-off VACUUM to switch databases to incremental auto_vacuum")
+    args = parser.parse_args()
+
+    if args.full_vacuum:
+        print(json.dumps(compact(full=True), indent=2))
+    else:
+        print(json.dumps(run_retention(parse_policy(args.policy), args.vacuum_pages, args.dry_run), indent=2))
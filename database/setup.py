@@ -1,7 +1,8 @@
+import os
 import sqlite3
 from pathlib import Path
 
-DB_PATH = Path(__file__).resolve().parent.parent / "database.db"
+DB_PATH = Path(os.environ.get("MEDIVAULT_DB") or Path(__file__).resolve().parent.parent / "database.db")
 
 SCHEMA = """
 PRAGMA foreign_keys = ON;
@@ -62,6 +63,11 @@ LEFT JOIN batches b ON m.id = b.medicine_id;
 
 CREATE INDEX IF NOT EXISTS idx_medicine_name ON medicines(name);
 CREATE INDEX IF NOT EXISTS idx_batch_expiry ON batches(expiry_date);
+CREATE INDEX IF NOT EXISTS idx_medicine_name_nocase ON medicines(name COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_batch_medicine_expiry ON batches(medicine_id, expiry_date);
+CREATE INDEX IF NOT EXISTS idx_log_timestamp ON activity_log(timestamp);
+CREATE INDEX IF NOT EXISTS idx_log_table_timestamp ON activity_log(table_name, timestamp);
+CREATE INDEX IF NOT EXISTS idx_log_action_timestamp ON activity_log(action, timestamp);
 
 CREATE TRIGGER IF NOT EXISTS log_medicine_insert
 AFTER INSERT ON medicines
@@ -106,44 +112,580 @@ INSERT INTO activity_log(action, table_name, record_id, details)
 VALUES ('DELETE', 'batches', OLD.id, COALESCE(OLD.batch_no, ''));
 END;
 
-CREATE TRIGGER IF NOT EXISTS detect_expiry_on_insert
+-- Change generation: bumped by every write to the inventory tables so
+-- caches can key results on it and serve them until data actually changes.
+CREATE TABLE IF NOT EXISTS data_generation(
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO data_generation(id, generation) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS generation_medicines_insert
+AFTER INSERT ON medicines
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_medicines_update
+AFTER UPDATE ON medicines
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_medicines_delete
+AFTER DELETE ON medicines
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_batches_insert
 AFTER INSERT ON batches
-WHEN DATE(NEW.expiry_date) <= DATE('now')
 BEGIN
-  INSERT INTO expired_items(batch_id, expired_on)
-  VALUES (NEW.id, DATE('now'));
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
 END;
 
-CREATE TRIGGER IF NOT EXISTS detect_expiry_on_update
+CREATE TRIGGER IF NOT EXISTS generation_batches_update
 AFTER UPDATE ON batches
-WHEN DATE(NEW.expiry_date) <= DATE('now')
 BEGIN
-  INSERT INTO expired_items(batch_id, expired_on)
-  VALUES (NEW.id, DATE('now'));
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_batches_delete
+AFTER DELETE ON batches
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_categories_insert
+AFTER INSERT ON categories
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_categories_update
+AFTER UPDATE ON categories
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_categories_delete
+AFTER DELETE ON categories
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_expired_items_insert
+AFTER INSERT ON expired_items
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_expired_items_update
+AFTER UPDATE ON expired_items
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS generation_expired_items_delete
+AFTER DELETE ON expired_items
+BEGIN
+  UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+-- Headline counters kept up to date incrementally (one PK lookup per page).
+-- scope is 'total' (scope_id 0), 'category' (scope_id 0 = uncategorized)
+-- or 'medicine'; medicine rows remember their category so cascaded batch
+-- deletes can still find it after the parent row is gone.
+CREATE TABLE IF NOT EXISTS inventory_summary(
+    scope TEXT NOT NULL,
+    scope_id INTEGER NOT NULL,
+    category_id INTEGER,
+    medicines INTEGER NOT NULL DEFAULT 0,
+    batches INTEGER NOT NULL DEFAULT 0,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    expired_items INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY(scope, scope_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS summary_medicine_insert
+AFTER INSERT ON medicines
+BEGIN
+  INSERT INTO inventory_summary(scope, scope_id, category_id)
+  VALUES ('medicine', NEW.id, COALESCE(NEW.category_id, 0));
+  INSERT INTO inventory_summary(scope, scope_id, medicines)
+  VALUES ('category', COALESCE(NEW.category_id, 0), 1), ('total', 0, 1)
+  ON CONFLICT(scope, scope_id) DO UPDATE SET medicines = medicines + excluded.medicines;
+END;
+
+CREATE TRIGGER IF NOT EXISTS summary_medicine_category
+AFTER UPDATE OF category_id ON medicines
+WHEN COALESCE(OLD.category_id, 0) != COALESCE(NEW.category_id, 0)
+BEGIN
+  INSERT INTO inventory_summary(scope, scope_id, medicines, batches, quantity)
+  SELECT 'category', COALESCE(OLD.category_id, 0), -1, -batches, -quantity
+  FROM inventory_summary WHERE scope = 'medicine' AND scope_id = NEW.id
+  UNION ALL
+  SELECT 'category', COALESCE(NEW.category_id, 0), 1, batches, quantity
+  FROM inventory_summary WHERE scope = 'medicine' AND scope_id = NEW.id
+  ON CONFLICT(scope, scope_id) DO UPDATE SET
+    medicines = medicines + excluded.medicines,
+    batches = batches + excluded.batches,
+    quantity = quantity + excluded.quantity;
+  UPDATE inventory_summary SET category_id = COALESCE(NEW.category_id, 0)
+  WHERE scope = 'medicine' AND scope_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS summary_medicine_delete
+AFTER DELETE ON medicines
+BEGIN
+  INSERT INTO inventory_summary(scope, scope_id, medicines)
+  VALUES ('category', COALESCE(OLD.category_id, 0), -1), ('total', 0, -1)
+  ON CONFLICT(scope, scope_id) DO UPDATE SET medicines = medicines + excluded.medicines;
+  DELETE FROM inventory_summary WHERE scope = 'medicine' AND scope_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS summary_category_insert
+AFTER INSERT ON categories
+BEGIN
+  INSERT OR IGNORE INTO inventory_summary(scope, scope_id) VALUES ('category', NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS summary_category_delete
+AFTER DELETE ON categories
+BEGIN
+  DELETE FROM inventory_summary WHERE scope = 'category' AND scope_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS summary_batch_insert
+AFTER INSERT ON batches
+BEGIN
+  INSERT INTO inventory_summary(scope, scope_id, batches, quantity)
+  SELECT 'medicine', NEW.medicine_id, 1, COALESCE(NEW.quantity, 0)
+  UNION ALL
+  SELECT 'category', category_id, 1, COALESCE(NEW.quantity, 0)
+  FROM inventory_summary WHERE scope = 'medicine' AND scope_id = NEW.medicine_id
+  UNION ALL
+  SELECT 'total', 0, 1, COALESCE(NEW.quantity, 0)
+  ON CONFLICT(scope, scope_id) DO UPDATE SET
+    batches = batches + excluded.batches,
+    quantity = quantity + excluded.quantity;
+END;
+
+CREATE TRIGGER IF NOT EXISTS summary_batch_update
+AFTER UPDATE OF quantity, medicine_id ON batches
+BEGIN
+  INSERT INTO inventory_summary(scope, scope_id, batches, quantity)
+  SELECT 'medicine', OLD.medicine_id, -1, -COALESCE(OLD.quantity, 0)
+  UNION ALL
+  SELECT 'category', category_id, -1, -COALESCE(OLD.quantity, 0)
+  FROM inventory_summary WHERE scope = 'medicine' AND scope_id = OLD.medicine_id
+  UNION ALL
+  SELECT 'medicine', NEW.medicine_id, 1, COALESCE(NEW.quantity, 0)
+  UNION ALL
+  SELECT 'category', category_id, 1, COALESCE(NEW.quantity, 0)
+  FROM inventory_summary WHERE scope = 'medicine' AND scope_id = NEW.medicine_id
+  UNION ALL
+  SELECT 'total', 0, 0, COALESCE(NEW.quantity, 0) - COALESCE(OLD.quantity, 0)
+  ON CONFLICT(scope, scope_id) DO UPDATE SET
+    batches = batches + excluded.batches,
+    quantity = quantity + excluded.quantity;
+END;
+
+CREATE TRIGGER IF NOT EXISTS summary_batch_delete
+AFTER DELETE ON batches
+BEGIN
+  INSERT INTO inventory_summary(scope, scope_id, batches, quantity)
+  SELECT 'medicine', OLD.medicine_id, -1, -COALESCE(OLD.quantity, 0)
+  UNION ALL
+  SELECT 'category', category_id, -1, -COALESCE(OLD.quantity, 0)
+  FROM inventory_summary WHERE scope = 'medicine' AND scope_id = OLD.medicine_id
+  UNION ALL
+  SELECT 'total', 0, -1, -COALESCE(OLD.quantity, 0)
+  ON CONFLICT(scope, scope_id) DO UPDATE SET
+    batches = batches + excluded.batches,
+    quantity = quantity + excluded.quantity;
+END;
+
+CREATE TRIGGER IF NOT EXISTS summary_expired_insert
+AFTER INSERT ON expired_items
+BEGIN
+  INSERT INTO inventory_summary(scope, scope_id, expired_items) VALUES ('total', 0, 1)
+  ON CONFLICT(scope, scope_id) DO UPDATE SET expired_items = expired_items + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS summary_expired_delete
+AFTER DELETE ON expired_items
+BEGIN
+  UPDATE inventory_summary SET expired_items = expired_items - 1
+  WHERE scope = 'total' AND scope_id = 0;
+END;
+
+-- Expiry timeline rollup: quantity + batch count per expiry month, moved
+-- between months by triggers as batches are written (batch counts per
+-- category for the category chart live in inventory_summary).
+CREATE TABLE IF NOT EXISTS expiry_month_rollup(
+    month TEXT PRIMARY KEY,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    batches INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS rollup_batch_insert
+AFTER INSERT ON batches
+WHEN NEW.expiry_day IS NOT NULL
+BEGIN
+  INSERT INTO expiry_month_rollup(month, quantity, batches)
+  VALUES (strftime('%Y-%m', NEW.expiry_date), COALESCE(NEW.quantity, 0), 1)
+  ON CONFLICT(month) DO UPDATE SET
+    quantity = quantity + excluded.quantity,
+    batches = batches + excluded.batches;
+END;
+
+CREATE TRIGGER IF NOT EXISTS rollup_batch_update
+AFTER UPDATE OF quantity, expiry_date ON batches
+BEGIN
+  INSERT INTO expiry_month_rollup(month, quantity, batches)
+  SELECT strftime('%Y-%m', OLD.expiry_date), -COALESCE(OLD.quantity, 0), -1
+  WHERE OLD.expiry_day IS NOT NULL
+  UNION ALL
+  SELECT strftime('%Y-%m', NEW.expiry_date), COALESCE(NEW.quantity, 0), 1
+  WHERE NEW.expiry_day IS NOT NULL
+  ON CONFLICT(month) DO UPDATE SET
+    quantity = quantity + excluded.quantity,
+    batches = batches + excluded.batches;
+END;
+
+CREATE TRIGGER IF NOT EXISTS rollup_batch_delete
+AFTER DELETE ON batches
+WHEN OLD.expiry_day IS NOT NULL
+BEGIN
+  UPDATE expiry_month_rollup
+  SET quantity = quantity - COALESCE(OLD.quantity, 0), batches = batches - 1
+  WHERE month = strftime('%Y-%m', OLD.expiry_date);
 END;
+
+-- Full-text search over medicine name/description/category + batch numbers
+CREATE VIRTUAL TABLE IF NOT EXISTS medicine_search USING fts5(
+    name,
+    description,
+    category,
+    batch_nos,
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS search_medicine_insert
+AFTER INSERT ON medicines
+BEGIN
+  INSERT INTO medicine_search(rowid, name, description, category, batch_nos)
+  SELECT NEW.id, NEW.name, COALESCE(NEW.description, ''),
+         COALESCE((SELECT name FROM categories WHERE id = NEW.category_id), ''), '';
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_medicine_update
+AFTER UPDATE OF name, description, category_id ON medicines
+BEGIN
+  UPDATE medicine_search
+  SET name = NEW.name,
+      description = COALESCE(NEW.description, ''),
+      category = COALESCE((SELECT name FROM categories WHERE id = NEW.category_id), '')
+  WHERE rowid = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_medicine_delete
+AFTER DELETE ON medicines
+BEGIN
+  DELETE FROM medicine_search WHERE rowid = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_category_update
+AFTER UPDATE OF name ON categories
+BEGIN
+  UPDATE medicine_search SET category = NEW.name
+  WHERE rowid IN (SELECT id FROM medicines WHERE category_id = NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_batch_insert
+AFTER INSERT ON batches
+BEGIN
+  UPDATE medicine_search
+  SET batch_nos = COALESCE((SELECT group_concat(batch_no, ' ') FROM batches WHERE medicine_id = NEW.medicine_id), '')
+  WHERE rowid = NEW.medicine_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_batch_update
+AFTER UPDATE OF batch_no, medicine_id ON batches
+BEGIN
+  UPDATE medicine_search
+  SET batch_nos = COALESCE((SELECT group_concat(batch_no, ' ') FROM batches WHERE medicine_id = medicine_search.rowid), '')
+  WHERE rowid IN (OLD.medicine_id, NEW.medicine_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_batch_delete
+AFTER DELETE ON batches
+BEGIN
+  UPDATE medicine_search
+  SET batch_nos = COALESCE((SELECT group_concat(batch_no, ' ') FROM batches WHERE medicine_id = OLD.medicine_id), '')
+  WHERE rowid = OLD.medicine_id;
+END;
+
 """
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.executescript(SCHEMA)
-
-    # Seed default categories if empty
-    cur.execute("SELECT COUNT(*) FROM categories")
-    if cur.fetchone()[0] == 0:
-        cur.executemany(
-            "INSERT INTO categories(name) VALUES (?)",
-            [
-                ("Tablet",),
-                ("Syrup",),
-                ("Injection",),
-                ("Ointment",)
-            ]
-        )
+# Expiry dates are stored as ISO text; expiry_day is the same date as an
+# integer Julian day number (NULL when the text is not a valid date) so
+# range filters compare a bare indexed column instead of DATE(expiry_date).
+EXPIRY_DAY_COLUMN = """
+ALTER TABLE batches ADD COLUMN expiry_day INTEGER
+GENERATED ALWAYS AS (CAST(julianday(date(expiry_date)) AS INTEGER)) VIRTUAL
+"""
+
+EXPIRY_SCHEMA = """
+-- canonicalize parseable dates (e.g. '2025-01-05 00:00') to YYYY-MM-DD
+UPDATE batches SET expiry_date = date(expiry_date)
+WHERE expiry_date IS NOT NULL
+  AND date(expiry_date) IS NOT NULL
+  AND expiry_date != date(expiry_date);
+
+CREATE INDEX IF NOT EXISTS idx_batch_expiry_day ON batches(expiry_day, medicine_id);
+"""
+
+# expired_items holds one row per expired batch. Write paths flag batches
+# stored with a past expiry (or un-flag unprocessed ones moved into the
+# future); batches that expire by the passage of time are picked up by
+# database/sweeper.py, which records each run in expiry_sweeps.
+EXPIRY_SWEEP_SCHEMA = """
+DELETE FROM expired_items
+WHERE id NOT IN (SELECT MIN(id) FROM expired_items GROUP BY batch_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_expired_batch ON expired_items(batch_id);
+
+CREATE TABLE IF NOT EXISTS expiry_sweeps(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ran_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    from_day INTEGER,
+    to_day INTEGER NOT NULL,
+    scanned INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0
+);
+
+DROP TRIGGER IF EXISTS detect_expiry_on_insert;
+DROP TRIGGER IF EXISTS detect_expiry_on_update;
+
+CREATE TRIGGER detect_expiry_on_insert
+AFTER INSERT ON batches
+WHEN NEW.expiry_day < CAST(julianday('now', 'start of day') AS INTEGER)
+BEGIN
+  INSERT OR IGNORE INTO expired_items(batch_id, expired_on)
+  VALUES (NEW.id, DATE(NEW.expiry_day + 0.5));
+END;
+
+CREATE TRIGGER detect_expiry_on_update
+AFTER UPDATE OF expiry_date ON batches
+WHEN NEW.expiry_day < CAST(julianday('now', 'start of day') AS INTEGER)
+BEGIN
+  INSERT OR IGNORE INTO expired_items(batch_id, expired_on)
+  VALUES (NEW.id, DATE(NEW.expiry_day + 0.5));
+END;
+
+CREATE TRIGGER clear_expiry_on_update
+AFTER UPDATE OF expiry_date ON batches
+WHEN NEW.expiry_day IS NULL OR NEW.expiry_day >= CAST(julianday('now', 'start of day') AS INTEGER)
+BEGIN
+  DELETE FROM expired_items WHERE batch_id = NEW.id AND processed = 0;
+END;
+"""
+
+def migrate_expiry_day(conn):
+    """Add batches.expiry_day (+ index) to databases that lack it."""
+    columns = [r[1] for r in conn.execute("PRAGMA table_xinfo(batches)")]
+    if "expiry_day" in columns:
+        return False
+    conn.execute(EXPIRY_DAY_COLUMN)
+    conn.executescript(EXPIRY_SCHEMA)
+    return True
+
+# FEFO dispensing reads one medicine's batches in expiry_day order
+FEFO_INDEX = "CREATE INDEX IF NOT EXISTS idx_batch_medicine_expiry_day ON batches(medicine_id, expiry_day);"
+
+def migrate_fefo_index(conn):
+    """Index (medicine_id, expiry_day) for per-medicine FEFO reads."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_batch_medicine_expiry_day'").fetchone():
+        return False
+    conn.execute(FEFO_INDEX)
+    return True
+
+# Highest activity_log id ever moved to the archive (database/retention.py
+# raises it in the same transaction as each chunk). Readers that tail the
+# log by id compare it with their own position: if it is ahead, rows they
+# have not read yet may be gone, whatever table's hot window took them.
+LOG_ARCHIVE_MARK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_archive_mark(
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    archived_through INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO log_archive_mark(id, archived_through) VALUES (1, 0);
+"""
+
+def migrate_log_archive_mark(conn):
+    """Add the log_archive_mark row that retention raises as it archives."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'log_archive_mark'").fetchone():
+        return False
+    conn.executescript(LOG_ARCHIVE_MARK_SCHEMA)
+    return True
+
+def migrate_expiry_sweeper(conn):
+    """Dedupe expired_items, make batch_id unique and install sweep-aware triggers."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_expired_batch'").fetchone():
+        return False
+    conn.executescript(EXPIRY_SWEEP_SCHEMA)
+    return True
+
+REBUILD_SEARCH = """
+DELETE FROM medicine_search;
+INSERT INTO medicine_search(rowid, name, description, category, batch_nos)
+SELECT m.id, m.name, COALESCE(m.description, ''), COALESCE(c.name, ''),
+       COALESCE((SELECT group_concat(batch_no, ' ') FROM batches WHERE medicine_id = m.id), '')
+FROM medicines m
+LEFT JOIN categories c ON c.id = m.category_id;
+"""
+
+def rebuild_search_index(conn):
+    conn.executescript(REBUILD_SEARCH)
+
+# Recomputes inventory_summary from the base tables (recovery + verification)
+SUMMARY_FROM_SCRATCH = """
+SELECT 'total' AS scope, 0 AS scope_id, NULL AS category_id,
+       (SELECT COUNT(*) FROM medicines) AS medicines,
+       (SELECT COUNT(*) FROM batches) AS batches,
+       (SELECT COALESCE(SUM(quantity), 0) FROM batches) AS quantity,
+       (SELECT COUNT(*) FROM expired_items) AS expired_items
+UNION ALL
+SELECT 'category', k.cid, NULL,
+       (SELECT COUNT(*) FROM medicines m WHERE COALESCE(m.category_id, 0) = k.cid),
+       (SELECT COUNT(*) FROM batches b JOIN medicines m ON m.id = b.medicine_id
+        WHERE COALESCE(m.category_id, 0) = k.cid),
+       (SELECT COALESCE(SUM(b.quantity), 0) FROM batches b JOIN medicines m ON m.id = b.medicine_id
+        WHERE COALESCE(m.category_id, 0) = k.cid),
+       0
+FROM (SELECT id AS cid FROM categories
+      UNION SELECT COALESCE(category_id, 0) FROM medicines) k
+UNION ALL
+SELECT 'medicine', m.id, COALESCE(m.category_id, 0), 0,
+       COUNT(b.id), COALESCE(SUM(b.quantity), 0), 0
+FROM medicines m
+LEFT JOIN batches b ON b.medicine_id = m.id
+GROUP BY m.id
+"""
+
+def rebuild_inventory_summary(conn):
+    conn.execute("DELETE FROM inventory_summary")
+    conn.execute(
+        "INSERT INTO inventory_summary"
+        "(scope, scope_id, category_id, medicines, batches, quantity, expired_items) "
+        + SUMMARY_FROM_SCRATCH
+    )
+    conn.commit()
+
+EXPIRY_ROLLUP_FROM_SCRATCH = """
+SELECT strftime('%Y-%m', expiry_date) AS month,
+       COALESCE(SUM(quantity), 0) AS quantity,
+       COUNT(*) AS batches
+FROM batches
+WHERE expiry_day IS NOT NULL
+GROUP BY month
+"""
 
+def rebuild_expiry_rollup(conn):
+    conn.execute("DELETE FROM expiry_month_rollup")
+    conn.execute("INSERT INTO expiry_month_rollup(month, quantity, batches) " + EXPIRY_ROLLUP_FROM_SCRATCH)
     conn.commit()
-    conn.close()
+
+def verify_expiry_rollup(conn):
+    """Months where the maintained rollup disagrees with a fresh recompute."""
+    cur = conn.execute(f"""
+        SELECT 'missing', * FROM (
+            SELECT * FROM ({EXPIRY_ROLLUP_FROM_SCRATCH})
+            EXCEPT SELECT * FROM expiry_month_rollup WHERE batches != 0
+        )
+        UNION ALL
+        SELECT 'unexpected', * FROM (
+            SELECT * FROM expiry_month_rollup WHERE batches != 0
+            EXCEPT SELECT * FROM ({EXPIRY_ROLLUP_FROM_SCRATCH})
+        )
+    """)
+    return cur.fetchall()
+
+def verify_inventory_summary(conn):
+    """Rows where the maintained summary disagrees with a fresh recompute.
+
+    All-zero category rows are left out on both sides: the triggers keep
+    the uncategorized row (scope_id 0) once its last medicine is deleted
+    or recategorized, while the recompute only lists it while in use.
+    """
+    columns = "scope, scope_id, medicines, batches, quantity, expired_items"
+    nonzero = "NOT (scope = 'category' AND medicines = 0 AND batches = 0 AND quantity = 0)"
+    cur = conn.execute(f"""
+        SELECT 'missing', {columns} FROM (
+            SELECT {columns} FROM ({SUMMARY_FROM_SCRATCH}) WHERE {nonzero}
+            EXCEPT SELECT {columns} FROM inventory_summary WHERE {nonzero}
+        )
+        UNION ALL
+        SELECT 'unexpected', {columns} FROM (
+            SELECT {columns} FROM inventory_summary WHERE {nonzero}
+            EXCEPT SELECT {columns} FROM ({SUMMARY_FROM_SCRATCH}) WHERE {nonzero}
+        )
+    """)
+    return cur.fetchall()
+
+def init_db(path=DB_PATH):
+    """Bring the database at `path` up to the latest schema version.
+
+    A single PRAGMA user_version read when it is already current; see
+    database/migrations.py for the ordered steps.
+    """
+    from database.migrations import migrate
+
+    return migrate(path)
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Initialize or maintain the Medi-Vault database")
+    parser.add_argument("--rebuild-summary", action="store_true",
+                        help="recompute inventory_summary + expiry_month_rollup from the base tables")
+    parser.add_argument("--verify-summary", action="store_true",
+                        help="report summary/rollup rows that disagree with a recompute")
+    parser.add_argument("--check-plans", action="store_true",
+                        help="EXPLAIN QUERY PLAN the expiry range queries; exit 1 on a table scan")
+    args = parser.parse_args()
+
     init_db()
     print(f"Database initialized at: {DB_PATH}")
+
+    if args.verify_summary or args.rebuild_summary:
+        conn = sqlite3.connect(DB_PATH)
+        if args.verify_summary:
+            drift = verify_inventory_summary(conn)
+            for row in drift:
+                print("  ", *row)
+            print(f"inventory_summary: {len(drift)} drifted row(s)")
+            drift = verify_expiry_rollup(conn)
+            for row in drift:
+                print("  ", *row)
+            print(f"expiry_month_rollup: {len(drift)} drifted row(s)")
+        if args.rebuild_summary:
+            rebuild_inventory_summary(conn)
+            rebuild_expiry_rollup(conn)
+            print("inventory_summary + expiry_month_rollup rebuilt")
+        conn.close()
+
+    if args.check_plans:
+        from models.batches import check_expiry_plans
+
+        conn = sqlite3.connect(DB_PATH)
+        failures = 0
+        for name, plan, uses_index in check_expiry_plans(conn):
+            print(f"{'ok  ' if uses_index else 'SCAN'} {name}: {' | '.join(plan)}")
+            failures += not uses_index
+        conn.close()
+        raise SystemExit(1 if failures else 0)
@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+import time
+
+from database.connection import get_conn, pool
+from models.batches import today_day
+
+log = logging.getLogger(__name__)
+
+# Each run only looks at batches whose expiry_day crossed into the past
+# since the previous run's high-water mark (expiry_sweeps.to_day), as an
+# index range scan on idx_batch_expiry_day. Requests only kick off the
+# day's first run on a background thread; they never wait for it, and a
+# failed run is logged and retried by a request RETRY_AFTER seconds later.
+SWEEP_INTERVAL = int(os.environ.get("MEDIVAULT_SWEEP_INTERVAL", 0))
+RETRY_AFTER = 60
+
+_last_swept_for = None
+_lock = threading.Lock()
+_background = None
+_failed_at = None
+_background_lock = threading.Lock()
+
+def high_water_mark(conn):
+    row = conn.execute("SELECT MAX(to_day) FROM expiry_sweeps").fetchone()
+    return row[0]
+
+def sweep(today=None):
+    """Flag batches that expired since the last run; returns the run record."""
+    today = today or today_day()
+    conn = pool.acquire()
+    try:
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        hwm = high_water_mark(conn)
+        to_day = today - 1
+        if hwm is not None and hwm >= to_day:
+            conn.rollback()
+            return {"from_day": hwm, "to_day": hwm, "scanned": 0, "inserted": 0, "seconds": 0.0, "skipped": True}
+
+        lower = "expiry_day > ? AND " if hwm is not None else "expiry_day IS NOT NULL AND "
+        params = ([hwm] if hwm is not None else []) + [to_day]
+        (scanned,) = conn.execute(
+            f"SELECT COUNT(*) FROM batches WHERE {lower} expiry_day <= ?", params
+        ).fetchone()
+        cur = conn.execute(f"""
+            INSERT OR IGNORE INTO expired_items(batch_id, expired_on)
+            SELECT id, DATE(expiry_day + 0.5) FROM batches
+            WHERE {lower} expiry_day <= ?
+        """, params)
+        inserted = cur.rowcount
+        seconds = round(time.perf_counter() - started, 6)
+        conn.execute(
+            "INSERT INTO expiry_sweeps(from_day, to_day, scanned, inserted, seconds) VALUES (?, ?, ?, ?, ?)",
+            (hwm, to_day, scanned, inserted, seconds),
+        )
+        conn.commit()
+        return {"from_day": hwm, "to_day": to_day, "scanned": scanned, "inserted": inserted,
+                "seconds": seconds, "skipped": False}
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def maybe_sweep():
+    """Run sweep() at most once per day per process (cheap to call per request)."""
+    global _last_swept_for
+    today = today_day()
+    if _last_swept_for == today:
+        return None
+    with _lock:
+        if _last_swept_for == today:
+            return None
+        result = sweep(today)
+        _last_swept_for = today
+        return result
+
+def _sweep_logged():
+    global _failed_at
+    try:
+        maybe_sweep()
+    except Exception:  # keep serving; a later request or tick retries
+        _failed_at = time.monotonic()
+        log.exception("expiry sweep failed")
+
+def maybe_sweep_in_background():
+    """Start maybe_sweep() on a daemon thread if today's run is due; never raises."""
+    global _background
+    if _last_swept_for == today_day():
+        return None
+    if _failed_at is not None and time.monotonic() - _failed_at < RETRY_AFTER:
+        return None
+    with _background_lock:
+        if _background is None or not _background.is_alive():
+            _background = threading.Thread(target=_sweep_logged, name="expiry-sweep", daemon=True)
+            _background.start()
+        return _background
+
+def recent_sweeps(limit=20):
+    conn = get_conn()
+    try:
+        return [dict(r) for r in conn.execute(
+            "SELECT * FROM expiry_sweeps ORDER BY id DESC LIMIT ?", (limit,)
+        )]
+    finally:
+        conn.close()
+
+def start_scheduler(interval=SWEEP_INTERVAL):
+    """Background thread calling maybe_sweep() every `interval` seconds."""
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            _sweep_logged()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="expiry-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    import json
+
+    from database.setup import init_db
+
+    init_db()
+    print(json.dumps(sweep(), indent=2))
@@ -0,0 +1,179 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from database.connection import get_conn, pool
+
+# --------------------------------------------------------
+# Single-writer queue with group commit
+# --------------------------------------------------------
+# Write jobs are callables taking a connection; they run statements and
+# must not commit. One writer thread per process drains the queue and
+# runs whatever is waiting (up to max_batch, lingering max_wait seconds
+# for stragglers) inside one BEGIN IMMEDIATE transaction, each job under
+# its own SAVEPOINT so a failing job is rolled back alone. Callers get
+# their result only after the shared COMMIT.
+#
+# A caller waits at most MEDIVAULT_WRITE_TIMEOUT seconds for its result;
+# a job still queued by then is dropped. If the writer cannot get a
+# connection, that batch fails and the thread carries on with the next.
+#
+# With MEDIVAULT_WRITE_QUEUE=0 each job instead runs and commits on the
+# caller's thread (one transaction per request), the previous behaviour.
+#
+# Only request writes go through the queue. The expiry sweeper, bulk
+# import and unit_of_work() without a connection open their own
+# BEGIN IMMEDIATE and rely on busy_timeout to take turns with it.
+ENABLED = os.environ.get("MEDIVAULT_WRITE_QUEUE", "1") != "0"
+MAX_BATCH = int(os.environ.get("MEDIVAULT_WRITE_BATCH", 64))
+MAX_WAIT = float(os.environ.get("MEDIVAULT_WRITE_WAIT_MS", 2)) / 1000
+TIMEOUT = float(os.environ.get("MEDIVAULT_WRITE_TIMEOUT", 30))
+
+class WriteQueue:
+    def __init__(self, pool, enabled=ENABLED, max_batch=MAX_BATCH, max_wait=MAX_WAIT, timeout=TIMEOUT):
+        self.pool = pool
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self.jobs = 0
+        self.commits = 0
+        self.failed_jobs = 0
+        self.failed_batches = 0
+        self.timeouts = 0
+        self.largest_batch = 0
+
+    def start(self):
+        """Start the writer thread (again, in a forked child process)."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, job, *args):
+        """Queue job(conn, *args); returns a Future resolved after COMMIT."""
+        future = Future()
+        if not self.enabled:
+            self._run_direct(future, job, args)
+            return future
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            self.start()
+        self._queue.put((future, job, args))
+        return future
+
+    def run(self, job, *args, timeout=None):
+        """submit() and wait; raises TimeoutError after `timeout` (default self.timeout) seconds."""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(job, *args)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()  # still queued: the writer skips it
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"write not committed within {timeout}s") from None
+
+    def _run_direct(self, future, job, args):
+        # on the caller's thread: borrow the request's connection rather than a second pool slot
+        conn = get_conn() if self.pool is pool else self.pool.acquire()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = job(conn, *args)
+            conn.commit()
+        except BaseException as exc:
+            if conn.in_transaction:
+                conn.rollback()
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+        finally:
+            conn.close()
+        with self._lock:
+            self.jobs += 1
+            self.commits += 1
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # drop jobs whose caller gave up waiting
+        return [item for item in batch if item[0].set_running_or_notify_cancel()]
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        conn = None
+        committed = False
+        outcomes = []
+        try:
+            conn = self.pool.acquire()
+            conn.execute("BEGIN IMMEDIATE")
+            for future, job, args in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = job(conn, *args)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, None, exc))
+                else:
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, result, None))
+            conn.commit()
+            committed = True
+        except Exception as exc:
+            # no connection, or BEGIN/COMMIT failed (e.g. busy past busy_timeout): nothing was written
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            outcomes = [(future, None, exc) for future, _, _ in batch]
+        finally:
+            if conn is not None:
+                conn.close()
+
+        with self._lock:
+            self.jobs += len(batch)
+            if committed:
+                self.commits += 1
+            else:
+                self.failed_batches += 1
+            self.failed_jobs += sum(1 for _, _, exc in outcomes if exc is not None)
+            self.largest_batch = max(self.largest_batch, len(batch))
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "pending": self._queue.qsize() if self._queue is not None else 0,
+                "jobs": self.jobs,
+                "commits": self.commits,
+                "jobs_per_commit": round(self.jobs / self.commits, 2) if self.commits else None,
+                "largest_batch": self.largest_batch,
+                "failed_jobs": self.failed_jobs,
+                "failed_batches": self.failed_batches,
+                "timeouts": self.timeouts,
+            }
+
+writer = WriteQueue(pool)
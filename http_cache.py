@@ -0,0 +1,126 @@
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import Response, make_response, request, session
+
+from models.cache import request_generation
+
+# --------------------------------------------------------
+# Conditional GET + rendered-response cache
+# --------------------------------------------------------
+# A page's strong ETag is a hash of the endpoint, its arguments, the
+# database change generation and today's date. If-None-Match hits get a
+# 304 before the view (and its queries) run; otherwise a rendered body
+# cached under the same ETag is replayed, or the view runs and is stored.
+MAX_BODY_BYTES = int(os.environ.get("MEDIVAULT_RESPONSE_CACHE_BYTES", 16 * 1024 * 1024))
+
+class ResponseCache:
+    """LRU of rendered bodies keyed by ETag, bounded by total bytes."""
+
+    def __init__(self, max_bytes=MAX_BODY_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def get(self, etag):
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(etag)
+            self.hits += 1
+            return entry
+
+    def put(self, etag, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if etag in self._entries:
+                return
+            self._entries[etag] = (body, mimetype)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (old_body, _) = self._entries.popitem(last=False)
+                self._bytes -= len(old_body)
+                self.evictions += 1
+
+    def get_or_store(self, etag, build):
+        """Replay the body cached under etag, or build() a response and cache it if it is a plain 200."""
+        entry = self.get(etag)
+        if entry is not None:
+            body, mimetype = entry
+            return Response(body, mimetype=mimetype)
+        resp = build()
+        if resp.status_code == 200 and not resp.is_streamed:
+            self.put(etag, resp.get_data(), resp.mimetype)
+        return resp
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+            }
+
+response_cache = ResponseCache()
+
+def compute_etag(generation=None):
+    generation = request_generation() if generation is None else generation
+    parts = [
+        request.endpoint or "",
+        repr(sorted((request.view_args or {}).items())),
+        repr(sorted(request.args.items(multi=True))),
+        str(generation),
+        datetime.utcnow().date().isoformat(),
+    ]
+    return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()
+
+def conditional(cache_control="private, no-cache", store=True):
+    """Serve a GET view with a strong ETag, 304s and an optional body cache."""
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # pages carrying one-off flash messages are never cached or 304'd
+            if request.method != "GET" or session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            etag = compute_etag()
+            if request.if_none_match.contains(etag):
+                response_cache.count_not_modified()
+                resp = Response(status=304)
+            else:
+                def build():
+                    return make_response(view(*args, **kwargs))
+
+                resp = response_cache.get_or_store(etag, build) if store else build()
+                if resp.status_code != 200 or resp.is_streamed:
+                    return resp
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = cache_control
+            return resp
+        return wrapper
+    return decorate
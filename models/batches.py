@@ -1,21 +1,117 @@
+import re
+from datetime import date, datetime
+
 from . import get_conn
+from .cache import cached
+from .unit_of_work import unit_of_work
+
+# date.toordinal() + JULIAN_OFFSET == batches.expiry_day for the same date
+JULIAN_OFFSET = 1721424
+
+# a batch is "expiring soon" within this many days of today
+SOON_DAYS = 30
+
+# Expiry range queries: every filter is a bare range on the indexed
+# batches.expiry_day column so SQLite can SEARCH idx_batch_expiry_day.
+# Row lists are ordered by that index's full key (expiry_day,
+# medicine_id, then rowid), so ties come back in one fixed order without
+# a sort step; models.expiry_index orders its copy the same way.
+COUNT_EXPIRING_SQL = "SELECT COUNT(*) FROM batches WHERE expiry_day BETWEEN ? AND ?"
+COUNT_EXPIRED_SQL = "SELECT COUNT(*) FROM batches WHERE expiry_day < ?"
+SOON_TO_EXPIRE_SQL = """
+    SELECT b.*, m.name as med_name
+    FROM batches b
+    JOIN medicines m ON m.id = b.medicine_id
+    WHERE b.expiry_day BETWEEN ? AND ?
+    ORDER BY b.expiry_day, b.medicine_id, b.id
+"""
+EXPIRED_SQL = """
+    SELECT b.*, m.name as med_name
+    FROM batches b
+    JOIN medicines m ON m.id = b.medicine_id
+    WHERE b.expiry_day < ?
+    ORDER BY b.expiry_day, b.medicine_id, b.id
+"""
+UPCOMING_SQL = """
+    SELECT b.id, m.name AS medicine_name, b.batch_no, b.quantity, b.expiry_date
+    FROM batches b
+    JOIN medicines m ON m.id = b.medicine_id
+    WHERE b.expiry_day BETWEEN ? AND ?
+    ORDER BY b.expiry_day, b.medicine_id, b.id
+"""
+
+EXPIRY_RANGE_QUERIES = {
+    "count_expiring": (COUNT_EXPIRING_SQL, 2),
+    "count_expired": (COUNT_EXPIRED_SQL, 1),
+    "soon_to_expire": (SOON_TO_EXPIRE_SQL, 2),
+    "get_expired": (EXPIRED_SQL, 1),
+    "api_upcoming": (UPCOMING_SQL, 2),
+}
+
+# precomputed by the rollup_batch_* triggers: one row per expiry month
+EXPIRY_TIMELINE_SQL = """
+    SELECT month, quantity AS total
+    FROM expiry_month_rollup
+    WHERE batches > 0
+    ORDER BY month
+"""
+
+def day_number(d):
+    """Integer Julian day for a date, matching batches.expiry_day."""
+    return d.toordinal() + JULIAN_OFFSET
+
+def today_day():
+    return day_number(datetime.utcnow().date())
+
+# YYYY-MM-DD, optionally followed by a time of day (dropped), and nothing else
+EXPIRY_FORMAT = re.compile(r"(\d{4}-\d{2}-\d{2})(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?")
+
+def normalize_expiry(value):
+    """Validate an expiry date, returning it as YYYY-MM-DD (or None if blank)."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    match = EXPIRY_FORMAT.fullmatch(value.strip()) if isinstance(value, str) else None
+    if match is not None:
+        try:
+            return datetime.strptime(match.group(1), "%Y-%m-%d").date().isoformat()
+        except ValueError:  # well-formed but not a calendar date, e.g. 2025-02-30
+            pass
+    raise ValueError(f"Invalid expiry date: {value!r} (expected YYYY-MM-DD)")
+
+def check_expiry_plans(conn):
+    """EXPLAIN QUERY PLAN every expiry range query.
+
+    Returns (name, plan_details, uses_index) tuples; uses_index is True when
+    batches is searched through idx_batch_expiry_day rather than scanned.
+    """
+    results = []
+    for name, (sql, nparams) in EXPIRY_RANGE_QUERIES.items():
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, [0] * nparams)]
+        uses_index = any(
+            "idx_batch_expiry_day" in step and step.startswith("SEARCH") for step in plan
+        ) and not any(step.startswith("SCAN b") or step == "SCAN batches" for step in plan)
+        results.append((name, plan, uses_index))
+    return results
 
 def add_batch(medicine_id, batch_no, quantity, expiry_date):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, ?, ?, ?)",
-                (medicine_id, batch_no, quantity, expiry_date))
-    conn.commit()
-    bid = cur.lastrowid
-    conn.close()
-    return bid
+    with unit_of_work() as uow:
+        return uow.add_batch(medicine_id, batch_no, quantity, expiry_date)
+
+def add_batches_many(batches):
+    """Insert batch dicts in one transaction; returns their ids."""
+    with unit_of_work() as uow:
+        return uow.add_batches_many(batches)
 
 def delete_batch(batch_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM batches WHERE id=?", (batch_id,))
-    conn.commit()
-    conn.close()
+    with unit_of_work() as uow:
+        uow.delete_batch(batch_id)
+
+def delete_batches_many(batch_ids):
+    """Delete batches in one transaction; returns how many existed."""
+    with unit_of_work() as uow:
+        return uow.delete_batches_many(batch_ids)
 
 def get_batches_for_medicine(mid):
     conn = get_conn()
@@ -28,13 +124,8 @@ def get_batches_for_medicine(mid):
 def soon_to_expire(days=30):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT b.*, m.name as med_name
-        FROM batches b
-        JOIN medicines m ON m.id = b.medicine_id
-        WHERE DATE(b.expiry_date) BETWEEN DATE('now') AND DATE('now', ?)
-        ORDER BY b.expiry_date
-    """, (f"+{days} day",))
+    today = today_day()
+    cur.execute(SOON_TO_EXPIRE_SQL, (today, today + days))
     data = cur.fetchall()
     conn.close()
     return data
@@ -42,27 +133,16 @@ def soon_to_expire(days=30):
 def get_expired():
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT b.*, m.name as med_name
-        FROM batches b
-        JOIN medicines m ON m.id = b.medicine_id
-        WHERE DATE(b.expiry_date) < DATE('now')
-        ORDER BY b.expiry_date
-    """)
+    cur.execute(EXPIRED_SQL, (today_day(),))
     data = cur.fetchall()
     conn.close()
     return data
 
+@cached()
 def get_expiry_timeline():
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT STRFTIME('%Y-%m', expiry_date) AS month, COALESCE(SUM(quantity),0) AS total
-        FROM batches
-        WHERE expiry_date IS NOT NULL
-        GROUP BY month
-        ORDER BY month
-    """)
+    cur.execute(EXPIRY_TIMELINE_SQL)
     data = cur.fetchall()
     conn.close()
     return data
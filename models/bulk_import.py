@@ -0,0 +1,188 @@
+import csv
+import io
+import json
+import time
+
+from . import get_conn
+from .batches import normalize_expiry
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+FIELDS = ("medicine", "category", "description", "batch_no", "quantity", "expiry")
+
+# accepted spellings for each field in CSV headers / JSON keys
+ALIASES = {
+    "medicine": ("medicine", "medicine_name", "name"),
+    "category": ("category", "category_name"),
+    "description": ("description",),
+    "batch_no": ("batch_no", "batch"),
+    "quantity": ("quantity", "qty"),
+    "expiry": ("expiry", "expiry_date"),
+}
+
+def read_rows(stream, fmt):
+    """Yield (line_no, dict) from a text stream of CSV or JSONL records."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_no, exc
+                continue
+            yield line_no, record if isinstance(record, dict) else ValueError("record must be a JSON object")
+    else:
+        raise ValueError("format must be csv or jsonl")
+
+def _field(record, name):
+    for key in ALIASES[name]:
+        value = record.get(key)
+        if value not in (None, ""):
+            return value.strip() if isinstance(value, str) else value
+    return None
+
+def validate(record):
+    """Normalize one record or raise ValueError describing the problem."""
+    if isinstance(record, Exception):
+        raise ValueError(f"unparseable record: {record}")
+    medicine = _field(record, "medicine")
+    if not medicine:
+        raise ValueError("medicine name is required")
+    quantity = _field(record, "quantity")
+    try:
+        quantity = int(quantity or 0)
+    except (TypeError, ValueError):
+        raise ValueError(f"quantity must be a whole number, got {quantity!r}")
+    if quantity < 0:
+        raise ValueError("quantity must not be negative")
+    return {
+        "medicine": str(medicine),
+        "category": _field(record, "category"),
+        "description": _field(record, "description") or "",
+        "batch_no": _field(record, "batch_no"),
+        "quantity": quantity,
+        "expiry": normalize_expiry(_field(record, "expiry")),
+    }
+
+class Importer:
+    """Streams records into medicines/batches with chunked transactions.
+
+    Category and medicine names resolve through in-memory name -> id maps
+    (case-insensitive), loaded once; unknown names are created on the fly.
+    Batches are buffered and written with executemany() once per chunk.
+    chunk_size=0 runs the whole import as a single transaction.
+    """
+
+    def __init__(self, conn, chunk_size=CHUNK_SIZE):
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self.categories = {
+            name.lower(): cid for cid, name in conn.execute("SELECT id, name FROM categories")
+        }
+        self.medicines = {}
+        for mid, name in conn.execute("SELECT id, name FROM medicines ORDER BY id"):
+            self.medicines.setdefault(name.lower(), mid)
+        self.pending = []
+        self.stats = {
+            "rows_read": 0,
+            "batches_inserted": 0,
+            "medicines_created": 0,
+            "categories_created": 0,
+            "error_count": 0,
+            "errors": [],
+        }
+
+    def _category_id(self, name):
+        if not name:
+            return None
+        key = name.lower()
+        if key not in self.categories:
+            cur = self.conn.execute("INSERT INTO categories(name) VALUES (?)", (name,))
+            self.categories[key] = cur.lastrowid
+            self.stats["categories_created"] += 1
+        return self.categories[key]
+
+    def _medicine_id(self, row):
+        key = row["medicine"].lower()
+        if key not in self.medicines:
+            cur = self.conn.execute(
+                "INSERT INTO medicines(name, category_id, description) VALUES (?, ?, ?)",
+                (row["medicine"], self._category_id(row["category"]), row["description"]),
+            )
+            self.medicines[key] = cur.lastrowid
+            self.stats["medicines_created"] += 1
+        return self.medicines[key]
+
+    def _flush(self, commit=True):
+        if self.pending:
+            self.conn.executemany(
+                "INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, ?, ?, ?)",
+                self.pending,
+            )
+            self.stats["batches_inserted"] += len(self.pending)
+            self.pending = []
+        if commit and self.conn.in_transaction:
+            self.conn.commit()
+
+    def run(self, rows):
+        started = time.perf_counter()
+        try:
+            for line_no, record in rows:
+                self.stats["rows_read"] += 1
+                try:
+                    row = validate(record)
+                except ValueError as exc:
+                    self.stats["error_count"] += 1
+                    if len(self.stats["errors"]) < MAX_REPORTED_ERRORS:
+                        self.stats["errors"].append({"line": line_no, "error": str(exc)})
+                    continue
+
+                if not self.conn.in_transaction:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                mid = self._medicine_id(row)
+                if row["batch_no"] or row["quantity"] or row["expiry"]:
+                    self.pending.append((mid, row["batch_no"], row["quantity"], row["expiry"]))
+                if len(self.pending) >= (self.chunk_size or CHUNK_SIZE):
+                    self._flush(commit=bool(self.chunk_size))
+            self._flush()
+        except Exception:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            raise
+
+        elapsed = time.perf_counter() - started
+        self.stats["seconds"] = round(elapsed, 3)
+        self.stats["rows_per_second"] = round(self.stats["rows_read"] / elapsed, 1) if elapsed else None
+        return self.stats
+
+def import_stream(stream, fmt, chunk_size=CHUNK_SIZE):
+    """Import a text stream of CSV/JSONL records; returns the run report."""
+    rows = read_rows(stream, fmt)
+    conn = get_conn()
+    try:
+        return Importer(conn, chunk_size).run(rows)
+    finally:
+        conn.close()
+
+def import_file(path, fmt=None, chunk_size=CHUNK_SIZE):
+    fmt = fmt or ("jsonl" if str(path).endswith((".jsonl", ".ndjson")) else "csv")
+    with io.open(path, newline="", encoding="utf-8") as stream:
+        return import_stream(stream, fmt, chunk_size)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk import medicines and batches")
+    parser.add_argument("path", help="CSV or JSONL file (columns: " + ", ".join(FIELDS) + ")")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="rows per transaction; 0 = one transaction for the whole file")
+    args = parser.parse_args()
+
+    report = import_file(args.path, args.format, args.chunk_size)
+    print(json.dumps(report, indent=2))
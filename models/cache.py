@@ -0,0 +1,118 @@
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import g, has_request_context, request
+
+from . import get_conn
+
+# Analytics results are keyed on data_generation (bumped by triggers on
+# every inventory write) plus the current day, so a cached value is served
+# until a write happens or the date rolls over; TTL is a safety net.
+DEFAULT_TTL = float(os.environ.get("MEDIVAULT_CACHE_TTL", 300))
+MAX_ENTRIES = int(os.environ.get("MEDIVAULT_CACHE_ENTRIES", 256))
+
+def current_generation(conn=None):
+    own_conn = conn is None
+    conn = conn or get_conn()
+    row = conn.execute("SELECT generation FROM data_generation WHERE id = 1").fetchone()
+    if own_conn:
+        conn.close()
+    return row[0] if row else 0
+
+def request_generation():
+    """current_generation(), read once per GET request and kept on flask.g.
+
+    A GET does not write, so the ETag, the analytics cache and the expiry
+    index can all share one read. Other requests and background threads
+    read it fresh.
+    """
+    if not has_request_context() or request.method not in ("GET", "HEAD"):
+        return current_generation()
+    if "data_generation" not in g:
+        g.data_generation = current_generation()
+    return g.data_generation
+
+class AnalyticsCache:
+    """Thread-safe LRU + TTL cache scoped to a database change generation."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, key, compute, ttl=None, generation=None):
+        generation = request_generation() if generation is None else generation
+        full_key = (key, datetime.utcnow().date().toordinal())
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                # everything cached belongs to an older generation
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._generation = generation
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(full_key)
+                    self.hits += 1
+                    return value
+                del self._entries[full_key]
+                self.expirations += 1
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            if generation == self._generation:
+                self._entries[full_key] = (value, now + (self.ttl if ttl is None else ttl))
+                self._entries.move_to_end(full_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+analytics_cache = AnalyticsCache()
+
+def cached(ttl=None):
+    """Memoize a read-only analytics function in analytics_cache."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (fn.__module__, fn.__qualname__, args, tuple(sorted(kwargs.items())))
+            return analytics_cache.get_or_compute(key, lambda: fn(*args, **kwargs), ttl)
+        wrapper.uncached = fn
+        return wrapper
+    return decorate
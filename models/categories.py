@@ -1,4 +1,14 @@
 from . import get_conn
+from .cache import cached
+from .unit_of_work import unit_of_work
+
+# batch counts per category come from the trigger-maintained inventory_summary
+CATEGORY_DISTRIBUTION_SQL = """
+    SELECT c.name AS label, COALESCE(s.batches, 0) AS count
+    FROM categories c
+    LEFT JOIN inventory_summary s ON s.scope = 'category' AND s.scope_id = c.id
+    ORDER BY c.name
+"""
 
 def get_all_categories():
     conn = get_conn()
@@ -9,24 +19,22 @@ def get_all_categories():
     return data
 
 def create_category(name):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO categories(name) VALUES(?)", (name,))
-    conn.commit()
-    cid = cur.lastrowid
-    conn.close()
-    return cid
+    with unit_of_work() as uow:
+        return uow.create_category(name)
 
 def delete_category(cat_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM categories WHERE id=?", (cat_id,))
-    conn.commit()
-    conn.close()
+    with unit_of_work() as uow:
+        uow.delete_category(cat_id)
 
 def update_category(cat_id, new_name):
+    with unit_of_work() as uow:
+        uow.update_category(cat_id, new_name)
+
+@cached()
+def get_category_distribution():
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("UPDATE categories SET name=? WHERE id=?", (new_name, cat_id))
-    conn.commit()
+    cur.execute(CATEGORY_DISTRIBUTION_SQL)
+    data = cur.fetchall()
     conn.close()
+    return data
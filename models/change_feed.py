@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from database.retention import ARCHIVED_THROUGH_SQL
+
+from . import get_conn
+from .batches import COUNT_EXPIRED_SQL, COUNT_EXPIRING_SQL, EXPIRY_TIMELINE_SQL, today_day
+from .categories import CATEGORY_DISTRIBUTION_SQL
+from .medicines import HEADLINE_STATS_SQL
+from .views import ExpiryClassifier
+
+log = logging.getLogger(__name__)
+
+# Server-Sent Events fed by activity_log. One poller thread per process
+# reads log rows past its id watermark every POLL_INTERVAL seconds and
+# turns each tick into one chunk of compact events (batch/medicine
+# added, changed, deleted, with current quantities and the expiry
+# date/status exactly as the inventory page renders them) plus a "summary"
+# event: headline counters, category counts and the expiry timeline, all
+# read from trigger-maintained tables. Chunks go into a shared ring
+# buffer, and every connected client reads from that buffer, so SQLite
+# does the same work for one client or a hundred.
+#
+# Each row event carries its activity_log id as the SSE id. A client that
+# reconnects with Last-Event-ID (or ?after=) is replayed from SQLite if
+# the buffer no longer reaches back that far. If too much happened, or
+# rows it missed were archived (log_archive_mark is past its id), it
+# gets a "reset" event and reloads.
+POLL_INTERVAL = float(os.environ.get("MEDIVAULT_FEED_INTERVAL", 1))
+BUFFER_TICKS = int(os.environ.get("MEDIVAULT_FEED_BUFFER", 256))
+MAX_REPLAY = int(os.environ.get("MEDIVAULT_FEED_REPLAY", 5000))
+HEARTBEAT = 15
+ID_CHUNK = 500
+
+ACTIONS = {"INSERT": "added", "UPDATE": "changed", "DELETE": "deleted"}
+LOG_TAIL_SQL = """
+    SELECT id, action, table_name, record_id, details FROM activity_log
+    WHERE id > ? ORDER BY id LIMIT ?
+"""
+
+def _message(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def _lookup(conn, sql, ids):
+    found = {}
+    ids = list(ids)
+    for start in range(0, len(ids), ID_CHUNK):
+        chunk = ids[start:start + ID_CHUNK]
+        for row in conn.execute(sql.format(ids=",".join("?" * len(chunk))), chunk):
+            found[row[0]] = row
+    return found
+
+def render_events(conn, rows):
+    """SSE text for a run of activity_log rows, using current row state."""
+    batch_ids = {r["record_id"] for r in rows if r["table_name"] == "batches" and r["action"] != "DELETE"}
+    batches = _lookup(conn, """
+        SELECT id, medicine_id, batch_no, quantity, expiry_date FROM batches WHERE id IN ({ids})
+    """, batch_ids)
+    totals = _lookup(conn, """
+        SELECT scope_id, quantity FROM inventory_summary WHERE scope = 'medicine' AND scope_id IN ({ids})
+    """, {b["medicine_id"] for b in batches.values()})
+
+    classify = ExpiryClassifier(datetime.utcnow().date())  # same buckets as the rendered page
+    out = []
+    for r in rows:
+        action = ACTIONS.get(r["action"])
+        if action is None or r["table_name"] not in ("batches", "medicines"):
+            continue
+        if r["table_name"] == "medicines":
+            out.append(_message("medicine", {"action": action, "id": r["record_id"], "name": r["details"]}, r["id"]))
+        elif action == "deleted":
+            out.append(_message("batch", {"action": action, "id": r["record_id"], "batch_no": r["details"]}, r["id"]))
+        elif r["record_id"] in batches:  # otherwise deleted again later in this run
+            b = batches[r["record_id"]]
+            total = totals.get(b["medicine_id"])
+            expiry_display, status, status_label = classify(b["expiry_date"])
+            out.append(_message("batch", {
+                "action": action,
+                "id": b["id"],
+                "medicine_id": b["medicine_id"],
+                "batch_no": b["batch_no"],
+                "quantity": b["quantity"],
+                "expiry_date": b["expiry_date"],
+                "expiry_display": expiry_display,
+                "status": status,
+                "status_label": status_label,
+                "medicine_total": total["quantity"] if total is not None else None,
+            }, r["id"]))
+    return "".join(out)
+
+def render_summary(conn):
+    row = conn.execute(HEADLINE_STATS_SQL).fetchone()
+    totals = dict(row) if row is not None else {"medicines": 0, "batches": 0, "quantity": 0, "expired_items": 0}
+    today = today_day()
+    categories = conn.execute(CATEGORY_DISTRIBUTION_SQL).fetchall()
+    timeline = conn.execute(EXPIRY_TIMELINE_SQL).fetchall()
+    return _message("summary", {
+        "totals": totals,
+        "upcoming": conn.execute(COUNT_EXPIRING_SQL, (today, today + 30)).fetchone()[0],
+        "expired_batches": conn.execute(COUNT_EXPIRED_SQL, (today,)).fetchone()[0],
+        "categories": {"labels": [r["label"] or "Uncategorized" for r in categories],
+                       "counts": [r["count"] for r in categories]},
+        "timeline": {"labels": [r["month"] for r in timeline], "totals": [r["total"] for r in timeline]},
+    })
+
+def watermark():
+    """Newest activity_log id; pages hand it to the feed as ?after=.
+
+    Never below the archive mark, so a fully archived log does not send
+    every new client straight into a reset.
+    """
+    conn = get_conn()
+    try:
+        (newest,) = conn.execute("SELECT IFNULL(MAX(id), 0) FROM activity_log").fetchone()
+        (archived_through,) = conn.execute(ARCHIVED_THROUGH_SQL).fetchone()
+        return max(newest, archived_through)
+    finally:
+        conn.close()
+
+class ChangeFeed:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pid = None
+        self._thread = None
+        self.buffer = deque(maxlen=BUFFER_TICKS)  # (after_id, last_id, text) per tick
+        self.last_id = 0
+        self.epoch = 0  # bumped when the log is rewound (restore); clients start over
+        self.subscribers = 0
+        self.ticks = 0
+        self.replays = 0
+        self.resets = 0
+
+    def start(self):
+        with self._cond:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self.buffer.clear()
+            self.last_id = watermark()
+            self._thread = threading.Thread(target=self._poll, name="change-feed", daemon=True)
+            self._thread.start()
+
+    def _poll(self):
+        while True:
+            try:
+                self._tick()
+            except Exception:  # keep serving; the next tick retries
+                log.exception("change feed poll failed")
+            time.sleep(POLL_INTERVAL)
+
+    def _tick(self):
+        after = self.last_id
+        conn = get_conn()
+        try:
+            conn.execute("BEGIN")  # rows and summary from one snapshot
+            rows = conn.execute(LOG_TAIL_SQL, (after, MAX_REPLAY)).fetchall()
+            if not rows:
+                conn.commit()
+                return
+            text = render_events(conn, rows) + render_summary(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        with self._cond:
+            if self.last_id != after:
+                return  # reset() ran meanwhile
+            self.buffer.append((after, rows[-1]["id"], text))
+            self.last_id = rows[-1]["id"]
+            self.ticks += 1
+            self._cond.notify_all()
+
+    def reset(self):
+        """Forget buffered ticks and tell every client to reload, e.g. after a restore."""
+        with self._cond:
+            self.buffer.clear()
+            self.last_id = watermark()
+            self.epoch += 1
+            self._cond.notify_all()
+
+    def _replay(self, after):
+        """(text, last_id) for everything after `after`, or None if the client must reload."""
+        conn = get_conn()
+        try:
+            conn.execute("BEGIN")
+            (oldest,) = conn.execute("SELECT MIN(id) FROM activity_log").fetchone()
+            (archived_through,) = conn.execute(ARCHIVED_THROUGH_SQL).fetchone()
+            rows = conn.execute(LOG_TAIL_SQL, (after, MAX_REPLAY + 1)).fetchall()
+            if (len(rows) > MAX_REPLAY or archived_through > after
+                    or (oldest is not None and oldest > after + 1)):
+                conn.commit()
+                return None  # too far behind, or unread rows were archived
+            text = render_events(conn, rows) + render_summary(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        if not rows:
+            return text, after
+        with self._cond:
+            self.replays += 1
+        return text, rows[-1]["id"]
+
+    def stream(self, after=None):
+        """Generator of SSE text for one client, starting after log id `after`."""
+        self.start()
+        with self._cond:
+            self.subscribers += 1
+            epoch = self.epoch
+        try:
+            yield f"retry: {int(POLL_INTERVAL * 3000)}\n\n"
+            last = self.last_id if after is None else after
+            # catch up from SQLite (and send a fresh summary) before tailing the buffer
+            replay = self._replay(last)
+            if replay is None:
+                with self._cond:
+                    self.resets += 1
+                yield _message("reset", {"after": last})
+                return
+            text, last = replay
+            yield text
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self.last_id > last or self.epoch != epoch, timeout=HEARTBEAT)
+                    rewound = self.epoch != epoch
+                    if rewound:
+                        self.resets += 1
+                    start = self.buffer[0][0] if self.buffer else self.last_id
+                    chunks = [c for c in self.buffer if c[1] > last]
+                if rewound:
+                    yield _message("reset", {"after": last})
+                    return
+                if last < start:
+                    replay = self._replay(last)  # fell behind the ring buffer
+                    if replay is None:
+                        with self._cond:
+                            self.resets += 1
+                        yield _message("reset", {"after": last})
+                        return
+                    text, last = replay
+                    yield text
+                elif chunks:
+                    last = chunks[-1][1]
+                    yield "".join(c[2] for c in chunks)
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "subscribers": self.subscribers,
+                "last_id": self.last_id,
+                "buffered_ticks": len(self.buffer),
+                "ticks": self.ticks,
+                "replays": self.replays,
+                "resets": self.resets,
+            }
+
+change_feed = ChangeFeed()
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+from database.writer import writer
+from .batches import today_day
+
+# First-expiry-first-out: dated, unexpired batches in expiry order via
+# idx_batch_medicine_expiry_day (medicine_id, expiry_day), then undated ones.
+FEFO_SQL = """
+    SELECT id, batch_no, quantity, expiry_date FROM batches
+    WHERE medicine_id = ? AND expiry_day >= ? AND quantity > 0
+    ORDER BY expiry_day, id
+"""
+UNDATED_SQL = """
+    SELECT id, batch_no, quantity, expiry_date FROM batches
+    WHERE medicine_id = ? AND expiry_date IS NULL AND quantity > 0
+    ORDER BY id
+"""
+DEDUCT_SQL = "UPDATE batches SET quantity = quantity - ? WHERE id = ? AND quantity >= ?"
+
+class InsufficientStock(ValueError):
+    """Raised when a medicine has less dispensable stock than requested."""
+
+    def __init__(self, medicine_id, requested, available):
+        super().__init__(
+            f"Medicine {medicine_id}: requested {requested}, only {available} dispensable"
+        )
+        self.medicine_id = medicine_id
+        self.requested = requested
+        self.available = available
+
+def parse_lines(lines):
+    """Validate order lines into {medicine_id: total_quantity}, in first-seen order."""
+    totals = OrderedDict()
+    for line in lines:
+        try:
+            medicine_id = int(line["medicine_id"])
+            quantity = int(line["quantity"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Invalid order line: {line!r} (needs integer medicine_id and quantity)")
+        if quantity <= 0:
+            raise ValueError(f"Quantity must be positive: {line!r}")
+        totals[medicine_id] = totals.get(medicine_id, 0) + quantity
+    if not totals:
+        raise ValueError("Order has no lines")
+    return totals
+
+def _allocate(conn, medicine_id, quantity, today):
+    allocations, remaining = [], quantity
+    for sql, params in ((FEFO_SQL, (medicine_id, today)), (UNDATED_SQL, (medicine_id,))):
+        for batch in conn.execute(sql, params):
+            take = min(remaining, batch["quantity"])
+            allocations.append({
+                "medicine_id": medicine_id,
+                "batch_id": batch["id"],
+                "batch_no": batch["batch_no"],
+                "expiry_date": batch["expiry_date"],
+                "quantity": take,
+            })
+            remaining -= take
+            if not remaining:
+                return allocations
+    raise InsufficientStock(medicine_id, quantity, quantity - remaining)
+
+def _dispense(conn, totals, today):
+    allocations = []
+    for medicine_id, quantity in totals.items():
+        allocations += _allocate(conn, medicine_id, quantity, today)
+    conn.executemany(
+        DEDUCT_SQL, [(a["quantity"], a["batch_id"], a["quantity"]) for a in allocations]
+    )
+    return allocations
+
+def dispense_order(lines, today=None):
+    """Deduct every line of an order FEFO-wise in one write transaction.
+
+    All lines succeed or none do. Expired batches (expiry_day before
+    `today`, a Julian day number) are never touched. Returns the
+    per-batch allocations; raises InsufficientStock or ValueError.
+    """
+    totals = parse_lines(lines)
+    today = today or today_day()
+    # the writer holds the write lock (BEGIN IMMEDIATE) from before the
+    # SELECTs until COMMIT, so no other dispenser can spend the same stock
+    return writer.run(_dispense, totals, today)
+
+def dispense(medicine_id, quantity, today=None):
+    return dispense_order([{"medicine_id": medicine_id, "quantity": quantity}], today)
@@ -0,0 +1,326 @@
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+from itertools import chain
+
+from database.retention import ARCHIVED_THROUGH_SQL
+
+from . import get_conn
+from .batches import JULIAN_OFFSET
+
+log = logging.getLogger(__name__)
+
+# In-process copy of every dated batch in parallel arrays, ordered like
+# SOON_TO_EXPIRE_SQL (expiry_day, medicine_id, id), so an expiry window
+# is two bisects and a slice. It follows writes by tailing activity_log
+# (every batch/medicine write is logged by trigger) whenever
+# data_generation moves; if it falls too far behind, or log rows it has
+# not read yet were archived (log_archive_mark passed its position),
+# it reports itself stale, callers fall back to SQLite and a rebuild
+# runs in the background.
+#
+# day_of maps batch id to its expiry day, so a changed batch is found
+# with a bisect instead of a scan. Past BULK_APPLY changed batches, the
+# arrays are rebuilt once in a single merge pass instead of being
+# spliced row by row. Callers that already know data_generation (the
+# ETag read it) pass it in, and an unchanged index then costs no query.
+# Log rows are read without holding the lock; it is taken only to apply
+# them, so one slow catch-up does not stall readers of the arrays.
+MAX_CATCH_UP = int(os.environ.get("MEDIVAULT_EXPIRY_INDEX_CATCH_UP", 2000))
+BULK_APPLY = 64
+ID_CHUNK = 500
+NULL_QUANTITY = -(1 << 63)  # batches.quantity is nullable; array("q") is not
+
+BATCH_ROWS_SQL = "SELECT expiry_day, medicine_id, id, quantity, batch_no FROM batches"
+
+# what a catch-up read found: the applied state's generation and log
+# position, plus current rows for every batch/medicine touched since
+Changes = namedtuple("Changes", "generation last_log_id batch_ids batches medicine_ids names logged")
+
+@lru_cache(maxsize=4096)
+def iso_day(day):
+    return date.fromordinal(day - JULIAN_OFFSET).isoformat()
+
+def _sort_key(row):
+    return row[:3]  # (expiry_day, medicine_id, id)
+
+class ExpiryIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self.ready = False
+        self._reset()
+        self.rebuilds = 0
+        self.updates = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.build_seconds = None
+
+    def _reset(self):
+        self.days = array("i")
+        self.medicine_ids = array("i")
+        self.ids = array("q")
+        self.quantities = array("q")
+        self.batch_nos = []
+        self.day_of = {}
+        self.names = {}
+        self.generation = None
+        self.last_log_id = 0
+
+    @staticmethod
+    def _columns(rows):
+        days, medicine_ids, ids, quantities, batch_nos = array("i"), array("i"), array("q"), array("q"), []
+        for day, mid, bid, qty, batch_no in rows:
+            days.append(day)
+            medicine_ids.append(mid)
+            ids.append(bid)
+            quantities.append(NULL_QUANTITY if qty is None else qty)
+            batch_nos.append(batch_no)
+        return days, medicine_ids, ids, quantities, batch_nos
+
+    # -- building ---------------------------------------------------------
+    def build(self):
+        started = time.perf_counter()
+        conn = get_conn()
+        try:
+            conn.execute("BEGIN")  # one snapshot for the rows and the log position
+            (generation,) = conn.execute("SELECT generation FROM data_generation WHERE id = 1").fetchone()
+            (max_log_id,) = conn.execute("SELECT IFNULL(MAX(id), 0) FROM activity_log").fetchone()
+            (archived_through,) = conn.execute(ARCHIVED_THROUGH_SQL).fetchone()
+            names = dict(conn.execute("SELECT id, name FROM medicines").fetchall())
+            cur = conn.execute(BATCH_ROWS_SQL + """
+                WHERE expiry_day IS NOT NULL
+                ORDER BY expiry_day, medicine_id, id
+            """)
+            days, medicine_ids, ids, quantities, batch_nos = self._columns(
+                chain.from_iterable(iter(lambda: cur.fetchmany(5000), [])))
+            conn.commit()
+        finally:
+            conn.close()
+
+        day_of = dict(zip(ids, days))
+        with self._lock:
+            self.days, self.medicine_ids, self.ids, self.quantities = days, medicine_ids, ids, quantities
+            self.batch_nos, self.day_of, self.names = batch_nos, day_of, names
+            # an emptied log still counts as read up to what was archived
+            self.generation, self.last_log_id = generation, max(max_log_id, archived_through)
+            self.ready = True
+            self.rebuilds += 1
+            self.build_seconds = round(time.perf_counter() - started, 3)
+
+    def rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self.ready = False
+
+        def run():
+            try:
+                self.build()
+            except Exception:  # stay on the SQLite fallback; next stale read retries
+                log.exception("expiry index rebuild failed")
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=run, name="expiry-index", daemon=True).start()
+
+    # -- incremental maintenance ------------------------------------------
+    def _position(self, day, mid, bid):
+        """Index of (day, mid, bid) in sort order: a bisect within that day's run."""
+        lo, hi = bisect_left(self.days, day), bisect_right(self.days, day)
+        while lo < hi:
+            k = (lo + hi) // 2
+            if (self.medicine_ids[k], self.ids[k]) < (mid, bid):
+                lo = k + 1
+            else:
+                hi = k
+        return lo
+
+    def _remove(self, bid):
+        day = self.day_of.pop(bid, None)
+        if day is None:
+            return
+        for i in range(bisect_left(self.days, day), bisect_right(self.days, day)):
+            if self.ids[i] == bid:
+                for column in (self.days, self.medicine_ids, self.ids, self.quantities, self.batch_nos):
+                    del column[i]
+                return
+
+    def _insert(self, day, mid, bid, qty, batch_no):
+        i = self._position(day, mid, bid)
+        self.days.insert(i, day)
+        self.medicine_ids.insert(i, mid)
+        self.ids.insert(i, bid)
+        self.quantities.insert(i, NULL_QUANTITY if qty is None else qty)
+        self.batch_nos.insert(i, batch_no)
+        self.day_of[bid] = day
+
+    def _merge(self, removed, rows):
+        """Drop the `removed` batch ids and add `rows` in one pass over the arrays."""
+        kept = (
+            (self.days[k], self.medicine_ids[k], self.ids[k], self.quantities[k], self.batch_nos[k])
+            for k in range(len(self.ids)) if self.ids[k] not in removed
+        )
+        added = sorted(
+            ((day, mid, bid, NULL_QUANTITY if qty is None else qty, batch_no)
+             for day, mid, bid, qty, batch_no in rows),
+            key=_sort_key,
+        )
+        merged = heapq.merge(kept, added, key=_sort_key)
+        days, medicine_ids, ids, quantities, batch_nos = array("i"), array("i"), array("q"), array("q"), []
+        for day, mid, bid, qty, batch_no in merged:
+            days.append(day)
+            medicine_ids.append(mid)
+            ids.append(bid)
+            quantities.append(qty)
+            batch_nos.append(batch_no)
+        self.days, self.medicine_ids, self.ids, self.quantities, self.batch_nos = (
+            days, medicine_ids, ids, quantities, batch_nos)
+        for bid in removed:
+            self.day_of.pop(bid, None)
+        self.day_of.update((row[2], row[0]) for row in added)
+
+    def _read_changes(self, since, known_generation):
+        """Read writes logged after `since` from SQLite (no lock held).
+
+        Returns Changes, or None when a rebuild is needed: too many
+        changes, or log rows past `since` may have been archived.
+        """
+        conn = get_conn()
+        try:
+            conn.execute("BEGIN")
+            (generation,) = conn.execute("SELECT generation FROM data_generation WHERE id = 1").fetchone()
+            if generation == known_generation:
+                conn.commit()
+                return Changes(generation, since, [], [], [], {}, 0)
+            (archived_through,) = conn.execute(ARCHIVED_THROUGH_SQL).fetchone()
+            (oldest, max_log_id) = conn.execute("SELECT MIN(id), IFNULL(MAX(id), 0) FROM activity_log").fetchone()
+            if archived_through > since or (oldest is not None and oldest > since + 1):
+                conn.commit()
+                return None  # unread rows were archived
+            changes = conn.execute("""
+                SELECT id, table_name, record_id FROM activity_log
+                WHERE id > ? AND table_name IN ('batches', 'medicines')
+                ORDER BY id LIMIT ?
+            """, (since, MAX_CATCH_UP + 1)).fetchall()
+            if len(changes) > MAX_CATCH_UP:
+                conn.commit()
+                return None
+
+            batch_ids = list({r[2] for r in changes if r[1] == "batches" and r[2] is not None})
+            medicine_ids = list({r[2] for r in changes if r[1] == "medicines" and r[2] is not None})
+            batches, names = [], {}
+            for start in range(0, len(batch_ids), ID_CHUNK):
+                chunk = batch_ids[start:start + ID_CHUNK]
+                batches += conn.execute(BATCH_ROWS_SQL + f"""
+                    WHERE id IN ({','.join('?' * len(chunk))}) AND expiry_day IS NOT NULL
+                """, chunk).fetchall()
+            missing = list(set(medicine_ids) | {b[1] for b in batches if b[1] not in self.names})
+            for start in range(0, len(missing), ID_CHUNK):
+                chunk = missing[start:start + ID_CHUNK]
+                names.update(conn.execute(
+                    f"SELECT id, name FROM medicines WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+            conn.commit()
+        finally:
+            conn.close()
+        return Changes(generation, max(since, max_log_id), batch_ids, batches, medicine_ids, names, len(changes))
+
+    def _apply(self, changes):
+        """Apply a read under the lock. Reads overlap, so anything already
+        covered by a newer apply (or a rebuild) is skipped; a read that
+        started earlier but finished later re-applies current rows, which
+        is harmless."""
+        if changes.last_log_id <= self.last_log_id:
+            return
+        if len(changes.batch_ids) > BULK_APPLY:
+            self._merge(set(changes.batch_ids), changes.batches)
+        else:
+            for bid in changes.batch_ids:
+                self._remove(bid)
+            for row in changes.batches:
+                self._insert(*row)
+        for mid in changes.medicine_ids:
+            self.names.pop(mid, None)
+        self.names.update(changes.names)
+        self.generation, self.last_log_id = changes.generation, changes.last_log_id
+        self.updates += changes.logged
+
+    # -- queries ----------------------------------------------------------
+    def upcoming(self, first_day, last_day, generation=None):
+        """Batches with first_day <= expiry_day <= last_day, or None when stale.
+
+        Rows match UPCOMING_SQL, in the same order. Pass the current
+        data_generation if the caller has it; otherwise it is read from
+        SQLite.
+        """
+        with self._lock:
+            if not self.ready:
+                self.fallbacks += 1
+                return None
+            current = generation is not None and generation == self.generation
+            since, known_generation = self.last_log_id, self.generation
+
+        if not current:
+            changes = self._read_changes(since, known_generation)
+            with self._lock:
+                if changes is not None:
+                    self._apply(changes)
+                elif self.last_log_id == since:  # nobody caught up or rebuilt meanwhile
+                    self.ready = False
+
+        with self._lock:
+            if not self.ready:
+                self.fallbacks += 1
+                rows = None
+            else:
+                i, j = bisect_left(self.days, first_day), bisect_right(self.days, last_day)
+                names = self.names
+                rows = [
+                    {
+                        "id": self.ids[k],
+                        "medicine_name": names.get(self.medicine_ids[k]),
+                        "batch_no": self.batch_nos[k],
+                        "quantity": None if self.quantities[k] == NULL_QUANTITY else self.quantities[k],
+                        "expiry_date": iso_day(self.days[k]),
+                    }
+                    for k in range(i, j)
+                ]
+                self.hits += 1
+        if rows is None:
+            self.rebuild_in_background()
+        return rows
+
+    def memory_bytes(self):
+        arrays = sum(a.buffer_info()[1] * a.itemsize for a in (self.days, self.medicine_ids, self.ids, self.quantities))
+        strings = sys.getsizeof(self.batch_nos) + sum(sys.getsizeof(s) for s in self.batch_nos if s is not None)
+        names = sys.getsizeof(self.names) + sum(sys.getsizeof(s) for s in self.names.values())
+        day_of = sys.getsizeof(self.day_of)
+        return {"arrays": arrays, "batch_nos": strings, "medicine_names": names, "day_of": day_of,
+                "total": arrays + strings + names + day_of}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "entries": len(self.days),
+                "generation": self.generation,
+                "last_log_id": self.last_log_id,
+                "memory_bytes": self.memory_bytes(),
+                "build_seconds": self.build_seconds,
+                "rebuilds": self.rebuilds,
+                "updates": self.updates,
+                "hits": self.hits,
+                "fallbacks": self.fallbacks,
+            }
+
+expiry_index = ExpiryIndex()
@@ -0,0 +1,151 @@
+import json
+
+from . import get_conn, encode_cursor, decode_cursor
+from .batches import today_day
+
+# Expiry windows for integrations: each window is a range on the indexed
+# batches.expiry_day plus optional filters, read in (expiry_day, id)
+# order so a page can resume from the last row it returned. A batch of
+# windows runs on one pooled connection inside one read transaction (one
+# consistent snapshot) and is streamed as NDJSON, fetchmany() at a time.
+MAX_WINDOWS = 20
+MAX_MEDICINE_IDS = 500
+FETCH_SIZE = 500
+
+WINDOW_SQL = """
+    SELECT b.id, b.medicine_id, m.name AS medicine_name, m.category_id,
+           b.batch_no, b.quantity, b.expiry_date, b.expiry_day
+    FROM batches b
+    JOIN medicines m ON m.id = b.medicine_id
+    WHERE b.expiry_day BETWEEN ? AND ? {filters}
+    ORDER BY b.expiry_day, b.id
+    {limit}
+"""
+COLUMNS = ("id", "medicine_id", "medicine_name", "category_id", "batch_no", "quantity", "expiry_date")
+
+def _int(value, field, minimum=None):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer, got {value!r}")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{field} must be >= {minimum}")
+    return value
+
+def parse_window(spec, position=0):
+    """Validate one window spec (dict) into a normalized dict; raises ValueError."""
+    if not isinstance(spec, dict):
+        raise ValueError(f"window {position} must be an object")
+    window = {
+        "name": str(spec.get("name") or position),
+        "days": _int(spec.get("days", 30), "days", 0),
+        "include_expired": bool(spec.get("include_expired", False)),
+        "category_id": None,
+        "medicine_ids": None,
+        "min_quantity": None,
+        "limit": None,
+        "after": spec.get("after") or None,
+    }
+    if spec.get("category_id") is not None:
+        window["category_id"] = _int(spec["category_id"], "category_id")
+    if spec.get("medicine_ids") is not None:
+        ids = spec["medicine_ids"]
+        if not isinstance(ids, list) or not ids or len(ids) > MAX_MEDICINE_IDS:
+            raise ValueError(f"medicine_ids must be a list of 1..{MAX_MEDICINE_IDS} ids")
+        window["medicine_ids"] = [_int(i, "medicine_ids") for i in ids]
+    if spec.get("min_quantity") is not None:
+        window["min_quantity"] = _int(spec["min_quantity"], "min_quantity")
+    if spec.get("limit") is not None:
+        window["limit"] = _int(spec["limit"], "limit", 1)
+    if window["after"] is not None:
+        day, bid = decode_cursor(window["after"])
+        window["after"] = (_int(day, "cursor"), _int(bid, "cursor"))
+    return window
+
+def parse_windows(payload):
+    windows = payload.get("windows") if isinstance(payload, dict) else None
+    if not isinstance(windows, list) or not windows:
+        raise ValueError("body must be {\"windows\": [...]} with at least one window")
+    if len(windows) > MAX_WINDOWS:
+        raise ValueError(f"at most {MAX_WINDOWS} windows per request")
+    parsed = [parse_window(spec, i) for i, spec in enumerate(windows)]
+    names = [w["name"] for w in parsed]
+    if len(set(names)) != len(names):
+        raise ValueError("window names must be unique")
+    return parsed
+
+def query_window(conn, window, today, fetch_extra=0):
+    """Execute one window; returns the cursor (rows in expiry_day, id order)."""
+    lower = 0 if window["include_expired"] else today
+    params = [lower, today + window["days"]]
+    filters = []
+    if window["category_id"] is not None:
+        filters.append("AND m.category_id = ?"); params.append(window["category_id"])
+    if window["medicine_ids"]:
+        filters.append(f"AND b.medicine_id IN ({','.join('?' * len(window['medicine_ids']))})")
+        params += window["medicine_ids"]
+    if window["min_quantity"] is not None:
+        filters.append("AND b.quantity >= ?"); params.append(window["min_quantity"])
+    if window["after"] is not None:
+        filters.append("AND (b.expiry_day, b.id) > (?, ?)"); params += list(window["after"])
+    limit = ""
+    if window["limit"] is not None:
+        limit = "LIMIT ?"; params.append(window["limit"] + fetch_extra)
+    return conn.execute(WINDOW_SQL.format(filters=" ".join(filters), limit=limit), params)
+
+def _cursor_for(row):
+    return encode_cursor(row["expiry_day"], row["id"])
+
+def get_window_page(days=30, limit=100, after=None, **filters):
+    """Keyset page of one window; returns (rows as dicts, next_cursor)."""
+    window = parse_window(dict(filters, days=days, limit=limit, after=after))
+    conn = get_conn()
+    try:
+        rows = query_window(conn, window, today_day(), fetch_extra=1).fetchall()
+    finally:
+        conn.close()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _cursor_for(rows[-1])
+    return [{col: r[col] for col in COLUMNS} for r in rows], next_cursor
+
+def stream_windows(windows, fetch_size=FETCH_SIZE):
+    """NDJSON chunks for already-parsed windows, one connection + snapshot.
+
+    Each row line carries its window's name. After a window's rows comes
+    {"window", "end": true, "rows", "next_cursor"}; next_cursor resumes a
+    window that stopped at its limit.
+    """
+    today = today_day()
+    conn = get_conn()
+    try:
+        conn.execute("BEGIN")
+        for window in windows:
+            name = window["name"]
+            cur = query_window(conn, window, today, fetch_extra=1)
+            count, last, more = 0, None, False
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                lines = []
+                for r in rows:
+                    if window["limit"] is not None and count == window["limit"]:
+                        more = True
+                        break
+                    item = {"window": name}
+                    item.update((col, r[col]) for col in COLUMNS)
+                    lines.append(json.dumps(item, separators=(",", ":")))
+                    count, last = count + 1, r
+                if lines:
+                    yield "\n".join(lines) + "\n"
+                if more:
+                    break
+            cur.close()
+            end = {"window": name, "end": True, "rows": count,
+                   "next_cursor": _cursor_for(last) if more else None}
+            yield json.dumps(end, separators=(",", ":")) + "\n"
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,251 @@
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from database.connection import ConnectionPool
+from database.setup import DB_PATH
+from .batches import EXPIRED_SQL, EXPIRY_TIMELINE_SQL, SOON_TO_EXPIRE_SQL, COUNT_EXPIRING_SQL, today_day
+from .categories import CATEGORY_DISTRIBUTION_SQL
+from .medicines import HEADLINE_STATS_SQL
+from .search import SEARCH_SQL, search_clause
+
+# --------------------------------------------------------
+# Multi-site federation
+# --------------------------------------------------------
+# One database per clinic, registered by name (MEDIVAULT_SITES=
+# "north=/data/north.db,south=/data/south.db"; defaults to this app's own
+# database as "local"). A federated query runs the same SQL on every site
+# on a shared thread pool, each site through its own small connection
+# pool. A site that misses the deadline has its statement interrupted and
+# is reported as "timeout"; one that fails is reported as "error". The
+# others still answer, and the result is marked partial. Rows are tagged
+# with their site. Lists that are already sorted per site are combined
+# with a lazy k-way merge instead of being re-sorted.
+#
+# Sites are opened read-only (mode=ro, no journal_mode pragma): a
+# federated query never changes another clinic's file. Search results
+# are merged on each site's own bm25 rank. Those scores depend on each
+# database's term statistics, so the order across sites is approximate;
+# within a site it is exact.
+TIMEOUT = float(os.environ.get("MEDIVAULT_FEDERATION_TIMEOUT", 5))
+WORKERS = int(os.environ.get("MEDIVAULT_FEDERATION_WORKERS", 8))
+SITE_POOL_SIZE = int(os.environ.get("MEDIVAULT_FEDERATION_POOL_SIZE", 2))
+
+SiteResult = namedtuple("SiteResult", "site status rows error ms")
+
+def parse_sites(spec):
+    """'name=path,name=path' -> OrderedDict of site name to database path."""
+    sites = OrderedDict()
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, sep, path = part.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"Invalid site {part!r} (expected name=path)")
+        sites[name.strip()] = path.strip()
+    return sites
+
+class _Call:
+    """One site's query in flight; lets the caller interrupt it on timeout."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.cancelled = False
+
+    def interrupt(self):
+        with self.lock:
+            self.cancelled = True
+            if self.conn is not None:
+                self.conn.interrupt()
+
+class Federation:
+    def __init__(self, sites=None, timeout=TIMEOUT, workers=WORKERS):
+        self.timeout = timeout
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self.sites = OrderedDict()
+        for name, path in (sites or {}).items():
+            self.register(name, path)
+
+    def register(self, name, path):
+        site_pool = ConnectionPool(path, read_only=True, pool_size=SITE_POOL_SIZE, pool_timeout=self.timeout)
+        with self._lock:
+            old = self.sites.pop(name, None)
+            self.sites[name] = site_pool
+        if old is not None:
+            old.clear()
+
+    def unregister(self, name):
+        with self._lock:
+            site_pool = self.sites.pop(name)
+        site_pool.clear()
+
+    def _pool_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="federation")
+            return self._executor
+
+    def _run_site(self, name, site_pool, job, call):
+        started = time.perf_counter()
+        if not os.path.exists(site_pool.path):
+            # sqlite3.connect would quietly create an empty database
+            raise FileNotFoundError(f"no database at {site_pool.path}")
+        conn = site_pool.acquire()
+        try:
+            with call.lock:
+                if call.cancelled:
+                    raise TimeoutError
+                call.conn = conn
+            rows = job(conn)
+        finally:
+            with call.lock:
+                call.conn = None
+            conn.close()
+        for row in rows:
+            row["site"] = name
+        return rows, round((time.perf_counter() - started) * 1000, 2)
+
+    def fan_out(self, job, sites=None, timeout=None):
+        """Run job(conn) -> list of dicts on every site; SiteResults in registration order."""
+        with self._lock:
+            targets = [(name, p) for name, p in self.sites.items() if sites is None or name in sites]
+        unknown = set(sites or ()) - {name for name, _ in targets}
+        executor = self._pool_executor()
+        calls = {}
+        for name, site_pool in targets:
+            call = _Call()
+            calls[name] = (call, executor.submit(self._run_site, name, site_pool, job, call))
+        wait([f for _, f in calls.values()], timeout=self.timeout if timeout is None else timeout)
+
+        results = [SiteResult(name, "error", [], "unknown site", None) for name in sorted(unknown)]
+        for name, (call, future) in calls.items():
+            if not future.done():
+                call.interrupt()
+                future.cancel()
+                results.append(SiteResult(name, "timeout", [], "no answer before the deadline", None))
+                continue
+            try:
+                rows, ms = future.result()
+            except Exception as exc:
+                results.append(SiteResult(name, "error", [], str(exc) or type(exc).__name__, None))
+            else:
+                results.append(SiteResult(name, "ok", rows, None, ms))
+        return results
+
+    # -- federated queries ------------------------------------------------
+    def soon_to_expire(self, days=30, **options):
+        today = today_day()
+        return self._merged(_query(SOON_TO_EXPIRE_SQL, (today, today + days)), "expiry_day", **options)
+
+    def get_expired(self, **options):
+        return self._merged(_query(EXPIRED_SQL, (today_day(),)), "expiry_day", **options)
+
+    def search(self, query, limit=20, **options):
+        """Top `limit` matches across sites; cross-site order is by per-site bm25, so approximate."""
+        where, params = search_clause(query)
+        report = self._merged(_query(SEARCH_SQL.format(where=where), params + [limit]), "rank", **options)
+        report["results"] = report["results"][:limit]
+        return report
+
+    def get_expiry_timeline(self, **options):
+        results = self.fan_out(_query(EXPIRY_TIMELINE_SQL), **options)
+        return _report(results, _sum_months(r.rows for r in results))
+
+    def dashboard(self, **options):
+        results = self.fan_out(_dashboard, **options)
+        totals = {"medicines": 0, "batches": 0, "quantity": 0, "expired_items": 0, "soon_expire": 0}
+        categories = {}
+        timelines = []
+        by_site = {}
+        for r in results:
+            if r.status != "ok":
+                continue
+            site = r.rows[0]
+            for key in totals:
+                totals[key] += site[key] or 0
+            for label, count in site["categories"]:
+                categories[label] = categories.get(label, 0) + count
+            timelines.append(site["timeline"])
+            by_site[r.site] = {key: site[key] for key in totals}
+        report = _report(results, None)
+        del report["results"]
+        report.update(
+            totals=totals,
+            categories=dict(sorted(categories.items())),
+            timeline=_sum_months(timelines),
+            by_site=by_site,
+        )
+        return report
+
+    def _merged(self, job, key, **options):
+        results = self.fan_out(job, **options)
+        # each site's rows are already in key order
+        return _report(results, list(heapq.merge(*(r.rows for r in results), key=lambda row: _nulls_last(row[key]))))
+
+    def stats(self):
+        with self._lock:
+            return {name: {"path": p.path, **p.stats()} for name, p in self.sites.items()}
+
+def _nulls_last(value):
+    return (value is None, value or 0)
+
+def _sum_months(timelines):
+    totals = OrderedDict()
+    for row in heapq.merge(*timelines, key=lambda row: row["month"]):
+        totals[row["month"]] = totals.get(row["month"], 0) + (row["total"] or 0)
+    return [{"month": month, "total": total} for month, total in totals.items()]
+
+def _query(sql, params=()):
+    def job(conn):
+        return [dict(row) for row in conn.execute(sql, params)]
+    return job
+
+def _dashboard(conn):
+    row = conn.execute(HEADLINE_STATS_SQL).fetchone()
+    site = dict(row) if row is not None else {"medicines": 0, "batches": 0, "quantity": 0, "expired_items": 0}
+    today = today_day()
+    (site["soon_expire"],) = conn.execute(COUNT_EXPIRING_SQL, (today, today + 30)).fetchone()
+    site["categories"] = [(r["label"] or "Uncategorized", r["count"]) for r in conn.execute(CATEGORY_DISTRIBUTION_SQL)]
+    site["timeline"] = [dict(r) for r in conn.execute(EXPIRY_TIMELINE_SQL)]
+    return [site]
+
+def _report(results, rows):
+    return {
+        "partial": any(r.status != "ok" for r in results),
+        "sites": [
+            {"site": r.site, "status": r.status, "rows": len(r.rows), "ms": r.ms, "error": r.error}
+            for r in results
+        ],
+        "results": rows,
+    }
+
+federation = Federation(parse_sites(os.environ.get("MEDIVAULT_SITES") or f"local={DB_PATH}"))
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Query many Medi-Vault site databases at once")
+    parser.add_argument("query", choices=("upcoming", "expired", "timeline", "dashboard", "search"))
+    parser.add_argument("--site", action="append", default=[], metavar="NAME=PATH",
+                        help="site database (repeatable; default: MEDIVAULT_SITES or this app's database)")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("-q", "--text", default="", help="search text")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="per-site deadline in seconds")
+    args = parser.parse_args()
+
+    if args.site:
+        federation = Federation(parse_sites(",".join(args.site)))
+    options = {"timeout": args.timeout}
+    report = {
+        "upcoming": lambda: federation.soon_to_expire(args.days, **options),
+        "expired": lambda: federation.get_expired(**options),
+        "timeline": lambda: federation.get_expiry_timeline(**options),
+        "dashboard": lambda: federation.dashboard(**options),
+        "search": lambda: federation.search(args.text, **options),
+    }[args.query]()
+    print(json.dumps(report, indent=2, default=str))
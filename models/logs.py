@@ -1,28 +1,152 @@
-from . import get_conn
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from database.retention import archive_sources
+from . import get_conn, encode_cursor, decode_cursor
+
+LOG_PAGE_SIZE = 100
+LOG_COLUMNS = ("id", "timestamp", "action", "table_name", "record_id", "details")
+
+# Hot rows live in main.activity_log, older ones in archive.activity_log
+# once retention has run. Each query runs against every source (each
+# index-backed and already sorted) and the streams are merged newest-first.
+def _newest_first(row):
+    return (row["timestamp"] or "", row["id"])
+
+def _merged(conn, sql, params, key=_newest_first, limit=None, chunk_size=1000):
+    """Run `sql` (with {src} as the table) on every source and merge the results."""
+    def rows_from(src):
+        cur = conn.cursor()
+        cur.execute(sql.format(src=f"{src}.activity_log"), params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+    sources = archive_sources(conn)
+    if len(sources) == 1:
+        merged = rows_from(sources[0])
+    else:
+        merged = heapq.merge(*(rows_from(src) for src in sources), key=key, reverse=True)
+    return merged if limit is None else islice(merged, limit)
 
 def get_logs(limit=200):
     conn = get_conn()
-    cur = conn.cursor()
     if limit is None:
-        cur.execute("SELECT * FROM activity_log ORDER BY timestamp DESC")
+        data = list(_merged(conn, "SELECT * FROM {src} ORDER BY timestamp DESC, id DESC", []))
     else:
-        cur.execute("SELECT * FROM activity_log ORDER BY timestamp DESC LIMIT ?", (limit,))
-    data = cur.fetchall()
+        data = list(_merged(conn, "SELECT * FROM {src} ORDER BY timestamp DESC, id DESC LIMIT ?",
+                            [limit], limit=limit))
     conn.close()
     return data
 
 def get_logs_by_table(table):
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM activity_log WHERE table_name=? ORDER BY timestamp DESC", (table,))
-    data = cur.fetchall()
+    data = list(_merged(conn, "SELECT * FROM {src} WHERE table_name=? ORDER BY timestamp DESC, id DESC", [table]))
     conn.close()
     return data
 
 def get_logs_by_action(action):
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM activity_log WHERE action=? ORDER BY timestamp DESC", (action,))
-    data = cur.fetchall()
+    data = list(_merged(conn, "SELECT * FROM {src} WHERE action=? ORDER BY timestamp DESC, id DESC", [action]))
     conn.close()
     return data
+
+def _timestamp_bound(value, end_of_day=False):
+    """Validate a since/until filter and return it in activity_log format."""
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    if end_of_day and len(value.strip()) == 10:
+        return parsed.strftime("%Y-%m-%d 23:59:59")
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+def log_filters(since=None, until=None, table=None, action=None):
+    """WHERE conditions + params for the shared activity_log filters."""
+    clauses, params = [], []
+    if since:
+        clauses.append("timestamp >= ?"); params.append(_timestamp_bound(since))
+    if until:
+        clauses.append("timestamp <= ?"); params.append(_timestamp_bound(until, end_of_day=True))
+    if table:
+        clauses.append("table_name = ?"); params.append(table)
+    if action:
+        clauses.append("action = ?"); params.append(action.upper())
+    return clauses, params
+
+def _where(clauses):
+    return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+def _stream(sql, params, chunk_size):
+    conn = get_conn()
+    try:
+        yield from _merged(conn, sql, params, key=lambda r: r["id"], chunk_size=chunk_size)
+    finally:
+        conn.close()
+
+def iter_logs(since=None, until=None, table=None, action=None, chunk_size=1000):
+    """Stream matching log rows (hot + archived) newest-first, fetchmany() at a time.
+
+    Filters are validated up front (ValueError); memory stays bounded by
+    chunk_size, and the pooled connection is held until the generator is
+    exhausted or closed.
+    """
+    clauses, params = log_filters(since, until, table, action)
+    sql = f"SELECT {', '.join(LOG_COLUMNS)} FROM {{src}} {_where(clauses)} ORDER BY id DESC"
+    return _stream(sql, params, chunk_size)
+
+def get_logs_page(cursor=None, limit=LOG_PAGE_SIZE, table=None, action=None, since=None, until=None):
+    """Keyset page of log rows, newest first.
+
+    Pages seek on (timestamp, id) through idx_log_timestamp (or the
+    table/action composite index when filtered), so fetching page N costs
+    the same as page 1. Returns (rows, next_cursor).
+    """
+    clauses, params = log_filters(since, until, table, action)
+    if cursor:
+        after_ts, after_id = decode_cursor(cursor)
+        clauses.append("timestamp <= ? AND (timestamp < ? OR id < ?)")
+        params += [after_ts, after_ts, after_id]
+
+    conn = get_conn()
+    data = list(_merged(conn, f"""
+        SELECT {', '.join(LOG_COLUMNS)} FROM {{src}}
+        {_where(clauses)}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    """, params + [limit + 1], limit=limit + 1))
+    conn.close()
+
+    next_cursor = None
+    if len(data) > limit:
+        data = data[:limit]
+        next_cursor = encode_cursor(data[-1]["timestamp"], data[-1]["id"])
+    return data, next_cursor
+
+def _distinct(conn, cur, column):
+    # loose index scan: one index seek per distinct value instead of a full scan
+    values = set()
+    for src in archive_sources(conn):
+        cur.execute(f"""
+            WITH RECURSIVE v(val) AS (
+                SELECT MIN({column}) FROM {src}.activity_log
+                UNION ALL
+                SELECT (SELECT MIN({column}) FROM {src}.activity_log WHERE {column} > v.val)
+                FROM v WHERE v.val IS NOT NULL
+            )
+            SELECT val FROM v WHERE val IS NOT NULL
+        """)
+        values.update(r[0] for r in cur.fetchall())
+    return sorted(values)
+
+def get_log_facets():
+    """Distinct table names and actions, for filter drop-downs."""
+    conn = get_conn()
+    cur = conn.cursor()
+    tables = _distinct(conn, cur, "table_name")
+    actions = _distinct(conn, cur, "action")
+    conn.close()
+    return tables, actions
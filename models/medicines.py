@@ -1,14 +1,42 @@
-from . import get_conn
+from . import get_conn, encode_cursor, decode_cursor
+from .batches import SOON_DAYS, today_day
+from .unit_of_work import unit_of_work
+
+PAGE_SIZE = 24
+
+# Per-medicine totals, next expiry and status counts, aggregated in SQL.
+# {medicines} is a subquery yielding the (id, name, category_id) rows wanted.
+SUMMARY_QUERY = """
+    SELECT m.id, m.name, c.name AS category,
+           COUNT(b.id) AS batch_count,
+           COALESCE(SUM(b.quantity), 0) AS total_qty,
+           DATE(MIN(b.expiry_day) + 0.5) AS next_expiry,
+           COALESCE(SUM(b.expiry_day < :today), 0) AS expired_count,
+           COALESCE(SUM(b.expiry_day BETWEEN :today AND :soon), 0) AS soon_count,
+           COALESCE(SUM(b.expiry_day > :soon), 0) AS healthy_count,
+           COALESCE(SUM(b.id IS NOT NULL AND b.expiry_day IS NULL), 0) AS undated_count
+    FROM ({medicines}) m
+    LEFT JOIN categories c ON c.id = m.category_id
+    LEFT JOIN batches b ON b.medicine_id = m.id
+    GROUP BY m.id
+    ORDER BY m.name COLLATE NOCASE, m.id
+"""
+
+# trigger-maintained counters: one primary-key lookup instead of COUNT(*) scans
+HEADLINE_STATS_SQL = """
+    SELECT medicines, batches, quantity, expired_items
+    FROM inventory_summary
+    WHERE scope = 'total' AND scope_id = 0
+"""
 
 def create_medicine(name, category_id=None, description=""):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO medicines(name, category_id, description) VALUES (?, ?, ?)",
-                (name, category_id, description))
-    conn.commit()
-    mid = cur.lastrowid
-    conn.close()
-    return mid
+    with unit_of_work() as uow:
+        return uow.create_medicine(name, category_id, description)
+
+def create_medicines_many(medicines):
+    """Create medicines (and their optional batches) in one transaction; returns ids."""
+    with unit_of_work() as uow:
+        return uow.create_medicines_many(medicines)
 
 def get_all_medicines():
     conn = get_conn()
@@ -32,26 +60,80 @@ def get_medicine(mid):
     return data
 
 def update_medicine(mid, name=None, category_id=None, description=None):
+    with unit_of_work() as uow:
+        uow.update_medicine(mid, name, category_id, description)
+
+def delete_medicine(mid):
+    with unit_of_work() as uow:
+        uow.delete_medicine(mid)
+
+def _window():
+    today = today_day()
+    return {"today": today, "soon": today + SOON_DAYS}
+
+def get_medicine_page(cursor=None, limit=PAGE_SIZE):
+    """Keyset page of medicine summaries ordered by name (case-insensitive).
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    params = _window()
+    params["limit"] = limit + 1
+    keyset = ""
+    if cursor:
+        after_name, after_id = decode_cursor(cursor)
+        keyset = """WHERE name >= :after_name COLLATE NOCASE
+                    AND (name > :after_name COLLATE NOCASE OR id > :after_id)"""
+        params.update(after_name=after_name, after_id=after_id)
+
+    medicines = f"""
+        SELECT id, name, category_id FROM medicines
+        {keyset}
+        ORDER BY name COLLATE NOCASE, id
+        LIMIT :limit
+    """
     conn = get_conn()
     cur = conn.cursor()
-    fields = []
-    vals = []
-    if name is not None:
-        fields.append("name=?"); vals.append(name)
-    if category_id is not None:
-        fields.append("category_id=?"); vals.append(category_id)
-    if description is not None:
-        fields.append("description=?"); vals.append(description)
-    if not fields:
-        conn.close(); return
-    vals.append(mid)
-    cur.execute(f"UPDATE medicines SET {', '.join(fields)} WHERE id=?", vals)
-    conn.commit()
+    cur.execute(SUMMARY_QUERY.format(medicines=medicines), params)
+    rows = cur.fetchall()
     conn.close()
 
-def delete_medicine(mid):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["name"], rows[-1]["id"])
+    return rows, next_cursor
+
+def get_medicine_summaries(ids):
+    """Summaries for specific medicine ids, keyed by id."""
+    if not ids:
+        return {}
+    params = _window()
+    params.update((f"id{i}", mid) for i, mid in enumerate(ids))
+    placeholders = ", ".join(f":id{i}" for i in range(len(ids)))
+    medicines = f"SELECT id, name, category_id FROM medicines WHERE id IN ({placeholders})"
+    query = SUMMARY_QUERY.format(medicines=medicines)
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    conn.close()
+    return {r["id"]: r for r in rows}
+
+def get_batches_for_medicines(ids):
+    """All batches for a page of medicines in one query, grouped by medicine id."""
+    grouped = {mid: [] for mid in ids}
+    if not ids:
+        return grouped
+    placeholders = ", ".join("?" for _ in ids)
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("DELETE FROM medicines WHERE id=?", (mid,))
-    conn.commit()
+    cur.execute(f"""
+        SELECT id, medicine_id, batch_no, quantity, expiry_date
+        FROM batches
+        WHERE medicine_id IN ({placeholders})
+        ORDER BY medicine_id, expiry_day IS NULL, expiry_day, id
+    """, list(ids))
+    for r in cur.fetchall():
+        grouped[r["medicine_id"]].append(r)
     conn.close()
+    return grouped
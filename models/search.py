@@ -0,0 +1,36 @@
+from . import get_conn
+
+# trigram tokens need at least three characters to hit the index
+MIN_TERM_LENGTH = 3
+
+def build_match(query):
+    """Turn free text into an FTS5 MATCH expression, or None if too short."""
+    terms = query.split()
+    if not terms or any(len(t) < MIN_TERM_LENGTH for t in terms):
+        return None
+    return " ".join('"{}"'.format(t.replace('"', '""')) for t in terms)
+
+def search_clause(query):
+    """WHERE clause + params selecting matching medicine_search rows."""
+    match = build_match(query)
+    if match:
+        return "medicine_search MATCH ?", [match]
+    like = f"%{query.strip()}%"
+    return "(name LIKE ? OR batch_nos LIKE ?)", [like, like]
+
+SEARCH_SQL = """
+    SELECT rowid AS id, name, category, batch_nos, rank
+    FROM medicine_search
+    WHERE {where}
+    ORDER BY rank
+    LIMIT ?
+"""
+
+def search_medicines(query, limit=20):
+    where, params = search_clause(query)
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(SEARCH_SQL.format(where=where), params + [limit])
+    data = cur.fetchall()
+    conn.close()
+    return data
@@ -0,0 +1,164 @@
+import threading
+from contextlib import contextmanager
+
+from . import get_conn
+
+# One connection and one transaction shared by every model write made
+# inside `with unit_of_work() as uow:`. A medicine plus its batches is
+# one BEGIN IMMEDIATE ... COMMIT (one fsync) and nothing is kept if any
+# step fails. Statements are module constants so sqlite3's per-connection
+# statement cache prepares each one once and reuses it for every row.
+#
+# The unit of work is tracked per thread: the plain model functions
+# (create_medicine, add_batch, ...) join the active one instead of
+# committing on their own, and a nested unit_of_work() becomes a
+# SAVEPOINT that rolls back alone. UnitOfWork(conn) wraps a connection
+# whose transaction someone else owns, e.g. a write-queue job.
+INSERT_MEDICINE_SQL = "INSERT INTO medicines(name, category_id, description) VALUES (?, ?, ?)"
+DELETE_MEDICINE_SQL = "DELETE FROM medicines WHERE id=?"
+INSERT_BATCH_SQL = "INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, ?, ?, ?)"
+DELETE_BATCH_SQL = "DELETE FROM batches WHERE id=?"
+INSERT_CATEGORY_SQL = "INSERT INTO categories(name) VALUES(?)"
+UPDATE_CATEGORY_SQL = "UPDATE categories SET name=? WHERE id=?"
+DELETE_CATEGORY_SQL = "DELETE FROM categories WHERE id=?"
+
+_local = threading.local()
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+def current():
+    """The unit of work active on this thread, or None."""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+class UnitOfWork:
+    def __init__(self, conn=None):
+        self.conn = conn
+        self._owned = conn is None
+
+    def __enter__(self):
+        if self._owned:
+            self.conn = get_conn()
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+            except Exception:
+                self.conn.close()
+                raise
+        _stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _stack().remove(self)
+        if self._owned:
+            try:
+                if exc_type is None:
+                    self.conn.commit()
+                else:
+                    self.conn.rollback()
+            finally:
+                self.conn.close()
+                self.conn = None
+        return False
+
+    def execute(self, sql, parameters=()):
+        return self.conn.execute(sql, parameters)
+
+    # -- medicines --------------------------------------------------------
+    def create_medicine(self, name, category_id=None, description="", batches=()):
+        mid = self.conn.execute(INSERT_MEDICINE_SQL, (name, category_id, description)).lastrowid
+        if batches:
+            self.add_batches_many(dict(b, medicine_id=mid) for b in batches)
+        return mid
+
+    def create_medicines_many(self, medicines):
+        """Insert medicine dicts (name, category_id, description, optional
+        batches: [{batch_no, quantity, expiry_date}, ...]); returns their ids."""
+        return [
+            self.create_medicine(
+                m["name"], m.get("category_id"), m.get("description", ""), m.get("batches", ())
+            )
+            for m in medicines
+        ]
+
+    def update_medicine(self, mid, name=None, category_id=None, description=None):
+        fields = []
+        vals = []
+        if name is not None:
+            fields.append("name=?"); vals.append(name)
+        if category_id is not None:
+            fields.append("category_id=?"); vals.append(category_id)
+        if description is not None:
+            fields.append("description=?"); vals.append(description)
+        if not fields:
+            return 0
+        vals.append(mid)
+        return self.conn.execute(f"UPDATE medicines SET {', '.join(fields)} WHERE id=?", vals).rowcount
+
+    def delete_medicine(self, mid):
+        return self.conn.execute(DELETE_MEDICINE_SQL, (mid,)).rowcount
+
+    # -- batches ----------------------------------------------------------
+    def add_batch(self, medicine_id, batch_no, quantity, expiry_date):
+        return self.add_batches_many([{
+            "medicine_id": medicine_id, "batch_no": batch_no,
+            "quantity": quantity, "expiry_date": expiry_date,
+        }])[0]
+
+    def add_batches_many(self, batches):
+        """Insert batch dicts (medicine_id, batch_no, quantity, expiry_date); returns their ids.
+
+        Every expiry date is validated before the first insert.
+        """
+        from .batches import normalize_expiry
+
+        rows = [
+            (b["medicine_id"], b.get("batch_no"), b.get("quantity") or 0, normalize_expiry(b.get("expiry_date")))
+            for b in batches
+        ]
+        cur = self.conn.cursor()
+        ids = []
+        for row in rows:
+            cur.execute(INSERT_BATCH_SQL, row)
+            ids.append(cur.lastrowid)
+        return ids
+
+    def delete_batch(self, batch_id):
+        return self.delete_batches_many([batch_id])
+
+    def delete_batches_many(self, batch_ids):
+        """Delete batches by id; returns how many existed."""
+        return self.conn.executemany(DELETE_BATCH_SQL, [(bid,) for bid in batch_ids]).rowcount
+
+    # -- categories -------------------------------------------------------
+    def create_category(self, name):
+        return self.conn.execute(INSERT_CATEGORY_SQL, (name,)).lastrowid
+
+    def update_category(self, cat_id, new_name):
+        return self.conn.execute(UPDATE_CATEGORY_SQL, (new_name, cat_id)).rowcount
+
+    def delete_category(self, cat_id):
+        return self.conn.execute(DELETE_CATEGORY_SQL, (cat_id,)).rowcount
+
+@contextmanager
+def unit_of_work(conn=None):
+    """Share one connection + transaction across model writes.
+
+    Joins the unit of work already active on this thread as a SAVEPOINT;
+    otherwise commits on a clean exit and rolls back on an exception.
+    """
+    outer = current()
+    if conn is None and outer is not None:
+        outer.conn.execute("SAVEPOINT unit_of_work")
+        try:
+            yield outer
+        except BaseException:
+            outer.conn.execute("ROLLBACK TO unit_of_work")
+            outer.conn.execute("RELEASE unit_of_work")
+            raise
+        outer.conn.execute("RELEASE unit_of_work")
+        return
+    with UnitOfWork(conn) as uow:
+        yield uow
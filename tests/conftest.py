@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+import pytest
+
+# Point everything at a throwaway database before any module reads
+# MEDIVAULT_DB, so a test run never touches database.db.
+os.environ["MEDIVAULT_DB"] = os.path.join(tempfile.mkdtemp(prefix="medivault-tests-"), "medivault.db")
+os.environ.setdefault("MEDIVAULT_SWEEP_INTERVAL", "0")
+
+from database.connection import pool  # noqa: E402
+from database.setup import init_db  # noqa: E402
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A freshly migrated database that the shared connection pool (and so the models) use."""
+    path = tmp_path / "medivault.db"
+    init_db(path)
+    monkeypatch.setattr(pool, "path", str(path))
+    pool.clear()
+    yield path
+    pool.clear()
@@ -0,0 +1,75 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from models.batches import today_day
+from models.dispensing import InsufficientStock, dispense_order
+
+def _day(offset):
+    # UTC, like today_day()
+    return (datetime.utcnow().date() + timedelta(days=offset)).isoformat()
+
+@pytest.fixture
+def stock(db):
+    conn = sqlite3.connect(db)
+    mid = conn.execute("INSERT INTO medicines(name, description) VALUES ('Amoxicillin', '')").lastrowid
+    other = conn.execute("INSERT INTO medicines(name, description) VALUES ('Ibuprofen', '')").lastrowid
+    batches = {}
+    for batch_no, medicine_id, quantity, expiry in [
+        ("LATE", mid, 10, _day(90)),
+        ("EXPIRED", mid, 50, _day(-1)),
+        ("SOON", mid, 5, _day(10)),
+        ("UNDATED", mid, 7, None),
+        ("OTHER", other, 3, _day(20)),
+    ]:
+        batches[batch_no] = conn.execute(
+            "INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, ?, ?, ?)",
+            (medicine_id, batch_no, quantity, expiry),
+        ).lastrowid
+    conn.commit()
+    conn.close()
+    return {"db": db, "medicine": mid, "other": other, "batches": batches}
+
+def _quantities(db):
+    conn = sqlite3.connect(db)
+    try:
+        return dict(conn.execute("SELECT batch_no, quantity FROM batches"))
+    finally:
+        conn.close()
+
+def test_allocates_earliest_expiry_first_and_undated_last(stock):
+    allocations = dispense_order([{"medicine_id": stock["medicine"], "quantity": 18}], today_day())
+    assert [(a["batch_no"], a["quantity"]) for a in allocations] == [("SOON", 5), ("LATE", 10), ("UNDATED", 3)]
+    assert _quantities(stock["db"]) == {"LATE": 0, "EXPIRED": 50, "SOON": 0, "UNDATED": 4, "OTHER": 3}
+
+def test_never_dispenses_expired_batches(stock):
+    with pytest.raises(InsufficientStock) as exc:
+        dispense_order([{"medicine_id": stock["medicine"], "quantity": 23}], today_day())
+    assert exc.value.available == 22  # 5 + 10 + 7; the 50 expired units don't count
+
+def test_short_line_rolls_back_the_whole_order(stock):
+    before = _quantities(stock["db"])
+    with pytest.raises(InsufficientStock) as exc:
+        dispense_order([
+            {"medicine_id": stock["medicine"], "quantity": 4},
+            {"medicine_id": stock["other"], "quantity": 4},
+        ], today_day())
+    assert exc.value.medicine_id == stock["other"]
+    assert _quantities(stock["db"]) == before
+
+@pytest.mark.parametrize("body", ['"lines"', "5", "[1, 2]", "null", '{"lines": "x"}', '{"lines": [1]}'])
+def test_api_rejects_malformed_orders(stock, body):
+    from app import app
+
+    resp = app.test_client().post("/api/dispense", data=body, content_type="application/json")
+    assert resp.status_code == 400
+    assert "error" in resp.get_json()
+
+def test_api_reports_shortfall_as_conflict(stock):
+    from app import app
+
+    resp = app.test_client().post("/api/dispense", json={"medicine_id": stock["other"], "quantity": 4})
+    assert resp.status_code == 409
+    assert resp.get_json()["available"] == 3
+    assert _quantities(stock["db"])["OTHER"] == 3
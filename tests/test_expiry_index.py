@@ -0,0 +1,79 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from database.retention import archive_logs, parse_policy
+from models.batches import UPCOMING_SQL, today_day
+from models.expiry_index import BULK_APPLY, ExpiryIndex
+
+def _day(offset):
+    return (datetime.utcnow().date() + timedelta(days=offset)).isoformat()
+
+@pytest.fixture
+def conn(db):
+    conn = sqlite3.connect(db, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    mids = [conn.execute("INSERT INTO medicines(name) VALUES (?)", (name,)).lastrowid
+            for name in ("Zinc", "Aspirin", "Metformin")]
+    # ties on expiry_day across and within medicines, plus a NULL quantity
+    for i in range(12):
+        conn.execute(
+            "INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, ?, ?, ?)",
+            (mids[i % 3], f"B{i}", None if i == 4 else i, _day(5 + i % 2)),
+        )
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def index(conn, monkeypatch):
+    index = ExpiryIndex()
+    index.build()
+    rebuilds = []
+    monkeypatch.setattr(index, "rebuild_in_background", lambda: rebuilds.append(True))
+    index.rebuild_requests = rebuilds
+    return index
+
+def _sql(conn, days=30):
+    today = today_day()
+    return [dict(r) for r in conn.execute(UPCOMING_SQL, (today, today + days))]
+
+def _index(index, days=30):
+    today = today_day()
+    return index.upcoming(today, today + days)
+
+def test_matches_sql_after_build(conn, index):
+    assert _index(index) == _sql(conn)
+    assert any(r["quantity"] is None for r in _index(index))
+
+def test_matches_sql_after_row_by_row_changes(conn, index):
+    mid = conn.execute("SELECT id FROM medicines WHERE name = 'Aspirin'").fetchone()[0]
+    conn.execute("INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, 'NEW', NULL, ?)",
+                 (mid, _day(5)))
+    conn.execute("UPDATE batches SET quantity = 99, expiry_date = ? WHERE batch_no = 'B1'", (_day(6),))
+    conn.execute("DELETE FROM batches WHERE batch_no = 'B2'")
+    conn.execute("UPDATE medicines SET name = 'Aspirin 300' WHERE id = ?", (mid,))
+    assert _index(index) == _sql(conn)
+    assert index.rebuild_requests == []
+
+def test_matches_sql_after_bulk_merge(conn, index):
+    mid = conn.execute("SELECT id FROM medicines WHERE name = 'Zinc'").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, ?, ?, ?)",
+        [(mid, f"BULK{i}", None if i % 7 == 0 else i, _day(i % 3 + 5)) for i in range(BULK_APPLY + 10)],
+    )
+    assert _index(index) == _sql(conn)
+    assert index.rebuild_requests == []
+
+def test_goes_stale_when_unread_rows_are_archived(conn, index, db, tmp_path):
+    conn.execute("UPDATE batches SET quantity = 1 WHERE batch_no = 'B0'")
+    # only batch rows leave the hot window, so the log itself is not empty
+    conn.execute("UPDATE activity_log SET timestamp = '2000-01-01 00:00:00' WHERE table_name = 'batches'")
+    stats = archive_logs(parse_policy("90,batches=1"), path=db, archive_path=tmp_path / "archive.db")
+    assert stats["moved"] > 0
+    assert _index(index) is None
+    assert index.rebuild_requests == [True]
+
+    index.build()  # a rebuilt index counts archived rows as read
+    assert index.last_log_id >= conn.execute("SELECT archived_through FROM log_archive_mark").fetchone()[0]
+    assert _index(index) == _sql(conn)
@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+from database.setup import init_db
+from models.batches import EXPIRY_RANGE_QUERIES, check_expiry_plans
+
+# Every expiry range query must SEARCH batches through idx_batch_expiry_day.
+# A table scan here is the regression this guards against: it turns the
+# home page and /api/upcoming into O(batches) work.
+
+@pytest.fixture
+def conn(tmp_path):
+    path = tmp_path / "plans.db"
+    init_db(path)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO medicines(name, category_id, description) VALUES (?, NULL, '')",
+        [(f"Medicine {i}",) for i in range(50)],
+    )
+    conn.executemany(
+        "INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, ?, ?, ?)",
+        [(i % 50 + 1, f"B{i:05d}", i % 200, f"20{26 + i % 4}-{i % 12 + 1:02d}-{i % 28 + 1:02d}")
+         for i in range(2000)],
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    yield conn
+    conn.close()
+
+def test_every_expiry_query_is_checked(conn):
+    assert [name for name, _, _ in check_expiry_plans(conn)] == list(EXPIRY_RANGE_QUERIES)
+
+@pytest.mark.parametrize("name", list(EXPIRY_RANGE_QUERIES))
+def test_expiry_query_uses_expiry_day_index(conn, name):
+    plans = {n: (plan, uses_index) for n, plan, uses_index in check_expiry_plans(conn)}
+    plan, uses_index = plans[name]
+    assert uses_index, f"{name} does not use idx_batch_expiry_day: {' | '.join(plan)}"
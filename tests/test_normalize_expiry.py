@@ -0,0 +1,31 @@
+from datetime import date
+
+import pytest
+
+from models.batches import normalize_expiry
+
+@pytest.mark.parametrize("value, expected", [
+    ("2027-03-05", "2027-03-05"),
+    ("  2027-03-05 ", "2027-03-05"),
+    ("2027-03-05 00:00", "2027-03-05"),
+    ("2027-03-05T23:59:59", "2027-03-05"),
+    ("2027-03-05 08:30:00.123", "2027-03-05"),
+    (date(2027, 3, 5), "2027-03-05"),
+    (None, None),
+    ("   ", None),
+])
+def test_accepts_dates_with_an_optional_time(value, expected):
+    assert normalize_expiry(value) == expected
+
+@pytest.mark.parametrize("value", [
+    "2027-03-05garbage",
+    "2027-03-05 junk",
+    "2027-03-05T",
+    "2027-3-5",
+    "05/03/2027",
+    "2027-02-30",
+    20270305,
+])
+def test_rejects_anything_else(value):
+    with pytest.raises(ValueError, match="Invalid expiry date"):
+        normalize_expiry(value)
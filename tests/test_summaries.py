@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from database.setup import verify_expiry_rollup, verify_inventory_summary
+
+# inventory_summary (user-004) and expiry_month_rollup (user-012) are kept
+# up to date by triggers; after every kind of write they must match a
+# recompute from the base tables.
+
+@pytest.fixture
+def conn(db):
+    conn = sqlite3.connect(db, isolation_level=None)
+    conn.execute("PRAGMA foreign_keys = ON")
+    yield conn
+    conn.close()
+
+def _category(conn, name):
+    return conn.execute("SELECT id FROM categories WHERE name = ?", (name,)).fetchone()[0]
+
+def _add_medicine(conn, name, category_id=None):
+    return conn.execute("INSERT INTO medicines(name, category_id) VALUES (?, ?)", (name, category_id)).lastrowid
+
+def _add_batch(conn, medicine_id, quantity, expiry):
+    return conn.execute(
+        "INSERT INTO batches(medicine_id, batch_no, quantity, expiry_date) VALUES (?, 'B', ?, ?)",
+        (medicine_id, quantity, expiry),
+    ).lastrowid
+
+def _assert_consistent(conn):
+    assert verify_inventory_summary(conn) == []
+    assert verify_expiry_rollup(conn) == []
+
+@pytest.fixture
+def stock(conn):
+    tablet = _category(conn, "Tablet")
+    medicines = {
+        "tablet": _add_medicine(conn, "Paracetamol", tablet),
+        "loose": _add_medicine(conn, "Plasters"),
+    }
+    batches = {
+        "jan": _add_batch(conn, medicines["tablet"], 10, "2030-01-15"),
+        "jan2": _add_batch(conn, medicines["loose"], 4, "2030-01-20"),
+        "feb": _add_batch(conn, medicines["tablet"], None, "2030-02-01"),
+        "undated": _add_batch(conn, medicines["loose"], 7, None),
+    }
+    _assert_consistent(conn)
+    return {"medicines": medicines, "batches": batches, "tablet": tablet}
+
+def test_batch_quantity_and_expiry_updates(conn, stock):
+    conn.execute("UPDATE batches SET quantity = 25 WHERE id = ?", (stock["batches"]["jan"],))
+    conn.execute("UPDATE batches SET expiry_date = '2030-03-01' WHERE id = ?", (stock["batches"]["jan2"],))
+    conn.execute("UPDATE batches SET expiry_date = '2030-04-01' WHERE id = ?", (stock["batches"]["undated"],))
+    conn.execute("UPDATE batches SET expiry_date = NULL WHERE id = ?", (stock["batches"]["feb"],))
+    _assert_consistent(conn)
+
+def test_batch_moves_to_another_medicine(conn, stock):
+    conn.execute("UPDATE batches SET medicine_id = ? WHERE id = ?",
+                 (stock["medicines"]["loose"], stock["batches"]["jan"]))
+    _assert_consistent(conn)
+
+def test_batch_and_medicine_deletes(conn, stock):
+    conn.execute("DELETE FROM batches WHERE id = ?", (stock["batches"]["jan2"],))
+    _assert_consistent(conn)
+    conn.execute("DELETE FROM medicines WHERE id = ?", (stock["medicines"]["tablet"],))  # cascades to batches
+    _assert_consistent(conn)
+
+def test_category_changes(conn, stock):
+    syrup = _category(conn, "Syrup")
+    conn.execute("UPDATE medicines SET category_id = ? WHERE id = ?", (syrup, stock["medicines"]["loose"]))
+    _assert_consistent(conn)
+    conn.execute("UPDATE medicines SET category_id = NULL WHERE id = ?", (stock["medicines"]["tablet"],))
+    _assert_consistent(conn)
+    conn.execute("DELETE FROM categories WHERE id = ?", (syrup,))  # medicines fall back to uncategorized
+    _assert_consistent(conn)
+
+def test_emptied_uncategorized_row_is_not_drift(conn, stock):
+    # the last uncategorized medicine leaves an all-zero category 0 row behind
+    conn.execute("UPDATE medicines SET category_id = ? WHERE id = ?", (stock["tablet"], stock["medicines"]["loose"]))
+    assert conn.execute(
+        "SELECT medicines, batches, quantity FROM inventory_summary WHERE scope = 'category' AND scope_id = 0"
+    ).fetchone() == (0, 0, 0)
+    _assert_consistent(conn)
+
+def test_drift_is_reported(conn, stock):
+    conn.execute("UPDATE inventory_summary SET quantity = quantity + 1 WHERE scope = 'total'")
+    conn.execute("UPDATE expiry_month_rollup SET batches = batches + 1 WHERE month = '2030-01'")
+    assert verify_inventory_summary(conn)
+    assert verify_expiry_rollup(conn)